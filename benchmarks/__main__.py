@@ -0,0 +1,153 @@
+"""
+Benchmark the file-management stages and endpoints and compare the results with a baseline:
+
+    python -m benchmarks --rows 200000 --output results.json --baseline baseline.json
+
+The endpoint benchmarks create the app's tables in the database given by `--database-url`
+(by default the test database) and drop them afterwards, so it must be a throwaway database.
+"""
+import argparse
+import asyncio
+import json
+import os
+import shutil
+import sys
+import tempfile
+from typing import Any, Dict, List, Optional
+
+from benchmarks.data import DatasetSpec, generate_csv
+from benchmarks.report import DEFAULT_THRESHOLD, compare, environment, peak_rss_bytes
+
+LOAD_FILE_NAME = "benchmark-load.csv"
+
+
+def default_database_url() -> str:
+    from src.config import DB_HOST_TEST, DB_NAME_TEST, DB_PASS_TEST, DB_PORT_TEST, DB_USER_TEST
+
+    return f"postgresql+asyncpg://{DB_USER_TEST}:{DB_PASS_TEST}@{DB_HOST_TEST}:{DB_PORT_TEST}/{DB_NAME_TEST}"
+
+
+def parse_threshold(value: str) -> tuple:
+    metric, _, limit = value.partition("=")
+    try:
+        return metric, float(limit)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"Expected METRIC=FRACTION, got '{value}'")
+
+
+def parse_args(argv: Optional[List[str]]) -> argparse.Namespace:
+    parser = argparse.ArgumentParser(prog="python -m benchmarks", description=__doc__.split("\n\n")[0].strip())
+    parser.add_argument("--rows", type=int, default=DatasetSpec.rows)
+    parser.add_argument("--numeric-columns", type=int, default=DatasetSpec.numeric_columns)
+    parser.add_argument("--string-columns", type=int, default=DatasetSpec.string_columns)
+    parser.add_argument("--cardinality", type=int, default=DatasetSpec.cardinality)
+    parser.add_argument("--seed", type=int, default=DatasetSpec.seed)
+    parser.add_argument("--repeats", type=int, default=5, help="Runs of every stage benchmark.")
+    parser.add_argument("--concurrency", type=int, default=8, help="Concurrent clients of the load harness.")
+    parser.add_argument("--requests", type=int, default=200, help="Requests sent by the load harness.")
+    parser.add_argument("--uploads", type=int, default=3, help="Timed uploads of the dataset.")
+    parser.add_argument("--skip-endpoints", action="store_true", help="Only run the stage benchmarks.")
+    parser.add_argument("--database-url", default=None, help="Throwaway database for the endpoint benchmarks.")
+    parser.add_argument("--output", help="Write the results here instead of to stdout.")
+    parser.add_argument("--baseline", help="Compare with the results in this file.")
+    parser.add_argument("--save-baseline", help="Also write the results here, to serve as a later baseline.")
+    parser.add_argument("--threshold", type=float, default=DEFAULT_THRESHOLD, help="Allowed relative regression.")
+    parser.add_argument(
+        "--metric-threshold", type=parse_threshold, action="append", default=[], metavar="METRIC=FRACTION",
+        help="Allowed relative regression of the metrics starting with METRIC, e.g. load.latency.p99_ms=0.5.",
+    )
+    return parser.parse_args(argv)
+
+
+async def run_endpoints(args: argparse.Namespace, spec: DatasetSpec, csv_path: str) -> Dict[str, Any]:
+    from httpx import AsyncClient
+    from sqlalchemy import inspect
+    from sqlalchemy.ext.asyncio import AsyncSession, create_async_engine
+    from sqlalchemy.orm import sessionmaker
+
+    from benchmarks.load import run_load, run_uploads
+    from src.database import get_async_session, metadata
+    from src.file_management.executor import query_executor
+    from src.main import app
+
+    engine = create_async_engine(args.database_url or default_database_url())
+    async with engine.connect() as conn:
+        existing_tables = await conn.run_sync(lambda sync_conn: inspect(sync_conn).get_table_names())
+    if set(existing_tables) & set(metadata.tables):
+        await engine.dispose()
+        raise SystemExit("The database already has the app's tables; use a throwaway database for benchmarks.")
+    session_maker = sessionmaker(engine, class_=AsyncSession)
+
+    async def get_benchmark_session():
+        async with session_maker() as session:
+            yield session
+
+    app.dependency_overrides[get_async_session] = get_benchmark_session
+    async with engine.begin() as conn:
+        await conn.run_sync(metadata.create_all)
+    try:
+        async with AsyncClient(app=app, base_url="http://benchmark", timeout=None) as client:
+            upload = await run_uploads(client, csv_path, spec, args.uploads)
+            with open(csv_path, "rb") as f:
+                response = await client.post(
+                    "/upload_file", params={"wait": True}, files={"file": (LOAD_FILE_NAME, f, "text/csv")}
+                )
+            if response.status_code != 201:
+                raise SystemExit(f"Could not upload the benchmark dataset: {response.text}")
+            load = await run_load(client, LOAD_FILE_NAME, spec, args.concurrency, args.requests, args.seed)
+    finally:
+        async with engine.begin() as conn:
+            await conn.run_sync(metadata.drop_all)
+        await engine.dispose()
+        query_executor.shutdown()
+    return {"upload": upload, "load": load}
+
+
+def main(argv: Optional[List[str]] = None) -> int:
+    args = parse_args(argv)
+    work_dir = tempfile.mkdtemp(prefix="benchmarks-")
+    # Before anything imports the app's configuration, so no real dataset is touched.
+    os.environ["DATASETS_DIR"] = os.path.join(work_dir, "datasets")
+    try:
+        from benchmarks.stages import run_stage_benchmarks
+
+        spec = DatasetSpec(args.rows, args.numeric_columns, args.string_columns, args.cardinality, args.seed)
+        csv_path = os.path.join(work_dir, "dataset.csv")
+        results: Dict[str, Any] = {
+            "environment": environment(),
+            "dataset": {**spec.to_dict(), "size": generate_csv(csv_path, spec)},
+        }
+        results["stages"] = run_stage_benchmarks(csv_path, spec, args.repeats)
+        results["memory"] = {"stages_peak_rss_bytes": peak_rss_bytes()}
+        if not args.skip_endpoints:
+            results.update(asyncio.run(run_endpoints(args, spec, csv_path)))
+            results["memory"]["endpoints_peak_rss_bytes"] = peak_rss_bytes()
+    finally:
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    if args.save_baseline:
+        with open(args.save_baseline, "w") as f:
+            json.dump(results, f, indent=2)
+    regressions = []
+    if args.baseline:
+        with open(args.baseline) as f:
+            baseline = json.load(f)
+        regressions = compare(results, baseline, args.threshold, dict(args.metric_threshold))
+        results["regressions"] = regressions
+    output = json.dumps(results, indent=2)
+    if args.output:
+        with open(args.output, "w") as f:
+            f.write(output)
+    else:
+        print(output)
+    for regression in regressions:
+        print(
+            f"Regression in {regression['metric']}: {regression['baseline']} -> {regression['current']} "
+            f"({regression['change']:+.0%})",
+            file=sys.stderr,
+        )
+    return 1 if regressions else 0
+
+
+if __name__ == "__main__":
+    sys.exit(main())
@@ -0,0 +1,53 @@
+import csv
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List
+
+import numpy as np
+import pandas as pd
+
+# Prefixes of generated text values, so contains filters match a predictable share of rows.
+WORDS = ("alpha", "bravo", "charlie", "delta", "echo", "foxtrot", "golf", "hotel")
+
+
+@dataclass(frozen=True)
+class DatasetSpec:
+    """
+    Shape of a synthetic dataset: `numeric_columns` alternate between integers below `cardinality`
+    and floats, and `string_columns` draw from `cardinality` distinct values. The same spec always
+    generates the same bytes.
+    """
+    rows: int = 100_000
+    numeric_columns: int = 4
+    string_columns: int = 2
+    cardinality: int = 1000
+    seed: int = 0
+
+    @property
+    def column_names(self) -> List[str]:
+        return [f"num_{i}" for i in range(self.numeric_columns)] + [f"str_{i}" for i in range(self.string_columns)]
+
+    def text_value(self, i: int) -> str:
+        return f"{WORDS[i % len(WORDS)]}_{i:06d}"
+
+    def to_dict(self) -> Dict[str, Any]:
+        return asdict(self)
+
+
+def generate_csv(path: str, spec: DatasetSpec, chunk_rows: int = 100_000) -> int:
+    """Write the dataset described by `spec` to `path` chunk by chunk and return its size in bytes."""
+    rng = np.random.default_rng(spec.seed)
+    vocabulary = np.array([spec.text_value(i) for i in range(spec.cardinality)], dtype=object)
+    with open(path, "w", newline="") as f:
+        csv.writer(f).writerow(spec.column_names)
+        for start in range(0, spec.rows, chunk_rows):
+            count = min(chunk_rows, spec.rows - start)
+            data = {}
+            for i in range(spec.numeric_columns):
+                if i % 2 == 0:
+                    data[f"num_{i}"] = rng.integers(0, spec.cardinality, count)
+                else:
+                    data[f"num_{i}"] = rng.normal(0, 1000, count).round(3)
+            for i in range(spec.string_columns):
+                data[f"str_{i}"] = vocabulary[rng.integers(0, spec.cardinality, count)]
+            pd.DataFrame(data, columns=spec.column_names).to_csv(f, index=False, header=False)
+        return f.tell()
@@ -0,0 +1,128 @@
+import asyncio
+import os
+import time
+from collections import defaultdict
+from typing import Any, Dict, List, Tuple
+
+import numpy as np
+from httpx import AsyncClient
+
+from benchmarks.data import DatasetSpec
+from benchmarks.report import latency_summary
+
+PAGE_ROWS = 100
+
+Request = Tuple[str, str, Dict[str, Any], Any]
+
+
+def build_requests(file_name: str, spec: DatasetSpec, count: int, seed: int = 0) -> List[Request]:
+    """
+    A deterministic mix of `(operation, url, params, json)` requests against one dataset: pages at
+    random offsets, sorted pages, filtered pages and grouped aggregations. Offsets and filter values
+    vary, so most requests miss the result cache as they would in production.
+    """
+    rng = np.random.default_rng(seed)
+    max_offset = max(spec.rows - PAGE_ROWS, 1)
+    operations = ["page"]
+    if spec.numeric_columns:
+        operations.append("sort")
+    if spec.string_columns:
+        operations += ["filter", "aggregate"]
+    requests = []
+    for _ in range(count):
+        operation = operations[rng.integers(len(operations))]
+        params = {"file_name": file_name}
+        if operation == "aggregate":
+            body = {"aggregations": [{"function": "count"}], "group_by": ["str_0"]}
+            if spec.numeric_columns:
+                body["aggregations"].append({"function": "mean", "column": "num_0"})
+            requests.append((operation, "/aggregate_data", params, body))
+            continue
+        params.update(limit=PAGE_ROWS, offset=int(rng.integers(max_offset)))
+        body = None
+        if operation == "sort":
+            body = {"sort_by": ["num_0"], "sort_orders": ["desc"]}
+        elif operation == "filter":
+            body = {"filter_by": ["str_0"], "filter_values": [spec.text_value(int(rng.integers(spec.cardinality)))[:8]]}
+            params["offset"] = 0
+        requests.append((operation, "/fetch_data", params, body))
+    return requests
+
+
+async def run_load(
+        client: AsyncClient,
+        file_name: str,
+        spec: DatasetSpec,
+        concurrency: int = 8,
+        request_count: int = 200,
+        seed: int = 0,
+) -> Dict[str, Any]:
+    """Send the request mix from `concurrency` concurrent clients and report throughput and latencies."""
+    queue: asyncio.Queue = asyncio.Queue()
+    for request in build_requests(file_name, spec, request_count, seed):
+        queue.put_nowait(request)
+    latencies: Dict[str, List[float]] = defaultdict(list)
+    errors: Dict[str, int] = defaultdict(int)
+
+    async def worker():
+        while not queue.empty():
+            operation, url, params, body = queue.get_nowait()
+            started = time.perf_counter()
+            response = await client.post(url, params=params, json=body)
+            latencies[operation].append(time.perf_counter() - started)
+            if response.status_code != 200:
+                errors[operation] += 1
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(concurrency)))
+    duration = time.perf_counter() - started
+    all_latencies = [latency for samples in latencies.values() for latency in samples]
+    return {
+        "concurrency": concurrency,
+        "requests": len(all_latencies),
+        "errors": sum(errors.values()),
+        "duration_s": round(duration, 3),
+        "requests_per_second": round(len(all_latencies) / duration, 1) if duration else 0.0,
+        "latency": latency_summary(all_latencies),
+        "operations": {
+            operation: {"requests": len(samples), "errors": errors[operation], "latency": latency_summary(samples)}
+            for operation, samples in sorted(latencies.items())
+        },
+    }
+
+
+async def run_uploads(
+        client: AsyncClient,
+        csv_path: str,
+        spec: DatasetSpec,
+        count: int = 3,
+        prefix: str = "benchmark-upload",
+) -> Dict[str, Any]:
+    """
+    Upload the dataset `count` times, waiting for ingestion, then delete the copies. Every copy gets
+    an extra row of its own, so none is deduplicated against the others.
+    """
+    with open(csv_path, "rb") as f:
+        content = f.read()
+    samples = []
+    errors = 0
+    for i in range(count):
+        extra_row = ",".join([str(i)] * len(spec.column_names)).encode() + b"\n"
+        started = time.perf_counter()
+        response = await client.post(
+            "/upload_file",
+            params={"wait": True},
+            files={"file": (f"{prefix}-{i}.csv", content + extra_row, "text/csv")},
+        )
+        samples.append(time.perf_counter() - started)
+        if response.status_code != 201:
+            errors += 1
+    for i in range(count):
+        await client.delete("/delete_file", params={"file_name": f"{prefix}-{i}.csv"})
+    median = sorted(samples)[len(samples) // 2] if samples else 0
+    return {
+        "uploads": count,
+        "errors": errors,
+        "latency": latency_summary(samples),
+        "megabytes_per_second": round(os.path.getsize(csv_path) / 1024 ** 2 / median, 2) if median else 0.0,
+    }
@@ -0,0 +1,96 @@
+import platform
+import resource
+import sys
+from typing import Any, Dict, List, Optional, Sequence
+
+import numpy as np
+
+DEFAULT_THRESHOLD = 0.2
+# Timings this small are dominated by noise, so relative changes of them are not regressions.
+NOISE_FLOOR_MS = 1.0
+# Single worst samples are too noisy to gate on.
+UNCOMPARED_SUFFIXES = (".max_ms",)
+
+
+def latency_summary(seconds: Sequence[float]) -> Dict[str, float]:
+    """Percentiles of a list of durations, in milliseconds."""
+    if not seconds:
+        return {}
+    p50, p90, p99 = np.percentile(np.asarray(seconds) * 1000, [50, 90, 99])
+    return {
+        "p50_ms": round(float(p50), 3),
+        "p90_ms": round(float(p90), 3),
+        "p99_ms": round(float(p99), 3),
+        "max_ms": round(max(seconds) * 1000, 3),
+    }
+
+
+def peak_rss_bytes() -> int:
+    """Peak resident set size of this process so far."""
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Linux reports kilobytes, macOS bytes.
+    return peak if sys.platform == "darwin" else peak * 1024
+
+
+def environment() -> Dict[str, Any]:
+    import pandas
+    import pyarrow
+
+    from src.config import FETCH_EXECUTOR, FETCH_MAX_WORKERS
+
+    return {
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "pandas": pandas.__version__,
+        "pyarrow": pyarrow.__version__,
+        "fetch_executor": FETCH_EXECUTOR,
+        "fetch_max_workers": FETCH_MAX_WORKERS,
+    }
+
+
+def flatten(results: Dict[str, Any], prefix: str = "") -> Dict[str, Any]:
+    flat = {}
+    for key, value in results.items():
+        name = f"{prefix}{key}"
+        if isinstance(value, dict):
+            flat.update(flatten(value, f"{name}."))
+        else:
+            flat[name] = value
+    return flat
+
+
+def compare(
+        results: Dict[str, Any],
+        baseline: Dict[str, Any],
+        threshold: float = DEFAULT_THRESHOLD,
+        thresholds: Optional[Dict[str, float]] = None,
+) -> List[Dict[str, Any]]:
+    """
+    Metrics of `results` that regressed against `baseline` by more than their threshold: timings
+    (`*_ms`) and peak memory (`*_rss_bytes`) that grew, and throughputs (`*_per_second`) that
+    shrank, relative to the baseline.
+    `thresholds` overrides `threshold` for metrics starting with one of its keys, longest key first.
+    """
+    overrides = sorted((thresholds or {}).items(), key=lambda item: len(item[0]), reverse=True)
+    previous = flatten(baseline)
+    regressions = []
+    for metric, value in flatten(results).items():
+        old = previous.get(metric)
+        if metric.endswith(UNCOMPARED_SUFFIXES):
+            continue
+        if isinstance(value, bool) or not isinstance(value, (int, float)) or not isinstance(old, (int, float)) or old <= 0:
+            continue
+        if metric.endswith("_ms"):
+            if max(value, old) < NOISE_FLOOR_MS:
+                continue
+            change = value / old - 1
+        elif metric.endswith("_rss_bytes"):
+            change = value / old - 1
+        elif metric.endswith("_per_second"):
+            change = old / value - 1 if value > 0 else float("inf")
+        else:
+            continue
+        limit = next((limit for prefix, limit in overrides if metric.startswith(prefix)), threshold)
+        if change > limit:
+            regressions.append({"metric": metric, "baseline": old, "current": value, "change": round(change, 4)})
+    return regressions
@@ -0,0 +1,90 @@
+import os
+import shutil
+import time
+from typing import Any, Callable, Dict, List
+
+from benchmarks.data import DatasetSpec
+from benchmarks.report import latency_summary
+
+
+def time_repeats(fn: Callable[[], Any], repeats: int, setup: Callable[[], Any] = None) -> List[float]:
+    """Durations of `repeats` calls of `fn`, each after an untimed `setup`."""
+    samples = []
+    for _ in range(repeats):
+        if setup is not None:
+            setup()
+        started = time.perf_counter()
+        fn()
+        samples.append(time.perf_counter() - started)
+    return samples
+
+
+def stage_result(samples: List[float], rows: int) -> Dict[str, float]:
+    median = sorted(samples)[len(samples) // 2]
+    return {
+        **latency_summary(samples),
+        "min_ms": round(min(samples) * 1000, 3),
+        "rows_per_second": round(rows / median, 1) if median else 0.0,
+    }
+
+
+def run_stage_benchmarks(csv_path: str, spec: DatasetSpec, repeats: int = 5) -> Dict[str, Dict[str, float]]:
+    """
+    Time every stage of an upload and a query on the dataset at `csv_path` in isolation, through the
+    same functions the endpoints use: ingesting (hashing, scanning and storing), building the
+    Parquet sidecar, parsing the CSV and loading the sidecar, filtering, sorting and serializing
+    in every output format. Datasets are written to the configured `DATASETS_DIR`.
+    """
+    from src.file_management.ingest import ingest_fileobj
+    from src.file_management.query import execute_plan, plan_query
+    from src.file_management.serializers import SERIALIZERS
+    from src.file_management.storage import build_sidecar, dataset_path, load_dataframe, sidecar_path
+
+    file_name = "benchmark-stages.csv"
+    path, parquet_path = dataset_path(file_name), sidecar_path(file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    results = {}
+
+    def remove_stored():
+        for stored_path in (path, parquet_path):
+            if os.path.exists(stored_path):
+                os.remove(stored_path)
+
+    def ingest():
+        with open(csv_path, "rb") as f:
+            ingest_fileobj(f, path)
+
+    try:
+        results["ingest"] = stage_result(time_repeats(ingest, repeats, setup=remove_stored), spec.rows)
+        remove_stored()
+        shutil.copyfile(csv_path, path)
+        results["parse_csv"] = stage_result(time_repeats(lambda: load_dataframe(file_name), repeats), spec.rows)
+        results["build_sidecar"] = stage_result(
+            time_repeats(lambda: build_sidecar(path, parquet_path), repeats), spec.rows
+        )
+        results["load_sidecar"] = stage_result(time_repeats(lambda: load_dataframe(file_name), repeats), spec.rows)
+        df = load_dataframe(file_name)
+    finally:
+        remove_stored()
+
+    columns = spec.column_names
+    queries = {}
+    if spec.string_columns:
+        queries["filter_contains"] = plan_query(columns, filter_by=["str_0"], filter_values=[spec.text_value(1)[:5]])
+        queries["filter_regex"] = plan_query(
+            columns, filter_by=["str_0"], filter_values=[r"_0+1\d$"], filter_regex=True
+        )
+        queries["sort_text"] = plan_query(columns, sort_by=["str_0"])
+    if spec.numeric_columns:
+        queries["sort_numeric"] = plan_query(columns, sort_by=["num_0"], sort_orders=["desc"])
+        conditions = [{"column": "num_0", "op": "between", "value": [0, spec.cardinality // 10]}]
+        if spec.string_columns:
+            conditions.append({"column": "str_0", "op": "in", "value": [spec.text_value(i) for i in range(3)]})
+        queries["filter_where"] = plan_query(columns, where={"or": conditions})
+    for name, plan in queries.items():
+        results[name] = stage_result(time_repeats(lambda: execute_plan(df, plan), repeats), spec.rows)
+
+    for output_format, serializer in SERIALIZERS.items():
+        results[f"serialize_{output_format}"] = stage_result(time_repeats(lambda: serializer(df), repeats), spec.rows)
+    return results
@@ -17,3 +17,45 @@ DB_PORT_TEST = os.getenv("DB_PORT_TEST")
 DB_NAME_TEST = os.getenv("DB_NAME_TEST")
 DB_USER_TEST = os.getenv("DB_USER_TEST")
 DB_PASS_TEST = os.getenv("DB_PASS_TEST")
+
+DATASETS_DIR = os.getenv("DATASETS_DIR", "datasets")
+UPLOAD_CHUNK_SIZE = int(os.getenv("UPLOAD_CHUNK_SIZE", 1024 * 1024))
+MAX_UPLOAD_SIZE = int(os.getenv("MAX_UPLOAD_SIZE", 10 * 1024 ** 3))
+SIDECAR_DIR = os.getenv("SIDECAR_DIR", os.path.join(DATASETS_DIR, ".sidecars"))
+SIDECAR_BLOCK_SIZE = int(os.getenv("SIDECAR_BLOCK_SIZE", 16 * 1024 * 1024))
+SIDECAR_MAX_SEGMENTS = int(os.getenv("SIDECAR_MAX_SEGMENTS", 16))
+DATASET_COMPRESSION = os.getenv("DATASET_COMPRESSION", "none")
+DATASET_COMPRESSION_LEVEL = int(os.getenv("DATASET_COMPRESSION_LEVEL", 3))
+DATASET_COMPRESSION_BLOCK_SIZE = int(os.getenv("DATASET_COMPRESSION_BLOCK_SIZE", 4 * 1024 * 1024))
+UPLOAD_SESSION_DIR = os.getenv("UPLOAD_SESSION_DIR", os.path.join(DATASETS_DIR, ".uploads"))
+UPLOAD_SESSION_TTL = float(os.getenv("UPLOAD_SESSION_TTL", 24 * 60 * 60))
+UPLOAD_SESSION_GC_INTERVAL = float(os.getenv("UPLOAD_SESSION_GC_INTERVAL", 60 * 60))
+BULK_UPLOAD_CONCURRENCY = int(os.getenv("BULK_UPLOAD_CONCURRENCY", os.cpu_count() or 1))
+BULK_UPLOAD_MAX_FILES = int(os.getenv("BULK_UPLOAD_MAX_FILES", 10000))
+INGEST_JOB_DIR = os.getenv("INGEST_JOB_DIR", os.path.join(DATASETS_DIR, ".jobs"))
+INGEST_MAX_ATTEMPTS = int(os.getenv("INGEST_MAX_ATTEMPTS", 3))
+INGEST_RETRY_BACKOFF = float(os.getenv("INGEST_RETRY_BACKOFF", 1))
+INGEST_JOB_LEASE = float(os.getenv("INGEST_JOB_LEASE", 60))
+INGEST_STORE_CONCURRENCY = int(os.getenv("INGEST_STORE_CONCURRENCY", 2))
+INGEST_PROFILE_CONCURRENCY = int(os.getenv("INGEST_PROFILE_CONCURRENCY", 1))
+INGEST_INDEX_CONCURRENCY = int(os.getenv("INGEST_INDEX_CONCURRENCY", 1))
+INGEST_REGISTER_CONCURRENCY = int(os.getenv("INGEST_REGISTER_CONCURRENCY", 4))
+
+DATAFRAME_CACHE_MAX_BYTES = int(os.getenv("DATAFRAME_CACHE_MAX_BYTES", 512 * 1024 ** 2))
+SHARED_DATASET_CACHE_DIR = os.getenv("SHARED_DATASET_CACHE_DIR")
+STREAM_BATCH_ROWS = int(os.getenv("STREAM_BATCH_ROWS", 10000))
+
+FETCH_EXECUTOR = os.getenv("FETCH_EXECUTOR", "thread")
+FETCH_MAX_WORKERS = int(os.getenv("FETCH_MAX_WORKERS", os.cpu_count() or 1))
+FETCH_MAX_QUEUE = int(os.getenv("FETCH_MAX_QUEUE", 32))
+SORT_INDEX_THRESHOLD = int(os.getenv("SORT_INDEX_THRESHOLD", 3))
+RESULT_CACHE_MAX_BYTES = int(os.getenv("RESULT_CACHE_MAX_BYTES", 64 * 1024 ** 2))
+RESULT_CACHE_TTL = float(os.getenv("RESULT_CACHE_TTL", 60))
+
+PROMETHEUS_MULTIPROC_DIR = os.getenv("PROMETHEUS_MULTIPROC_DIR")
+
+PROFILING_ENABLED = os.getenv("PROFILING_ENABLED", "false").lower() == "true"
+PROFILING_TOKEN = os.getenv("PROFILING_TOKEN")
+PROFILING_PATHS = os.getenv("PROFILING_PATHS", "/fetch_data,/upload_file").split(",")
+PROFILE_DIR = os.getenv("PROFILE_DIR", os.path.join(DATASETS_DIR, ".profiles"))
+PROFILE_RETENTION = int(os.getenv("PROFILE_RETENTION", 50))
@@ -0,0 +1,184 @@
+import time
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import orjson
+import pandas as pd
+
+from src.file_management.filters import normalize_filter
+from src.file_management.query import InvalidQueryError, QueryPlan, execute_plan, plan_query
+from src.file_management.serializers import with_text_values
+
+AGGREGATE_COUNT = "count"
+AGGREGATE_PERCENTILE = "percentile"
+
+PANDAS_AGGREGATES = {
+    AGGREGATE_COUNT: "count",
+    "sum": "sum",
+    "mean": "mean",
+    "min": "min",
+    "max": "max",
+    "distinct_count": "nunique",
+}
+NUMERIC_AGGREGATES = ("sum", "mean", AGGREGATE_PERCENTILE)
+
+
+@dataclass(frozen=True)
+class AggregateSpec:
+    """
+    One aggregation: `function` over `column`. `count` without a column counts rows, with a column
+    its non-null values. `percentile` (0 to 100) is only used by the percentile function.
+    """
+    function: str
+    column: Optional[str] = None
+    percentile: Optional[float] = None
+
+    @property
+    def name(self) -> str:
+        if self.function == AGGREGATE_PERCENTILE:
+            return f"p{self.percentile:g}_{self.column}"
+        return self.function if self.column is None else f"{self.function}_{self.column}"
+
+
+@dataclass
+class AggregatePlan:
+    query: QueryPlan
+    group_by: List[str]
+    aggregations: List[AggregateSpec]
+
+    def explain(self) -> Dict[str, Any]:
+        return {
+            **self.query.explain(),
+            "group_by": self.group_by,
+            "aggregations": [spec.name for spec in self.aggregations],
+        }
+
+
+@dataclass
+class AggregateResult:
+    group_count: int
+    plan: Dict[str, Any]
+    stats: Dict[str, Any]
+    body: Optional[bytes] = None
+
+
+def normalize_aggregate(
+        group_by: Optional[List[str]],
+        aggregations: List[AggregateSpec],
+        filter_by: Optional[List[str]] = None,
+        filter_values: Optional[List[str]] = None,
+        filter_regex: bool = False,
+        where: Any = None,
+) -> Tuple:
+    """Canonical, hashable form of an aggregation request, so equivalent requests share cache entries."""
+    return (
+        tuple(group_by or ()),
+        tuple(dict.fromkeys(aggregations)),
+        tuple(sorted(zip(filter_by or [], filter_values or []))),
+        filter_regex,
+        normalize_filter(where),
+    )
+
+
+def plan_aggregate(
+        column_names: List[str],
+        group_by: Optional[List[str]],
+        aggregations: List[AggregateSpec],
+        filter_by: Optional[List[str]] = None,
+        filter_values: Optional[List[str]] = None,
+        filter_regex: bool = False,
+        index_paths: Optional[Dict[str, str]] = None,
+        column_stats: Optional[Dict[str, Dict[str, Any]]] = None,
+        where: Any = None,
+        read_schema: Optional[Dict[str, str]] = None,
+) -> AggregatePlan:
+    """
+    Validate an aggregation against the file header and its upload-time `column_stats`. Filters are
+    planned exactly like fetch_data's, and only the grouped, aggregated and filtered columns are read.
+    """
+    group_by = list(dict.fromkeys(group_by or []))
+    aggregations = list(dict.fromkeys(aggregations))
+    if not aggregations:
+        raise InvalidQueryError("At least one aggregation is required.")
+    known_columns = set(column_names)
+    for column in group_by:
+        if column not in known_columns:
+            raise InvalidQueryError(f"Invalid group by column name: {column}")
+    for spec in aggregations:
+        if spec.column is None:
+            if spec.function != AGGREGATE_COUNT:
+                raise InvalidQueryError(f"Aggregation '{spec.function}' requires a column")
+            continue
+        if spec.column not in known_columns:
+            raise InvalidQueryError(f"Invalid aggregation column name: {spec.column}")
+        if spec.function == AGGREGATE_PERCENTILE and (spec.percentile is None or not 0 <= spec.percentile <= 100):
+            raise InvalidQueryError("Aggregation 'percentile' requires a percentile between 0 and 100")
+        stats = (column_stats or {}).get(spec.column)
+        if spec.function in NUMERIC_AGGREGATES and stats is not None and not _is_numeric_dtype(stats["dtype"]):
+            raise InvalidQueryError(f"Aggregation '{spec.function}' requires a numeric column, '{spec.column}' is not")
+        if spec.name in group_by:
+            raise InvalidQueryError(f"Aggregation '{spec.name}' has the same name as a group by column")
+
+    columns = [*group_by, *(spec.column for spec in aggregations if spec.column is not None)] or column_names[:1]
+    query = plan_query(
+        column_names, columns, filter_by=filter_by, filter_values=filter_values, filter_regex=filter_regex,
+        index_paths=index_paths, column_stats=column_stats, where=where, read_schema=read_schema,
+    )
+    return AggregatePlan(query=query, group_by=group_by, aggregations=aggregations)
+
+
+def _is_numeric_dtype(dtype: str) -> bool:
+    return dtype.startswith(("int", "uint", "float", "double", "decimal", "bool"))
+
+
+def aggregate_frame(df: pd.DataFrame, group_by: List[str], aggregations: List[AggregateSpec]) -> pd.DataFrame:
+    """
+    Compute `aggregations` over `df`, per distinct combination of the `group_by` columns (nulls form
+    a group of their own) or over the whole frame. Groups come back sorted by their keys.
+
+    Columns read as float32 are aggregated in float64, as they would have been read without a read schema.
+    """
+    for spec in aggregations:
+        if spec.function in NUMERIC_AGGREGATES and len(df) and not pd.api.types.is_numeric_dtype(df[spec.column]):
+            raise InvalidQueryError(f"Aggregation '{spec.function}' requires a numeric column, '{spec.column}' is not")
+    narrow_columns = {spec.column for spec in aggregations if spec.column is not None and df[spec.column].dtype == np.float32}
+    if narrow_columns:
+        df = df.astype(dict.fromkeys(narrow_columns, np.float64))
+
+    if not group_by:
+        row = {}
+        for spec in aggregations:
+            if spec.column is None:
+                row[spec.name] = len(df)
+            elif spec.function == AGGREGATE_PERCENTILE:
+                row[spec.name] = df[spec.column].quantile(spec.percentile / 100)
+            else:
+                row[spec.name] = getattr(df[spec.column], PANDAS_AGGREGATES[spec.function])()
+        return pd.DataFrame([row], columns=[spec.name for spec in aggregations])
+
+    grouped = df.groupby(group_by, dropna=False, sort=True, observed=True)
+    results = []
+    for spec in aggregations:
+        if spec.column is None:
+            values = grouped.size()
+        elif spec.function == AGGREGATE_PERCENTILE:
+            values = grouped[spec.column].quantile(spec.percentile / 100)
+        else:
+            values = grouped[spec.column].agg(PANDAS_AGGREGATES[spec.function])
+        results.append(values.rename(spec.name))
+    return pd.concat(results, axis=1).reset_index()
+
+
+def run_aggregate(df: pd.DataFrame, plan: AggregatePlan, explain: bool = False) -> AggregateResult:
+    """Filter, aggregate and render as JSON records, with nulls kept. Runs on the query executor like `run_query`."""
+    df, stats = execute_plan(df, plan.query)
+    started = time.perf_counter()
+    aggregated = aggregate_frame(df, plan.group_by, plan.aggregations)
+    stats["aggregate_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    result = AggregateResult(group_count=len(aggregated), plan=plan.explain(), stats=stats)
+    if not explain:
+        aggregated = with_text_values(aggregated)
+        records = aggregated.astype(object).where(aggregated.notna(), None).to_dict(orient="records")
+        result.body = orjson.dumps(records, option=orjson.OPT_SERIALIZE_NUMPY)
+    return result
@@ -0,0 +1,348 @@
+import asyncio
+import fcntl
+import hashlib
+import logging
+import os
+import shutil
+import time
+import uuid
+from collections import OrderedDict
+from dataclasses import dataclass
+from functools import partial
+from typing import Callable, Dict, Hashable, List, Optional, Tuple
+
+import pandas as pd
+import pyarrow as pa
+
+from src.config import DATAFRAME_CACHE_MAX_BYTES, RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL, SHARED_DATASET_CACHE_DIR
+from src.file_management.storage import (
+    CSV_ENCODING, cast_to_schema, load_dataframe, load_table, read_sidecar_rows, table_to_frame
+)
+from src.profiling import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+CacheKey = Tuple[Hashable, Hashable]
+
+
+@dataclass
+class _CacheEntry:
+    df: pd.DataFrame
+    nbytes: int
+
+
+class DataFrameCache:
+    """
+    LRU cache of loaded datasets keyed by dataset storage key and content version, bounded by
+    `DataFrame.memory_usage(deep=True)`. Files with identical content share a storage key and so
+    share their entries.
+
+    Concurrent misses for the same key share a single load. Cached frames are shared between
+    requests and must not be modified in place. All bookkeeping happens on the event loop, only
+    the loader runs in the threadpool.
+    """
+
+    def __init__(self, max_bytes: int):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.coalesced = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[CacheKey, _CacheEntry]" = OrderedDict()
+        self._pending: Dict[CacheKey, asyncio.Task] = {}
+
+    async def get_or_load(self, dataset_key: Hashable, version: Hashable, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        key = (dataset_key, version)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.df
+
+        task = self._pending.get(key)
+        if task is None:
+            self.misses += 1
+            task = asyncio.ensure_future(self._load(key, loader))
+            self._pending[key] = task
+            task.add_done_callback(lambda done: self._pending.pop(key) if self._pending.get(key) is done else None)
+        else:
+            self.coalesced += 1
+        return await asyncio.shield(task)
+
+    def get_or_load_sync(self, dataset_key: Hashable, version: Hashable, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        """Blocking variant for single-threaded callers, such as worker processes of the query executor."""
+        key = (dataset_key, version)
+        entry = self._entries.get(key)
+        if entry is not None:
+            self._entries.move_to_end(key)
+            self.hits += 1
+            return entry.df
+        self.misses += 1
+        df, nbytes = _load_with_size(loader)
+        self._put(key, df, nbytes)
+        return df
+
+    async def extend(
+            self,
+            dataset_key: Hashable,
+            version: Hashable,
+            appended_key: Hashable,
+            appended_version: Hashable,
+            rows_loader: Callable[[], pd.DataFrame],
+    ) -> int:
+        """
+        Cache the frames of a dataset that rows were appended to, under `appended_key`, by appending
+        the rows `rows_loader` returns to the cached frames of the dataset before, instead of loading
+        it again. Versions are `(version, read columns)` pairs, as `run_on_dataset` caches frames;
+        returns how many frames were extended. The rows are only loaded if there are any.
+        """
+        cached = [
+            (read_columns, entry.df) for (key, (entry_version, read_columns)), entry in list(self._entries.items())
+            if key == dataset_key and entry_version == version
+        ]
+        if not cached:
+            return 0
+        rows = await run_in_threadpool(rows_loader)
+        for read_columns, df in cached:
+            selected_rows = rows if read_columns is None else rows[list(read_columns)]
+            appended_df, nbytes = await run_in_threadpool(_load_with_size, partial(append_frame, df, selected_rows))
+            self._put((appended_key, (appended_version, read_columns)), appended_df, nbytes)
+        return len(cached)
+
+    def invalidate(self, dataset_key: Hashable) -> None:
+        for key in [key for key in self._entries if key[0] == dataset_key]:
+            self.current_bytes -= self._entries.pop(key).nbytes
+        for key in [key for key in self._pending if key[0] == dataset_key]:
+            del self._pending[key]
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "coalesced": self.coalesced,
+            "evictions": self.evictions,
+        }
+
+    async def _load(self, key: CacheKey, loader: Callable[[], pd.DataFrame]) -> pd.DataFrame:
+        df, nbytes = await run_in_threadpool(_load_with_size, loader)
+        # A load that was invalidated while running must not resurrect the deleted dataset.
+        if self._pending.get(key) is asyncio.current_task():
+            self._put(key, df, nbytes)
+        return df
+
+    def _put(self, key: CacheKey, df: pd.DataFrame, nbytes: int) -> None:
+        if nbytes > self.max_bytes:
+            return
+        self._entries[key] = _CacheEntry(df=df, nbytes=nbytes)
+        self.current_bytes += nbytes
+        while self.current_bytes > self.max_bytes:
+            _, evicted = self._entries.popitem(last=False)
+            self.current_bytes -= evicted.nbytes
+            self.evictions += 1
+
+
+def append_frame(df: pd.DataFrame, rows: pd.DataFrame) -> pd.DataFrame:
+    """`rows` appended to `df`. Categoricals get the sorted union of both categories, so they stay ordered."""
+    columns = {}
+    for name in df.columns:
+        values, added = df[name], rows[name]
+        if isinstance(values.dtype, pd.CategoricalDtype):
+            categories = values.cat.categories.union(added.cat.categories)
+            values, added = values.cat.set_categories(categories), added.cat.set_categories(categories)
+        columns[name] = pd.concat([values, added], ignore_index=True)
+    return pd.DataFrame(columns)
+
+
+def _load_with_size(loader: Callable[[], pd.DataFrame]) -> Tuple[pd.DataFrame, int]:
+    df = loader()
+    return df, int(df.memory_usage(deep=True).sum())
+
+
+class SharedDatasetCache:
+    """
+    Datasets as uncompressed Arrow IPC files under `directory`, memory-mapped by every worker
+    process, so all workers read the same pages of the OS page cache instead of each parsing and
+    holding its own copy. Frames made from a mapped table reference its buffers without copying.
+
+    The first worker to need a dataset builds its file while holding an exclusive `flock` on a
+    lock file next to it; workers needing it meanwhile wait for that lock and then map the result.
+    `invalidate` removes the files of a dataset, which other workers notice through `contains`.
+    """
+
+    def __init__(self, directory: str):
+        self.directory = directory
+        self.builds = 0
+        self.maps = 0
+
+    def path(self, dataset_key: Hashable, version: Hashable) -> str:
+        return os.path.join(self._key_dir(dataset_key), f"{_digest(version)}.arrow")
+
+    def contains(self, dataset_key: Hashable, version: Hashable) -> bool:
+        return os.path.exists(self.path(dataset_key, version))
+
+    def get_table(self, dataset_key: Hashable, version: Hashable, builder: Callable[[], pa.Table]) -> pa.Table:
+        """Map the dataset's file, building it first with `builder` if no worker has done so. Blocking."""
+        path = self.path(dataset_key, version)
+        try:
+            return self._map(path)
+        except FileNotFoundError:
+            pass
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        with open(f"{path}.lock", "a") as lock:
+            fcntl.flock(lock, fcntl.LOCK_EX)
+            try:
+                return self._map(path)
+            except FileNotFoundError:
+                pass
+            table = builder()
+            temp_path = f"{path}.{uuid.uuid4().hex}.part"
+            try:
+                with pa.OSFile(temp_path, "wb") as sink, pa.ipc.new_file(sink, table.schema) as writer:
+                    writer.write_table(table)
+                os.replace(temp_path, path)
+            except OSError:
+                # Invalidated while building; serve this load from memory without sharing it.
+                logger.warning("Could not share dataset '%s' through %s", dataset_key, path, exc_info=True)
+                return table
+            finally:
+                if os.path.exists(temp_path):
+                    os.remove(temp_path)
+            self.builds += 1
+            return self._map(path)
+
+    def invalidate(self, dataset_key: Hashable) -> None:
+        shutil.rmtree(self._key_dir(dataset_key), ignore_errors=True)
+
+    def stats(self) -> Dict[str, int]:
+        return {"builds": self.builds, "maps": self.maps}
+
+    def _key_dir(self, dataset_key: Hashable) -> str:
+        return os.path.join(self.directory, _digest(dataset_key))
+
+    def _map(self, path: str) -> pa.Table:
+        table = pa.ipc.open_file(pa.memory_map(path, "r")).read_all()
+        self.maps += 1
+        return table
+
+
+def _digest(value: Hashable) -> str:
+    return hashlib.sha1(repr(value).encode()).hexdigest()
+
+
+# Text columns stay in their Arrow buffers instead of becoming Python objects.
+_MAPPED_TYPES = {pa.string(): pd.StringDtype("pyarrow")}
+
+
+def load_dataset_frame(
+        dataset_key: str,
+        version: Hashable,
+        columns: Optional[List[str]] = None,
+        read_schema: Optional[Dict[str, str]] = None,
+        encoding: str = CSV_ENCODING,
+) -> pd.DataFrame:
+    """
+    Load the columns of a dataset a query reads, in the dtypes of its read schema. With the shared
+    cache enabled they come from its memory-mapped table, which is stored already cast to them,
+    otherwise from the sidecar or CSV like `load_dataframe`.
+    """
+    if shared_dataset_cache is None:
+        return load_dataframe(dataset_key, columns, read_schema, encoding)
+    table = shared_dataset_cache.get_table(dataset_key, version, partial(load_table, dataset_key, read_schema, encoding))
+    if columns is not None:
+        table = table.select(columns)
+    return table_to_frame(table, _MAPPED_TYPES, split_blocks=True)
+
+
+def load_appended_frame(
+        dataset_key: str,
+        csv_path: str,
+        read_schema: Optional[Dict[str, str]] = None,
+        encoding: str = CSV_ENCODING,
+) -> pd.DataFrame:
+    """Rows of a CSV appended to a dataset, in the dtypes `load_dataset_frame` loads the dataset with."""
+    table = cast_to_schema(read_sidecar_rows(dataset_key, csv_path, encoding), read_schema)
+    if shared_dataset_cache is None:
+        return table_to_frame(table)
+    return table_to_frame(table, _MAPPED_TYPES, split_blocks=True)
+
+
+@dataclass
+class CachedResult:
+    file_id: int
+    body: bytes
+    media_type: str
+    headers: Dict[str, str]
+    expires_at: float
+
+
+class ResultCache:
+    """
+    LRU cache of rendered fetch_data responses keyed by the normalized request, bounded by total
+    body size and by a TTL.
+
+    Keys include the file's id and content version, resolved with one indexed lookup before the
+    cache is consulted, so a hit skips pandas entirely and a file changed or deleted by another
+    worker process is never served from it. Local deletes and appends also drop their entries
+    right away, to free their space.
+    """
+
+    def __init__(self, max_bytes: int, ttl: float):
+        self.max_bytes = max_bytes
+        self.ttl = ttl
+        self.current_bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._entries: "OrderedDict[Hashable, CachedResult]" = OrderedDict()
+
+    def get(self, key: Hashable) -> Optional[CachedResult]:
+        entry = self._entries.get(key)
+        if entry is not None and entry.expires_at <= time.monotonic():
+            self._remove(key)
+            entry = None
+        if entry is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return entry
+
+    def put(self, key: Hashable, file_id: int, body: bytes, media_type: str, headers: Dict[str, str]) -> None:
+        if self.ttl <= 0 or len(body) > self.max_bytes:
+            return
+        if key in self._entries:
+            self._remove(key)
+        self._entries[key] = CachedResult(
+            file_id=file_id, body=body, media_type=media_type, headers=headers, expires_at=time.monotonic() + self.ttl
+        )
+        self.current_bytes += len(body)
+        while self.current_bytes > self.max_bytes:
+            oldest_key = next(iter(self._entries))
+            self._remove(oldest_key)
+            self.evictions += 1
+
+    def invalidate(self, file_id: int) -> None:
+        for key in [key for key, entry in self._entries.items() if entry.file_id == file_id]:
+            self._remove(key)
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "entries": len(self._entries),
+            "bytes": self.current_bytes,
+            "max_bytes": self.max_bytes,
+            "hits": self.hits,
+            "misses": self.misses,
+            "evictions": self.evictions,
+        }
+
+    def _remove(self, key: Hashable) -> None:
+        self.current_bytes -= len(self._entries.pop(key).body)
+
+
+dataframe_cache = DataFrameCache(DATAFRAME_CACHE_MAX_BYTES)
+shared_dataset_cache = SharedDatasetCache(SHARED_DATASET_CACHE_DIR) if SHARED_DATASET_CACHE_DIR else None
+result_cache = ResultCache(RESULT_CACHE_MAX_BYTES, RESULT_CACHE_TTL)
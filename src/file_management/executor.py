@@ -0,0 +1,119 @@
+import asyncio
+import multiprocessing
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, AsyncIterator, Callable, Dict, Hashable, List, Optional
+
+from src.config import DATAFRAME_CACHE_MAX_BYTES, FETCH_EXECUTOR, FETCH_MAX_QUEUE, FETCH_MAX_WORKERS
+from src.file_management.cache import DataFrameCache, load_dataset_frame, shared_dataset_cache
+from src.profiling import current_profile, run_with_profiler
+
+EXECUTOR_THREAD = "thread"
+EXECUTOR_PROCESS = "process"
+
+
+class ExecutorSaturatedError(Exception):
+    pass
+
+
+class QueryExecutor:
+    """
+    Runs the CPU-bound stages of fetch_data off the event loop with bounded concurrency.
+
+    At most `max_workers` jobs run at once and at most `max_queue` more may wait for a worker;
+    requests beyond that are rejected immediately by `admit` instead of queueing without limit.
+    The pool itself is created lazily so importing the app never starts worker processes.
+    """
+
+    def __init__(self, kind: str, max_workers: int, max_queue: int):
+        if kind not in (EXECUTOR_THREAD, EXECUTOR_PROCESS):
+            raise ValueError(f"Unknown executor kind: {kind}")
+        self.kind = kind
+        self.max_workers = max_workers
+        self.max_queue = max_queue
+        self.in_flight = 0
+        self.rejected = 0
+        self._executor: Optional[Executor] = None
+
+    @property
+    def uses_processes(self) -> bool:
+        return self.kind == EXECUTOR_PROCESS
+
+    @asynccontextmanager
+    async def admit(self) -> AsyncIterator[None]:
+        if self.in_flight >= self.max_workers + self.max_queue:
+            self.rejected += 1
+            raise ExecutorSaturatedError("Server is busy, please retry later.")
+        self.in_flight += 1
+        try:
+            yield
+        finally:
+            self.in_flight -= 1
+
+    async def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        profile = current_profile.get()
+        if profile is None:
+            return await asyncio.get_running_loop().run_in_executor(self._get_executor(), partial(fn, *args))
+        # Executor threads and processes do not see the request's context, so profile the call itself.
+        result, stats = await asyncio.get_running_loop().run_in_executor(
+            self._get_executor(), partial(run_with_profiler, fn, *args)
+        )
+        profile.add(stats)
+        return result
+
+    def shutdown(self) -> None:
+        if self._executor is not None:
+            self._executor.shutdown(wait=False, cancel_futures=True)
+            self._executor = None
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            if self.uses_processes:
+                self._executor = ProcessPoolExecutor(
+                    max_workers=self.max_workers, mp_context=multiprocessing.get_context("spawn")
+                )
+            else:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_workers, thread_name_prefix="fetch-data")
+        return self._executor
+
+
+_worker_cache: Optional[DataFrameCache] = None
+
+
+def load_and_run(
+        dataset_key: str,
+        version: Hashable,
+        read_columns: Optional[List[str]],
+        read_schema: Optional[Dict[str, str]],
+        encoding: str,
+        fn: Callable[..., Any],
+        *args: Any,
+) -> Any:
+    """
+    Entry point for worker processes: load the dataset through a process-local cache and run
+    `fn(df, *args)` on it, such as `run_query` or `run_aggregate`, whose result has a `stats` dict.
+
+    Worker caches are keyed by content version like the main one, so they never serve stale data.
+    They are not reached by `delete_file`, so without the shared dataset cache they only drop deleted
+    datasets through LRU eviction; with it they drop them once the shared file is gone.
+    """
+    global _worker_cache
+    if _worker_cache is None:
+        _worker_cache = DataFrameCache(DATAFRAME_CACHE_MAX_BYTES)
+    if shared_dataset_cache is not None and not shared_dataset_cache.contains(dataset_key, version):
+        _worker_cache.invalidate(dataset_key)
+    started = time.perf_counter()
+    df = _worker_cache.get_or_load_sync(
+        dataset_key,
+        (version, None if read_columns is None else tuple(sorted(read_columns))),
+        partial(load_dataset_frame, dataset_key, version, read_columns, read_schema, encoding),
+    )
+    load_ms = round((time.perf_counter() - started) * 1000, 3)
+    result = fn(df, *args)
+    result.stats["load_ms"] = load_ms
+    return result
+
+
+query_executor = QueryExecutor(FETCH_EXECUTOR, FETCH_MAX_WORKERS, FETCH_MAX_QUEUE)
@@ -0,0 +1,279 @@
+import operator
+from dataclasses import dataclass
+from typing import Any, Dict, List, Optional, Union
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+
+from src.file_management.stats import DATE_DTYPE, DATETIME_DTYPE
+
+MAX_FILTER_CONDITIONS = 100
+
+KIND_NUMBER = "number"
+KIND_BOOL = "bool"
+KIND_TEXT = "text"
+KIND_DATE = "date"
+KIND_DATETIME = "datetime"
+
+COMPARISONS = {
+    "eq": operator.eq,
+    "ne": operator.ne,
+    "lt": operator.lt,
+    "lte": operator.le,
+    "gt": operator.gt,
+    "gte": operator.ge,
+}
+NULL_CHECKS = ("is_null", "not_null")
+OPERATORS = (*COMPARISONS, "in", "between", "prefix", *NULL_CHECKS)
+ORDERED_OPERATORS = ("lt", "lte", "gt", "gte", "between")
+
+
+class InvalidFilterError(Exception):
+    pass
+
+
+def column_kind(dtype: Any) -> str:
+    """Kind of values a pandas column holds, which decides the filter values it can be compared with."""
+    if isinstance(dtype, pd.ArrowDtype) and pa.types.is_date(dtype.pyarrow_dtype):
+        return KIND_DATE
+    if pd.api.types.is_datetime64_any_dtype(dtype):
+        return KIND_DATETIME
+    if pd.api.types.is_bool_dtype(dtype):
+        return KIND_BOOL
+    if pd.api.types.is_numeric_dtype(dtype) and not isinstance(dtype, pd.CategoricalDtype):
+        return KIND_NUMBER
+    return KIND_TEXT
+
+
+def stats_kind(stats: Dict[str, Any], read_dtype: Optional[str]) -> str:
+    """Kind of a column from its upload-time statistics and read schema dtype, before any data is loaded."""
+    if read_dtype == DATE_DTYPE:
+        return KIND_DATE
+    if read_dtype == DATETIME_DTYPE:
+        return KIND_DATETIME
+    if stats["dtype"] == "bool":
+        return KIND_BOOL
+    if stats["dtype"].startswith(("int", "uint", "float", "double", "halffloat", "decimal")):
+        return KIND_NUMBER
+    return KIND_TEXT
+
+
+def _coerce(kind: str, column: str, value: Any) -> Any:
+    """`value` as it compares with values of `kind`, or InvalidFilterError if it can not."""
+    if kind == KIND_NUMBER and isinstance(value, (int, float)) and not isinstance(value, bool):
+        return value
+    if kind == KIND_BOOL and isinstance(value, bool):
+        return value
+    if kind == KIND_TEXT and isinstance(value, str):
+        return value
+    if kind in (KIND_DATE, KIND_DATETIME) and isinstance(value, str):
+        try:
+            timestamp = pd.Timestamp(value)
+        except ValueError:
+            timestamp = None
+        if timestamp is not None and timestamp is not pd.NaT:
+            if kind == KIND_DATETIME:
+                return timestamp.tz_localize(None) if timestamp.tzinfo is None else timestamp.tz_convert(None)
+            if timestamp == timestamp.normalize():
+                return timestamp.date()
+    expected = {KIND_NUMBER: "a number", KIND_BOOL: "true or false", KIND_TEXT: "a string",
+                KIND_DATE: "a date (YYYY-MM-DD)", KIND_DATETIME: "a timestamp (YYYY-MM-DD HH:MM:SS)"}[kind]
+    raise InvalidFilterError(f"Filter value {orjson.dumps(value).decode()} for column '{column}' must be {expected}")
+
+
+@dataclass
+class Condition:
+    """
+    One comparison of a column with a value: `{"column": ..., "op": ..., "value": ...}`. `kind` is
+    the column's kind when it is known from its statistics, otherwise it is taken from the data.
+    """
+    column: str
+    op: str
+    value: Any = None
+    kind: Optional[str] = None
+
+    def columns(self) -> List[str]:
+        return [self.column]
+
+    def check(self, kind: str) -> Any:
+        """Validate the operator and value against a column of `kind` and return the value coerced to it."""
+        if self.op in NULL_CHECKS:
+            return None
+        if self.op == "prefix" and kind != KIND_TEXT:
+            raise InvalidFilterError(f"Filter 'prefix' requires a text column, '{self.column}' is not")
+        if self.op in ORDERED_OPERATORS and kind == KIND_BOOL:
+            raise InvalidFilterError(f"Filter '{self.op}' can not be applied to true/false column '{self.column}'")
+        if self.op == "in":
+            return [_coerce(kind, self.column, value) for value in self.value]
+        if self.op == "between":
+            return tuple(_coerce(kind, self.column, value) for value in self.value)
+        return _coerce(kind, self.column, self.value)
+
+    def evaluate(self, df: pd.DataFrame) -> np.ndarray:
+        values = df[self.column]
+        return _evaluate(values, self.op, self.check(self.kind or column_kind(values.dtype)))
+
+    def prune_reason(self, column_stats: Dict[str, Dict[str, Any]], kinds: Dict[str, str]) -> Optional[str]:
+        """Why no row can match according to the column's statistics, or None if some may."""
+        stats = column_stats.get(self.column)
+        if stats is None:
+            return None
+        if self.op == "is_null" and not stats["null_count"]:
+            return f"column '{self.column}' has no nulls"
+        if self.op != "not_null" and not stats["count"]:
+            return f"column '{self.column}' only contains nulls"
+        # Dates and timestamps are profiled as text, so only numbers and text have comparable bounds.
+        if kinds.get(self.column) not in (KIND_NUMBER, KIND_TEXT) or stats["min"] is None:
+            return None
+        low, high = stats["min"], stats["max"]
+        value = self.check(kinds[self.column])
+        outside = {
+            "eq": lambda: value < low or value > high,
+            "in": lambda: all(item < low or item > high for item in value),
+            "lt": lambda: value <= low,
+            "lte": lambda: value < low,
+            "gt": lambda: value >= high,
+            "gte": lambda: value > high,
+            "between": lambda: value[0] > value[1] or value[1] < low or value[0] > high,
+        }.get(self.op)
+        if outside is not None and outside():
+            return f"no value of column '{self.column}' is within the range of filter '{self.op}'"
+        return None
+
+    def explain(self) -> Dict[str, Any]:
+        explained = {"column": self.column, "op": self.op}
+        if self.op not in NULL_CHECKS:
+            explained["value"] = self.value
+        return explained
+
+
+@dataclass
+class Group:
+    """Conditions or nested groups combined with `and` or `or`: `{"and": [...]}`."""
+    op: str
+    children: List[Union["Group", Condition]]
+
+    def columns(self) -> List[str]:
+        return [column for child in self.children for column in child.columns()]
+
+    def evaluate(self, df: pd.DataFrame) -> np.ndarray:
+        combine = np.logical_and if self.op == "and" else np.logical_or
+        mask = self.children[0].evaluate(df)
+        for child in self.children[1:]:
+            # Every condition is a vectorized pass over its column; the masks are combined in place.
+            combine(mask, child.evaluate(df), out=mask)
+        return mask
+
+    def prune_reason(self, column_stats: Dict[str, Dict[str, Any]], kinds: Dict[str, str]) -> Optional[str]:
+        reasons = [child.prune_reason(column_stats, kinds) for child in self.children]
+        if self.op == "and":
+            return next((reason for reason in reasons if reason is not None), None)
+        return "; ".join(reasons) if all(reasons) else None
+
+    def explain(self) -> Dict[str, Any]:
+        return {self.op: [child.explain() for child in self.children]}
+
+
+FilterExpression = Union[Group, Condition]
+
+
+def parse_filter(data: Any, column_names: List[str]) -> FilterExpression:
+    """
+    Parse a filter expression, checking its structure, operators and columns. A condition is
+    `{"column": "price", "op": "gte", "value": 10}`; `in` takes a list of values, `between` a
+    `[low, high]` pair (both inclusive) and `is_null`/`not_null` no value. Conditions are grouped
+    with `{"and": [...]}` and `{"or": [...]}`, which nest.
+    """
+    known_columns = set(column_names)
+    conditions = 0
+
+    def parse(node: Any) -> FilterExpression:
+        nonlocal conditions
+        if not isinstance(node, dict):
+            raise InvalidFilterError("Filter expressions must be objects")
+        if len(node) == 1 and next(iter(node)) in ("and", "or"):
+            op, children = next(iter(node.items()))
+            if not isinstance(children, list) or not children:
+                raise InvalidFilterError(f"Filter group '{op}' requires a non-empty list")
+            return Group(op, [parse(child) for child in children])
+        unknown_keys = set(node) - {"column", "op", "value"}
+        if unknown_keys or "column" not in node or "op" not in node:
+            raise InvalidFilterError(
+                "Filter conditions are objects with 'column', 'op' and 'value', groups are {'and': [...]} or {'or': [...]}"
+            )
+        column, op, value = node["column"], node["op"], node.get("value")
+        if column not in known_columns:
+            raise InvalidFilterError(f"Invalid filter column name: {column}")
+        if op not in OPERATORS:
+            raise InvalidFilterError(f"Invalid filter operator '{op}', expected one of: {', '.join(OPERATORS)}")
+        if op in NULL_CHECKS:
+            if value is not None:
+                raise InvalidFilterError(f"Filter '{op}' takes no value")
+        elif op == "in":
+            if not isinstance(value, list) or not value:
+                raise InvalidFilterError("Filter 'in' requires a non-empty list of values")
+        elif op == "between":
+            if not isinstance(value, list) or len(value) != 2:
+                raise InvalidFilterError("Filter 'between' requires a [low, high] pair of values")
+        elif value is None or isinstance(value, (list, dict)):
+            raise InvalidFilterError(f"Filter '{op}' requires a single value")
+        conditions += 1
+        if conditions > MAX_FILTER_CONDITIONS:
+            raise InvalidFilterError(f"Filters are limited to {MAX_FILTER_CONDITIONS} conditions")
+        return Condition(column, op, value)
+
+    return parse(data)
+
+
+def check_filter(expression: FilterExpression, kinds: Dict[str, str]) -> None:
+    """Validate the values of every condition on a column whose kind is known, before loading any data."""
+    if isinstance(expression, Group):
+        for child in expression.children:
+            check_filter(child, kinds)
+    elif expression.column in kinds:
+        expression.kind = kinds[expression.column]
+        expression.check(expression.kind)
+
+
+def normalize_filter(data: Any) -> Optional[str]:
+    """Canonical text of a filter expression as sent, for cache keys and cursor fingerprints."""
+    return None if data is None else orjson.dumps(data, option=orjson.OPT_SORT_KEYS).decode()
+
+
+def _to_mask(result: Any) -> np.ndarray:
+    if isinstance(result, pd.Series):
+        result = result.array
+    if isinstance(result, pd.api.extensions.ExtensionArray):
+        return result.to_numpy(dtype=bool, na_value=False)
+    return np.asarray(result, dtype=bool)
+
+
+def _compare(values: Any, op: str, value: Any) -> np.ndarray:
+    if op == "between":
+        return _to_mask(values >= value[0]) & _to_mask(values <= value[1])
+    return _to_mask(COMPARISONS[op](values, value))
+
+
+def _evaluate(values: pd.Series, op: str, value: Any) -> np.ndarray:
+    """Vectorized mask of the rows of `values` satisfying `op value`. Nulls only satisfy `is_null`."""
+    if op == "is_null":
+        return values.isna().to_numpy()
+    if op == "not_null":
+        return values.notna().to_numpy()
+    if isinstance(values.dtype, pd.CategoricalDtype):
+        # Compare the distinct values once and look the rows up by their codes; code -1 (null) never matches.
+        matches = _evaluate(pd.Series(values.cat.categories), op, value)
+        return np.append(matches, False)[values.cat.codes.to_numpy()]
+    present = values.notna().to_numpy()
+    if op == "in":
+        return _to_mask(values.isin(value)) & present
+    if op == "prefix":
+        return _to_mask(values.str.startswith(value, na=False))
+    if values.dtype == object:
+        # Object columns hold NaN for nulls, which does not compare with text; compare the other rows.
+        mask = np.zeros(len(values), dtype=bool)
+        mask[present] = _compare(values.to_numpy()[present], op, value)
+        return mask
+    return _compare(values, op, value) & present
@@ -0,0 +1,266 @@
+import asyncio
+import hashlib
+import logging
+import os
+import uuid
+from collections import Counter, defaultdict
+from functools import lru_cache, partial
+from itertools import chain
+from typing import Dict, Hashable, List, Optional, Set, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.config import SORT_INDEX_THRESHOLD
+from src.file_management.storage import CSV_ENCODING, artifact_dir, load_dataframe
+
+logger = logging.getLogger(__name__)
+
+TRIGRAM_SIZE = 3
+
+
+class InvalidIndexColumnError(Exception):
+    pass
+
+
+class TrigramIndex:
+    """
+    Inverted index from every 3-character substring of a text column to the sorted rows containing it.
+
+    Postings are stored in CSR form: `keys` is sorted, and the rows for `keys[i]` are
+    `postings[offsets[i]:offsets[i + 1]]`.
+    """
+
+    def __init__(self, keys: np.ndarray, offsets: np.ndarray, postings: np.ndarray, row_count: int):
+        self.keys = keys
+        self.offsets = offsets
+        self.postings = postings
+        self.row_count = row_count
+
+    @classmethod
+    def build(cls, values: pd.Series) -> "TrigramIndex":
+        rows_by_gram = defaultdict(list)
+        for row, value in enumerate(values):
+            if isinstance(value, str):
+                for gram in {value[i:i + TRIGRAM_SIZE] for i in range(len(value) - TRIGRAM_SIZE + 1)}:
+                    rows_by_gram[gram].append(row)
+        keys = sorted(rows_by_gram)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum([len(rows_by_gram[key]) for key in keys])
+        postings = np.fromiter(chain.from_iterable(rows_by_gram[key] for key in keys), dtype=np.int64, count=offsets[-1])
+        return cls(np.array(keys, dtype=f"<U{TRIGRAM_SIZE}"), offsets, postings, len(values))
+
+    def extend(self, values: pd.Series) -> "TrigramIndex":
+        """
+        A new index of this index's rows followed by `values`. Only the new rows are tokenized; the
+        postings of both are merged per trigram with vectorized gathers, new rows after the old ones.
+        """
+        added = TrigramIndex.build(values)
+        keys = np.union1d(self.keys, added.keys)
+        counts = []
+        for index in (self, added):
+            index_counts = np.zeros(len(keys), dtype=np.int64)
+            index_counts[np.searchsorted(keys, index.keys)] = np.diff(index.offsets)
+            counts.append(index_counts)
+        offsets = np.zeros(len(keys) + 1, dtype=np.int64)
+        offsets[1:] = np.cumsum(counts[0] + counts[1])
+        postings = np.empty(offsets[-1], dtype=np.int64)
+        for index, start, row_offset in ((self, offsets[:-1], 0), (added, offsets[:-1] + counts[0], self.row_count)):
+            key_counts = np.diff(index.offsets)
+            positions = np.repeat(start[np.searchsorted(keys, index.keys)] - index.offsets[:-1], key_counts)
+            postings[positions + np.arange(len(index.postings))] = index.postings + row_offset
+        return TrigramIndex(keys, offsets, postings, self.row_count + added.row_count)
+
+    @classmethod
+    def load(cls, path: str) -> "TrigramIndex":
+        with np.load(path, allow_pickle=False) as data:
+            return cls(data["keys"], data["offsets"], data["postings"], int(data["row_count"]))
+
+    def save(self, path: str) -> None:
+        temp_path = f"{path}.{uuid.uuid4().hex}.part"
+        with open(temp_path, "wb") as f:
+            np.savez(f, keys=self.keys, offsets=self.offsets, postings=self.postings, row_count=self.row_count)
+        os.replace(temp_path, path)
+
+    def candidates(self, needle: str) -> Optional[np.ndarray]:
+        """
+        Return the sorted rows that contain every trigram of `needle`, a superset of the rows
+        containing `needle` itself. Returns None when the needle is too short to use the index.
+        """
+        grams = {needle[i:i + TRIGRAM_SIZE] for i in range(len(needle) - TRIGRAM_SIZE + 1)}
+        if not grams:
+            return None
+        postings = []
+        for gram in grams:
+            position = np.searchsorted(self.keys, gram)
+            if position == len(self.keys) or self.keys[position] != gram:
+                return np.empty(0, dtype=np.int64)
+            postings.append(self.postings[self.offsets[position]:self.offsets[position + 1]])
+        postings.sort(key=len)
+        rows = postings[0]
+        for other in postings[1:]:
+            rows = np.intersect1d(rows, other, assume_unique=True)
+            if not len(rows):
+                break
+        return rows
+
+
+def trigram_index_path(file_name: str, column: str) -> str:
+    column_digest = hashlib.sha1(column.encode()).hexdigest()[:16]
+    return os.path.join(artifact_dir(file_name), f"trigrams.{column_digest}.npz")
+
+
+@lru_cache(maxsize=64)
+def _load_trigram_index(path: str, mtime: float) -> TrigramIndex:
+    return TrigramIndex.load(path)
+
+
+def load_trigram_index(path: str) -> Optional[TrigramIndex]:
+    try:
+        mtime = os.path.getmtime(path)
+    except FileNotFoundError:
+        return None
+    return _load_trigram_index(path, mtime)
+
+
+def build_trigram_indexes(file_name: str, columns: List[str]) -> None:
+    os.makedirs(artifact_dir(file_name), exist_ok=True)
+    for column in columns:
+        values = load_dataframe(file_name, [column])[column]
+        if not pd.api.types.is_object_dtype(values.dtype):
+            raise InvalidIndexColumnError(f"Column '{column}' does not contain text values and can not be indexed")
+        TrigramIndex.build(values).save(trigram_index_path(file_name, column))
+
+
+def extend_trigram_indexes(file_name: str, appended_file_name: str, columns: List[str]) -> None:
+    """
+    Build the trigram indexes of `appended_file_name`, which holds the rows of `file_name` followed
+    by more, from those of `file_name` by indexing only the added rows.
+    """
+    os.makedirs(artifact_dir(appended_file_name), exist_ok=True)
+    for column in columns:
+        index = load_trigram_index(trigram_index_path(file_name, column))
+        if index is None:
+            build_trigram_indexes(appended_file_name, [column])
+            continue
+        values = load_dataframe(appended_file_name, [column])[column]
+        index.extend(values.iloc[index.row_count:]).save(trigram_index_path(appended_file_name, column))
+
+
+class SortIndex:
+    """
+    Precomputed order of a column: `perm` is its stable ascending argsort with nulls last and
+    `ranks` holds each row's dense rank (NaN for nulls), so sorting on the column becomes a gather
+    and multi-key sorts compare small numbers instead of the original values.
+    """
+
+    def __init__(self, perm: np.ndarray, ranks: np.ndarray):
+        self.perm = perm
+        self.ranks = ranks
+
+    @property
+    def row_count(self) -> int:
+        return len(self.perm)
+
+    @classmethod
+    def build(cls, values: pd.Series) -> "SortIndex":
+        try:
+            codes, _ = pd.factorize(values, sort=True)
+        except TypeError:
+            raise InvalidIndexColumnError(f"Column '{values.name}' mixes types that can not be sorted")
+        null_last_codes = np.where(codes < 0, codes.max(initial=0) + 1, codes)
+        ranks = codes.astype(np.float64)
+        ranks[codes < 0] = np.nan
+        return cls(np.argsort(null_last_codes, kind="stable"), ranks)
+
+    @classmethod
+    def load(cls, path: str) -> "SortIndex":
+        return cls(np.load(f"{path}.perm.npy", mmap_mode="r"), np.load(f"{path}.ranks.npy", mmap_mode="r"))
+
+    def save(self, path: str) -> None:
+        for suffix, array in (("ranks", self.ranks), ("perm", self.perm)):
+            temp_path = f"{path}.{uuid.uuid4().hex}.part"
+            with open(temp_path, "wb") as f:
+                np.save(f, array)
+            os.replace(temp_path, f"{path}.{suffix}.npy")
+
+
+def sort_index_path(file_name: str, column: str, version: Hashable) -> str:
+    """Path prefix of a column's sort index. The version is part of it so a replaced file never reuses it."""
+    column_digest = hashlib.sha1(column.encode()).hexdigest()[:16]
+    version_digest = hashlib.sha1(str(version).encode()).hexdigest()[:16]
+    return os.path.join(artifact_dir(file_name), f"sort.{column_digest}.{version_digest}")
+
+
+@lru_cache(maxsize=64)
+def _load_sort_index(path: str, mtime: float) -> SortIndex:
+    return SortIndex.load(path)
+
+
+def load_sort_index(path: str) -> Optional[SortIndex]:
+    try:
+        mtime = os.path.getmtime(f"{path}.perm.npy")
+    except FileNotFoundError:
+        return None
+    return _load_sort_index(path, mtime)
+
+
+def build_sort_indexes(
+        file_name: str,
+        columns: List[str],
+        version: Hashable,
+        schema: Optional[Dict[str, str]] = None,
+        encoding: str = CSV_ENCODING,
+) -> None:
+    """Build sort indexes over columns typed as queries read them, with the dataset's read schema and encoding."""
+    os.makedirs(artifact_dir(file_name), exist_ok=True)
+    for column in columns:
+        values = load_dataframe(file_name, [column], schema, encoding)[column]
+        SortIndex.build(values).save(sort_index_path(file_name, column, version))
+
+
+class SortIndexTracker:
+    """
+    Counts how often each column of a dataset is sorted on and builds its sort index in the
+    background once it has been sorted `threshold` times. A threshold of 0 disables this.
+    """
+
+    def __init__(self, threshold: int):
+        self.threshold = threshold
+        self._counts: Counter = Counter()
+        self._building: Set[Tuple[str, str, Hashable]] = set()
+
+    def record(
+            self,
+            file_name: str,
+            version: Hashable,
+            columns: List[str],
+            schema: Optional[Dict[str, str]] = None,
+            encoding: str = CSV_ENCODING,
+    ) -> None:
+        if self.threshold <= 0:
+            return
+        for column in columns:
+            key = (file_name, column, version)
+            self._counts[key] += 1
+            if self._counts[key] < self.threshold or key in self._building:
+                continue
+            if os.path.exists(f"{sort_index_path(file_name, column, version)}.perm.npy"):
+                continue
+            self._building.add(key)
+            future = asyncio.get_running_loop().run_in_executor(
+                None, build_sort_indexes, file_name, [column], version, schema, encoding
+            )
+            future.add_done_callback(partial(self._build_done, key))
+
+    def forget(self, file_name: str) -> None:
+        for key in [key for key in self._counts if key[0] == file_name]:
+            del self._counts[key]
+
+    def _build_done(self, key: Tuple[str, str, Hashable], future: asyncio.Future) -> None:
+        self._building.discard(key)
+        if future.exception() is not None:
+            logger.warning("Could not build a sort index for column '%s' of '%s'", key[1], key[0], exc_info=future.exception())
+
+
+sort_index_tracker = SortIndexTracker(SORT_INDEX_THRESHOLD)
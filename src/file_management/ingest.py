@@ -0,0 +1,589 @@
+import codecs
+import csv
+import hashlib
+import io
+import logging
+import os
+import tarfile
+import uuid
+import zipfile
+from dataclasses import dataclass
+from functools import partial
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Sequence, Tuple
+
+import pyarrow as pa
+
+from src.config import DATASET_COMPRESSION, MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE
+from src.file_management.indexes import (
+    InvalidIndexColumnError, build_sort_indexes, build_trigram_indexes, extend_trigram_indexes, sort_index_path,
+    trigram_index_path
+)
+from src.file_management.schemas import FileInfoInDB
+from src.file_management.stats import ColumnProfiler, load_sketches
+from src.file_management.storage import (
+    COMPRESSION_NONE, CSV_ENCODING, DatasetWriter, append_sidecar, blob_key, build_sidecar, dataset_path,
+    dataset_version, detect_compression, iter_dataset_file, link_blob, read_sidecar_schema, remove_dataset, sidecar_path,
+    storage_key
+)
+from src.metrics import DATASET_BYTES_WRITTEN
+
+logger = logging.getLogger(__name__)
+
+ARCHIVE_SUFFIXES = (".zip", ".tar", ".tar.gz", ".tgz")
+
+
+class UploadTooLargeError(Exception):
+    def __init__(self, max_size: int):
+        super().__init__(f"File exceeds the maximum upload size of {max_size} bytes.")
+        self.max_size = max_size
+
+
+class DatasetExistsError(Exception):
+    def __init__(self, destination: str):
+        super().__init__(f"File '{os.path.basename(destination)}' already exists")
+        self.destination = destination
+
+
+class InvalidArchiveError(Exception):
+    pass
+
+
+class InvalidAppendError(Exception):
+    pass
+
+
+@dataclass
+class IngestResult:
+    content_hash: str
+    file_size: int
+    row_count: int
+    column_names: List[str]
+    stored_size: Optional[int] = None
+    compression: str = COMPRESSION_NONE
+    reused: bool = False
+    encoding: str = CSV_ENCODING
+
+
+UTF8_BOM = codecs.BOM_UTF8
+# Bytes cp1252 leaves undefined; text containing any of them is decoded as latin1.
+CP1252_UNDEFINED = (b"\x81", b"\x8d", b"\x8f", b"\x90", b"\x9d")
+
+
+class CsvScanner:
+    """
+    Computes the sha256, header, row count and encoding of a CSV fed to it chunk by chunk. Text is
+    UTF-8 (`utf-8-sig` with a byte order mark) if it all decodes as such, else cp1252, the usual
+    encoding of spreadsheet exports, unless it contains bytes cp1252 does not define, else latin1.
+    """
+
+    def __init__(self):
+        self._hash = hashlib.sha256()
+        self._size = 0
+        self._line_breaks = 0
+        self._in_quotes = False
+        self._ends_with_line_break = False
+        self._header_buffer = bytearray()
+        self._header_complete = False
+        self._utf8_decoder: Optional[codecs.IncrementalDecoder] = codecs.getincrementaldecoder("utf-8")()
+        self._cp1252 = True
+
+    @property
+    def size(self) -> int:
+        return self._size
+
+    @property
+    def header(self) -> Optional[bytes]:
+        """Bytes of the header record, line break included, once all of it has been fed."""
+        length = _header_length(bytes(self._header_buffer)) if self._header_complete else None
+        return None if length is None else bytes(self._header_buffer[:length])
+
+    def update(self, chunk: bytes) -> None:
+        if not chunk:
+            return
+        self._size += len(chunk)
+        self._hash.update(chunk)
+        self._count_line_breaks(chunk)
+        self._ends_with_line_break = chunk.endswith(b"\n")
+        self._detect_encoding(chunk)
+        if not self._header_complete:
+            self._header_buffer += chunk
+            self._header_complete = self._line_breaks > 0
+
+    def result(self) -> IngestResult:
+        records = self._line_breaks + (0 if self._ends_with_line_break or not self._size else 1)
+        encoding = self._encoding()
+        return IngestResult(
+            content_hash=self._hash.hexdigest(),
+            file_size=self._size,
+            row_count=max(records - 1, 0),
+            column_names=next(csv.reader(io.StringIO(self._header_buffer.decode(encoding, errors="replace"))), []),
+            encoding=encoding,
+        )
+
+    def _detect_encoding(self, chunk: bytes) -> None:
+        if self._utf8_decoder is not None:
+            try:
+                self._utf8_decoder.decode(chunk)
+            except UnicodeDecodeError:
+                self._utf8_decoder = None
+        if self._cp1252 and any(byte in chunk for byte in CP1252_UNDEFINED):
+            self._cp1252 = False
+
+    def _encoding(self) -> str:
+        if self._utf8_decoder is not None:
+            try:
+                self._utf8_decoder.decode(b"", final=True)
+            except UnicodeDecodeError:
+                self._utf8_decoder = None
+            else:
+                return "utf-8-sig" if self._header_buffer.startswith(UTF8_BOM) else "utf-8"
+        return "cp1252" if self._cp1252 else CSV_ENCODING
+
+    def _count_line_breaks(self, chunk: bytes) -> None:
+        # Line breaks inside quoted fields do not end a record. Splitting on quotes leaves the
+        # unquoted parts at every other index, so the scan stays in C even for quote-heavy data.
+        parts = chunk.split(b'"')
+        first_unquoted = 1 if self._in_quotes else 0
+        self._line_breaks += sum(part.count(b"\n") for part in parts[first_unquoted::2])
+        if len(parts) % 2 == 0:
+            self._in_quotes = not self._in_quotes
+
+
+def _link_into_place(path: str, destination: str) -> None:
+    try:
+        os.link(path, destination)
+    except FileExistsError:
+        raise DatasetExistsError(destination)
+    os.remove(path)
+
+
+class CsvIngestor:
+    """
+    Writes a CSV to disk chunk by chunk, computing its sha256, header and row count in the same pass.
+    The stored copy is compressed as configured by `DATASET_COMPRESSION`; the hash, size and row
+    count always describe the raw CSV.
+
+    Data goes to a hidden temp file next to the destination and is only linked into place by
+    `commit`, so readers never see a partially written dataset and two concurrent uploads of the
+    same name can not overwrite each other. Methods are blocking and are meant
+    to be called off the event loop.
+    """
+
+    def __init__(self, destination: str, max_size: int = MAX_UPLOAD_SIZE, compression: str = DATASET_COMPRESSION):
+        self.destination = destination
+        self.max_size = max_size
+        directory, file_name = os.path.split(destination)
+        self.temp_path = os.path.join(directory, f".{file_name}.{uuid.uuid4().hex}.part")
+        self._writer = DatasetWriter(self.temp_path, compression)
+        self._scanner = CsvScanner()
+
+    def write(self, chunk: bytes) -> None:
+        if self._scanner.size + len(chunk) > self.max_size:
+            raise UploadTooLargeError(self.max_size)
+        self._scanner.update(chunk)
+        self._writer.write(chunk)
+
+    def commit(self) -> IngestResult:
+        self._writer.close()
+        _link_into_place(self.temp_path, self.destination)
+        result = self._scanner.result()
+        result.stored_size = self._writer.stored_size
+        result.compression = self._writer.compression
+        DATASET_BYTES_WRITTEN.inc(result.stored_size)
+        return result
+
+    def abort(self) -> None:
+        self._writer.discard()
+        if os.path.exists(self.temp_path):
+            os.remove(self.temp_path)
+
+
+def read_csv_header(path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> List[str]:
+    """
+    Column names of a CSV, decoded as `CsvScanner` decodes them on ingest. A plain ASCII header reads
+    the same in every candidate encoding; any other depends on the whole file, which is then scanned.
+    """
+    scanner = CsvScanner()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            scanner.update(chunk)
+            header = scanner.header
+            if header is not None and header.isascii():
+                break
+    return scanner.result().column_names
+
+
+def adopt_file(
+        path: str,
+        destination: str,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+        compression: str = DATASET_COMPRESSION,
+) -> IngestResult:
+    """
+    Scan a CSV that was already written elsewhere, e.g. assembled from resumable upload chunks, and
+    move it to `destination`. With compression enabled it is compressed into place in the same pass.
+    """
+    if compression != COMPRESSION_NONE:
+        with open(path, "rb") as f:
+            ingest_result = ingest_fileobj(f, destination, os.path.getsize(path), chunk_size, compression)
+        os.remove(path)
+        return ingest_result
+    scanner = CsvScanner()
+    with open(path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            scanner.update(chunk)
+    _link_into_place(path, destination)
+    result = scanner.result()
+    result.stored_size = result.file_size
+    return result
+
+
+def ingest_fileobj(
+        fileobj: BinaryIO,
+        destination: str,
+        max_size: int = MAX_UPLOAD_SIZE,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+        compression: str = DATASET_COMPRESSION,
+) -> IngestResult:
+    ingestor = CsvIngestor(destination, max_size, compression)
+    try:
+        while chunk := fileobj.read(chunk_size):
+            ingestor.write(chunk)
+        return ingestor.commit()
+    except BaseException:
+        ingestor.abort()
+        raise
+
+
+def store_dataset(
+        file_name: str,
+        fileobj: BinaryIO,
+        max_size: int = MAX_UPLOAD_SIZE,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> IngestResult:
+    """
+    Store `fileobj` as dataset `file_name`, sharing the blob of identical content. A seekable source
+    is hashed first, and if its content is already stored the dataset is only linked to that blob,
+    without writing or compressing anything.
+    """
+    destination = dataset_path(file_name)
+    if fileobj.seekable():
+        start = fileobj.tell()
+        scanner = CsvScanner()
+        while chunk := fileobj.read(chunk_size):
+            if scanner.size + len(chunk) > max_size:
+                raise UploadTooLargeError(max_size)
+            scanner.update(chunk)
+        result = scanner.result()
+        blob_path = dataset_path(blob_key(result.content_hash))
+        try:
+            os.link(blob_path, destination)
+        except FileExistsError:
+            raise DatasetExistsError(destination)
+        except FileNotFoundError:
+            fileobj.seek(start)
+        else:
+            result.stored_size = os.path.getsize(blob_path)
+            result.compression = detect_compression(blob_path) or COMPRESSION_NONE
+            result.reused = True
+            return result
+    result = ingest_fileobj(fileobj, destination, max_size, chunk_size)
+    result.reused = link_blob(file_name, result.content_hash)
+    return result
+
+
+def ingest_member(file_name: str, opener: Callable[[], BinaryIO]) -> IngestResult:
+    """
+    Store the file returned by `opener`, such as an archive member, as dataset `file_name`. Members
+    are written straight away, as seeking back in a compressed archive means decompressing it again.
+    """
+    with opener() as fileobj:
+        result = ingest_fileobj(fileobj, dataset_path(file_name))
+    result.reused = link_blob(file_name, result.content_hash)
+    return result
+
+
+def discard_dataset(file_name: str, ingest_result: IngestResult) -> None:
+    """Remove a dataset that will not be registered, with its blob unless that was already stored."""
+    os.remove(dataset_path(file_name))
+    if not ingest_result.reused:
+        remove_dataset(blob_key(ingest_result.content_hash))
+
+
+def check_index_columns(column_names: List[str], index_columns: Sequence[str], sort_columns: Sequence[str]) -> None:
+    for column in [*index_columns, *sort_columns]:
+        if column not in column_names:
+            raise InvalidIndexColumnError(f"Invalid index column name: {column}")
+
+
+def profile_dataset(
+        file_name: str,
+        content_hash: str,
+        encoding: str = CSV_ENCODING,
+) -> Tuple[Optional[Dict[str, str]], Optional[Dict[str, Dict[str, Any]]], Optional[Dict[str, str]]]:
+    """
+    Build the Parquet sidecar of a stored dataset, profiling its columns in the same pass, and
+    return its column types, statistics and read schema, or None for all if it can not be converted.
+    """
+    key = blob_key(content_hash)
+    profiler = ColumnProfiler()
+    try:
+        column_types = build_sidecar(dataset_path(key), sidecar_path(key), profiler.update, encoding)
+    except pa.ArrowException:
+        logger.warning("Could not build a Parquet sidecar for '%s', it will be served from CSV", file_name, exc_info=True)
+        return None, None, None
+    profiler.save_sketches(key)
+    return column_types, profiler.finish(), profiler.read_schema()
+
+
+def index_dataset(
+        content_hash: str,
+        index_columns: Sequence[str],
+        sort_columns: Sequence[str],
+        read_schema: Optional[Dict[str, str]] = None,
+        encoding: str = CSV_ENCODING,
+) -> None:
+    """
+    Build the trigram and sort indexes of a stored dataset that its blob does not have yet. Sort
+    indexes are built over the columns as read with `read_schema`, the way queries sort them.
+    """
+    key = blob_key(content_hash)
+    build_trigram_indexes(key, [
+        column for column in index_columns if not os.path.exists(trigram_index_path(key, column))
+    ])
+    build_sort_indexes(key, [
+        column for column in sort_columns
+        if not os.path.exists(f"{sort_index_path(key, column, content_hash)}.perm.npy")
+    ], content_hash, read_schema, encoding)
+
+
+def dataset_values(
+        file_name: str,
+        ingest_result: IngestResult,
+        column_types: Optional[Dict[str, str]],
+        column_stats: Optional[Dict[str, Dict[str, Any]]],
+        index_columns: Sequence[str],
+        read_schema: Optional[Dict[str, str]] = None,
+) -> Dict[str, Any]:
+    """The `file_info` values of a stored and profiled dataset."""
+    return {
+        "file_name": file_name,
+        "blob_hash": ingest_result.content_hash,
+        "column_names": ingest_result.column_names,
+        "content_hash": ingest_result.content_hash,
+        "file_size": ingest_result.file_size,
+        "stored_size": ingest_result.stored_size,
+        "compression": ingest_result.compression,
+        "row_count": ingest_result.row_count,
+        "column_types": column_types,
+        "indexed_columns": list(index_columns),
+        "column_stats": column_stats,
+        "encoding": ingest_result.encoding,
+        "read_schema": read_schema,
+    }
+
+
+def derive_dataset(
+        file_name: str,
+        ingest_result: IngestResult,
+        index_columns: Sequence[str] = (),
+        sort_columns: Sequence[str] = (),
+        existing: Optional[FileInfoInDB] = None,
+) -> Dict[str, Any]:
+    """
+    Build everything derived from a stored dataset (Parquet sidecar, column statistics, search and
+    sort indexes) and return its `file_info` values. Artifacts belong to the dataset's blob, so for
+    content that is already stored, as `existing`, only the indexes it does not have yet are built.
+    The dataset is removed again if the requested index columns are invalid.
+    """
+    index_columns = list(dict.fromkeys(index_columns))
+    sort_columns = list(dict.fromkeys(sort_columns))
+    try:
+        check_index_columns(ingest_result.column_names, index_columns, sort_columns)
+        if existing is not None:
+            column_types, column_stats, read_schema = existing.column_types, existing.column_stats, existing.read_schema
+        else:
+            column_types, column_stats, read_schema = profile_dataset(
+                file_name, ingest_result.content_hash, ingest_result.encoding
+            )
+        index_dataset(ingest_result.content_hash, index_columns, sort_columns, read_schema, ingest_result.encoding)
+    except InvalidIndexColumnError:
+        discard_dataset(file_name, ingest_result)
+        raise
+    return dataset_values(file_name, ingest_result, column_types, column_stats, index_columns, read_schema)
+
+
+def _header_length(data: bytes) -> Optional[int]:
+    """Length in bytes of the header record `data` starts with, line break included, or None if it is not complete."""
+    position = 0
+    for number, part in enumerate(data.split(b'"')):
+        # Parts at even positions are outside quotes, where a line break ends the record.
+        line_break = part.find(b"\n") if number % 2 == 0 else -1
+        if line_break >= 0:
+            return position + line_break + 1
+        position += len(part) + 1
+    return None
+
+
+def _row_encoding(encoding: str) -> str:
+    # Rows after the header never start with a byte order mark.
+    return "utf-8" if encoding == "utf-8-sig" else encoding
+
+
+def store_appended_dataset(
+        file: FileInfoInDB,
+        csv_path: str,
+        temp_name: str,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> Tuple[IngestResult, IngestResult]:
+    """
+    Store the content of `file` followed by the rows of the CSV at `csv_path` as dataset `temp_name`,
+    linked to the blob of that content, and return its ingest result with the scan of the CSV. The
+    CSV's header must be the file's columns; rows in another encoding are transcoded to the file's.
+
+    Blobs are shared and never modified, so the stored content is copied as it is, compressed or
+    not, and the rows are written after it in the same format. The content hash, size and row count
+    describe the whole dataset.
+    """
+    appended = CsvScanner()
+    header = bytearray()
+    header_length = None
+    with open(csv_path, "rb") as f:
+        while chunk := f.read(chunk_size):
+            appended.update(chunk)
+            if header_length is None:
+                header += chunk
+                header_length = _header_length(header)
+    appended_result = appended.result()
+    if appended_result.column_names != file.column_names:
+        raise InvalidAppendError(
+            f"Columns of the appended rows must be those of '{file.file_name}': {', '.join(file.column_names)}"
+        )
+    if not appended_result.row_count:
+        raise InvalidAppendError("There are no rows to append.")
+
+    file_encoding = file.encoding or CSV_ENCODING
+    rows_encoding, file_rows_encoding = _row_encoding(appended_result.encoding), _row_encoding(file_encoding)
+    transcode = codecs.lookup(rows_encoding).name != codecs.lookup(file_rows_encoding).name
+    stored_path = dataset_path(storage_key(file))
+    compression = detect_compression(stored_path) or COMPRESSION_NONE
+    temp_path = dataset_path(temp_name)
+    writer = DatasetWriter(temp_path, compression)
+    scanner = CsvScanner()
+
+    def write(chunk: bytes) -> None:
+        scanner.update(chunk)
+        writer.write(chunk)
+
+    try:
+        last_chunk = b""
+        for last_chunk in iter_dataset_file(storage_key(file), chunk_size):
+            scanner.update(last_chunk)
+            if compression == COMPRESSION_NONE:
+                writer.write(last_chunk)
+        if compression != COMPRESSION_NONE:
+            writer.copy_stored(stored_path, chunk_size)
+        if last_chunk and not last_chunk.endswith(b"\n"):
+            write(b"\n")
+        decoder = codecs.getincrementaldecoder(rows_encoding)()
+        encoder = codecs.getincrementalencoder(file_rows_encoding)()
+        with open(csv_path, "rb") as f:
+            f.seek(header_length)
+            while chunk := f.read(chunk_size):
+                write(encoder.encode(decoder.decode(chunk)) if transcode else chunk)
+        if transcode:
+            write(encoder.encode(decoder.decode(b"", final=True), final=True))
+        writer.close()
+    except BaseException as e:
+        writer.discard()
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+        if isinstance(e, UnicodeEncodeError):
+            raise InvalidAppendError(f"The appended rows contain characters the file's encoding, {file_encoding}, can not represent.")
+        raise
+    DATASET_BYTES_WRITTEN.inc(writer.stored_size)
+
+    result = scanner.result()
+    result.column_names = file.column_names
+    result.compression = compression
+    result.encoding = file_encoding
+    result.reused = link_blob(temp_name, result.content_hash)
+    result.stored_size = os.path.getsize(dataset_path(blob_key(result.content_hash)))
+    return result, appended_result
+
+
+def profile_appended_dataset(
+        file: FileInfoInDB,
+        content_hash: str,
+        csv_path: str,
+        encoding: str,
+) -> Tuple[Optional[Dict[str, str]], Optional[Dict[str, Dict[str, Any]]], Optional[Dict[str, str]]]:
+    """
+    Like `profile_dataset` for the dataset stored by `store_appended_dataset`, but only the appended
+    rows of the CSV at `csv_path`, in `encoding`, are converted and profiled: the sidecar gets them
+    as a new segment, and the file's statistics and distinct-count sketches are updated with them.
+    The dataset is profiled from scratch when the file has no sidecar or the rows do not fit its types.
+    """
+    key, appended_key = storage_key(file), blob_key(content_hash)
+    schema, sketches = read_sidecar_schema(key), load_sketches(key)
+    if (
+            schema is None or sketches is None or file.column_stats is None
+            or any(name not in file.column_stats or name not in sketches for name in schema.names)
+    ):
+        return profile_dataset(file.file_name, content_hash, file.encoding or CSV_ENCODING)
+    profiler = ColumnProfiler.resume(schema, file.column_stats, sketches, file.read_schema)
+    try:
+        column_types = append_sidecar(key, appended_key, csv_path, profiler.update, encoding)
+    except pa.ArrowException:
+        logger.info("Rows appended to '%s' do not fit the types of its sidecar, which is rebuilt", file.file_name)
+        return profile_dataset(file.file_name, content_hash, file.encoding or CSV_ENCODING)
+    profiler.save_sketches(appended_key)
+    return column_types, profiler.finish(), profiler.read_schema()
+
+
+def index_appended_dataset(
+        file: FileInfoInDB,
+        content_hash: str,
+        read_schema: Optional[Dict[str, str]] = None,
+        encoding: str = CSV_ENCODING,
+) -> None:
+    """
+    Build the indexes `file` has for the dataset stored by `store_appended_dataset`. Trigram indexes
+    are extended with the appended rows; sort indexes are rebuilt, as new values shift every rank,
+    over the columns as read with the appended dataset's `read_schema`.
+    """
+    key, appended_key, version = storage_key(file), blob_key(content_hash), dataset_version(file)
+    extend_trigram_indexes(key, appended_key, [
+        column for column in file.indexed_columns or []
+        if not os.path.exists(trigram_index_path(appended_key, column))
+    ])
+    build_sort_indexes(appended_key, [
+        column for column in file.column_names
+        if os.path.exists(f"{sort_index_path(key, column, version)}.perm.npy")
+        and not os.path.exists(f"{sort_index_path(appended_key, column, content_hash)}.perm.npy")
+    ], content_hash, read_schema, encoding)
+
+
+def is_archive(file_name: str) -> bool:
+    return file_name.lower().endswith(ARCHIVE_SUFFIXES)
+
+
+def list_archive_members(fileobj: BinaryIO, archive_name: str) -> List[Tuple[str, Callable[[], BinaryIO]]]:
+    """
+    Return the CSV members of a zip or tar archive as (file name, opener) pairs, named after their
+    base name. Directories, hidden files and other members are skipped. Zip members can be read
+    concurrently; tar members share one stream and have to be read one at a time, in order.
+    """
+    try:
+        if archive_name.lower().endswith(".zip"):
+            archive = zipfile.ZipFile(fileobj)
+            members = [(info.filename, partial(archive.open, info)) for info in archive.infolist() if not info.is_dir()]
+        else:
+            archive = tarfile.open(fileobj=fileobj)
+            members = [(info.name, partial(archive.extractfile, info)) for info in archive.getmembers() if info.isfile()]
+    except (zipfile.BadZipFile, tarfile.TarError, EOFError) as e:
+        raise InvalidArchiveError(f"Invalid archive '{archive_name}': {e}")
+    return [
+        (os.path.basename(name), opener) for name, opener in members
+        if os.path.basename(name).lower().endswith(".csv") and not os.path.basename(name).startswith(".")
+    ]
@@ -0,0 +1,358 @@
+import asyncio
+import logging
+import os
+import socket
+import time
+import uuid
+from contextlib import AbstractAsyncContextManager
+from dataclasses import asdict
+from datetime import timedelta
+from functools import partial
+from typing import Any, BinaryIO, Callable, Dict, List, Optional
+
+from sqlalchemy import and_, func, insert, or_, select, update
+from sqlalchemy.exc import IntegrityError
+from sqlalchemy.ext.asyncio import AsyncSession
+
+from src.config import (
+    INGEST_INDEX_CONCURRENCY, INGEST_JOB_DIR, INGEST_JOB_LEASE, INGEST_MAX_ATTEMPTS, INGEST_PROFILE_CONCURRENCY,
+    INGEST_REGISTER_CONCURRENCY, INGEST_RETRY_BACKOFF, INGEST_STORE_CONCURRENCY, MAX_UPLOAD_SIZE, UPLOAD_CHUNK_SIZE
+)
+from src.file_management.indexes import InvalidIndexColumnError
+from src.file_management.ingest import (
+    DatasetExistsError, IngestResult, UploadTooLargeError, check_index_columns, dataset_values, index_dataset,
+    profile_dataset, store_dataset
+)
+from src.file_management.models import ingest_job
+from src.file_management.storage import dataset_path
+from src.file_management.utils import discard_dataset_db, get_file_db, register_file_db
+from src.metrics import observe_stage
+from src.profiling import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+JOB_QUEUED = "queued"
+JOB_RUNNING = "running"
+JOB_SUCCEEDED = "succeeded"
+JOB_FAILED = "failed"
+
+STAGE_PENDING = "pending"
+STAGE_RUNNING = "running"
+STAGE_RETRYING = "retrying"
+STAGE_SUCCEEDED = "succeeded"
+STAGE_FAILED = "failed"
+
+STAGE_STORE = "store"
+STAGE_PROFILE = "profile"
+STAGE_INDEX = "index"
+STAGE_REGISTER = "register"
+STAGES = (STAGE_STORE, STAGE_PROFILE, STAGE_INDEX, STAGE_REGISTER)
+
+# Failures that would only happen again; everything else is retried.
+PERMANENT_ERRORS = (DatasetExistsError, InvalidIndexColumnError, UploadTooLargeError)
+
+SessionFactory = Callable[[], AbstractAsyncContextManager]
+
+# Lease times come from the database clock, so workers on different hosts agree on them.
+DB_NOW = func.timezone("UTC", func.now())
+
+
+def job_data_path(job_id: str) -> str:
+    return os.path.join(INGEST_JOB_DIR, f"{job_id}.csv")
+
+
+def stage_upload(
+        fileobj: BinaryIO,
+        job_id: str,
+        max_size: int = MAX_UPLOAD_SIZE,
+        chunk_size: int = UPLOAD_CHUNK_SIZE,
+) -> str:
+    """Copy an upload to the job directory and fsync it, so it survives a restart until it is ingested."""
+    path = job_data_path(job_id)
+    os.makedirs(INGEST_JOB_DIR, exist_ok=True)
+    size = 0
+    try:
+        with open(path, "wb") as f:
+            while chunk := fileobj.read(chunk_size):
+                size += len(chunk)
+                if size > max_size:
+                    raise UploadTooLargeError(max_size)
+                f.write(chunk)
+            f.flush()
+            os.fsync(f.fileno())
+    except BaseException:
+        remove_job_data(job_id)
+        raise
+    return path
+
+
+def remove_job_data(job_id: str) -> None:
+    path = job_data_path(job_id)
+    if os.path.exists(path):
+        os.remove(path)
+
+
+async def create_job_db(
+        job_id: str,
+        file_name: str,
+        options: Dict[str, Any],
+        session: AsyncSession,
+        owner: Optional[str] = None,
+) -> None:
+    """
+    Record a queued job, leased to `owner` if given so no other worker takes it over. Raises
+    IntegrityError if another job for the same file name is still in progress.
+    """
+    stages = {
+        stage: {"status": STAGE_PENDING, "attempts": 0, "duration_ms": None, "error": None} for stage in STAGES
+    }
+    await session.execute(insert(ingest_job).values(
+        id=job_id, file_name=file_name, status=JOB_QUEUED, stages=stages, options=options, state={},
+        owner=owner, heartbeat=None if owner is None else DB_NOW,
+    ))
+    await session.commit()
+
+
+async def get_job_db(job_id: str, session: AsyncSession) -> Optional[Dict[str, Any]]:
+    result = await session.execute(select(ingest_job).where(ingest_job.c.id == job_id))
+    job = result.mappings().fetchone()
+    return None if job is None else dict(job)
+
+
+def job_info(job: Dict[str, Any]) -> Dict[str, Any]:
+    """Status of a job as reported by the API: overall status, the current stage and every stage's attempts and timing."""
+    stages = job["stages"]
+    return {
+        "job_id": job["id"],
+        "file_name": job["file_name"],
+        "status": job["status"],
+        "stage": job["stage"],
+        "progress": sum(stages[stage]["status"] == STAGE_SUCCEEDED for stage in STAGES) / len(STAGES),
+        "file_id": job["file_id"],
+        "error": job["error"],
+        "created_time": str(job["created_time"]),
+        "updated_time": str(job["updated_time"]),
+        "stages": [{"name": stage, **stages[stage]} for stage in STAGES],
+    }
+
+
+class IngestPipeline:
+    """
+    Ingests uploaded files in the background, one task per job going through `STAGES` in order:
+    store (hash, deduplicate and compress into place), profile (sidecar and statistics), index
+    and register. Every stage has its own concurrency limit, so a burst of uploads can only take
+    so many threads away from queries. Failed stages are retried with exponential backoff
+    unless the failure is permanent.
+
+    The job row is updated whenever a stage starts or ends, together with what later stages need,
+    so a job interrupted by a restart is resumed after its last completed stage by `recover`.
+
+    A worker runs a job only after claiming it with a conditional update of its row, and renews
+    the claim every third of `lease` seconds while the job runs. Other workers take a job over only
+    once its lease has expired, so a job runs once however many workers recover it.
+    """
+
+    def __init__(self, concurrency: Dict[str, int], max_attempts: int, retry_backoff: float, lease: float):
+        self.concurrency = concurrency
+        self.max_attempts = max_attempts
+        self.retry_backoff = retry_backoff
+        self.lease = lease
+        self.worker_id = f"{socket.gethostname()}:{os.getpid()}:{uuid.uuid4().hex[:8]}"
+        self._limits = {stage: asyncio.Semaphore(limit) for stage, limit in concurrency.items()}
+        self._tasks: Dict[str, asyncio.Task] = {}
+        self._runners = {
+            STAGE_STORE: self._store,
+            STAGE_PROFILE: self._profile,
+            STAGE_INDEX: self._index,
+            STAGE_REGISTER: self._register,
+        }
+
+    def submit(self, job_id: str, sessions: SessionFactory) -> None:
+        """Start running a job; `sessions` opens the database sessions it uses."""
+        if job_id in self._tasks:
+            return
+        self._tasks[job_id] = asyncio.create_task(self._run(job_id, sessions))
+        self._tasks[job_id].add_done_callback(partial(self._forget, job_id))
+
+    async def wait(self, job_id: str) -> None:
+        """Wait until a job submitted by this process has finished. Cancelling the wait does not cancel the job."""
+        task = self._tasks.get(job_id)
+        if task is not None:
+            await asyncio.wait([task])
+
+    async def recover(self, sessions: SessionFactory) -> List[str]:
+        """
+        Claim the queued or running jobs no live worker holds, e.g. because the service stopped, and
+        resubmit them. Returns the ids of the jobs this worker claimed.
+        """
+        async with sessions() as session:
+            job_ids = await self._claim(session)
+        for job_id in job_ids:
+            self.submit(job_id, sessions)
+        return job_ids
+
+    async def watch(self, sessions: SessionFactory) -> None:
+        """Background task calling `recover` once per lease, taking over the jobs of workers that stopped."""
+        while True:
+            try:
+                await self.recover(sessions)
+            except Exception:
+                logger.exception("Recovering ingestion jobs failed")
+            await asyncio.sleep(self.lease)
+
+    def shutdown(self) -> None:
+        for task in self._tasks.values():
+            task.cancel()
+
+    def _forget(self, job_id: str, task: asyncio.Task) -> None:
+        self._tasks.pop(job_id, None)
+        if not task.cancelled() and task.exception() is not None:
+            logger.error("Ingestion job %s crashed", job_id, exc_info=task.exception())
+
+    async def _claim(self, session: AsyncSession, *conditions: Any) -> List[str]:
+        """
+        Lease the matching jobs that are unowned, already leased to this worker or whose lease has
+        expired, and return their ids. Concurrent claims of a row are serialized by its lock and the
+        loser sees the renewed lease, so only one worker gets each job.
+        """
+        claimable = or_(
+            ingest_job.c.owner.is_(None),
+            ingest_job.c.owner == self.worker_id,
+            ingest_job.c.heartbeat.is_(None),
+            ingest_job.c.heartbeat < DB_NOW - timedelta(seconds=self.lease),
+        )
+        result = await session.execute(
+            update(ingest_job)
+            .where(and_(ingest_job.c.status.in_([JOB_QUEUED, JOB_RUNNING]), claimable, *conditions))
+            .values(status=JOB_RUNNING, owner=self.worker_id, heartbeat=DB_NOW)
+            .returning(ingest_job.c.id)
+        )
+        job_ids = list(result.scalars())
+        await session.commit()
+        return job_ids
+
+    async def _heartbeat(self, job_id: str, sessions: SessionFactory) -> None:
+        while True:
+            await asyncio.sleep(self.lease / 3)
+            async with sessions() as session:
+                await session.execute(
+                    update(ingest_job)
+                    .where(ingest_job.c.id == job_id, ingest_job.c.owner == self.worker_id)
+                    .values(heartbeat=DB_NOW)
+                )
+                await session.commit()
+
+    async def _run(self, job_id: str, sessions: SessionFactory) -> None:
+        async with sessions() as session:
+            if not await self._claim(session, ingest_job.c.id == job_id):
+                return
+            heartbeat = asyncio.create_task(self._heartbeat(job_id, sessions))
+            try:
+                job = await get_job_db(job_id, session)
+                stages, state = job["stages"], job["state"] or {}
+                for stage in STAGES:
+                    if stages[stage]["status"] == STAGE_SUCCEEDED:
+                        continue
+                    error = await self._run_stage(session, job, stage, state)
+                    if error is not None:
+                        await self._fail(session, job, state, error)
+                        return
+                await self._update(session, job_id, status=JOB_SUCCEEDED, stage=None, file_id=state["file_id"])
+            finally:
+                heartbeat.cancel()
+        remove_job_data(job_id)
+
+    async def _run_stage(self, session: AsyncSession, job: Dict[str, Any], stage: str, state: Dict[str, Any]) -> Optional[str]:
+        """Run a stage until it succeeds or runs out of attempts, and return the error it failed with, if any."""
+        record = job["stages"][stage]
+        while True:
+            record.update(status=STAGE_RUNNING, attempts=record["attempts"] + 1)
+            await self._update(session, job["id"], stage=stage, stages=job["stages"])
+            started = time.perf_counter()
+            try:
+                async with self._limits[stage]:
+                    await self._runners[stage](session, job, state)
+            except PERMANENT_ERRORS as e:
+                error, retry = str(e), False
+            except Exception as e:
+                logger.warning("Stage '%s' of ingestion job %s failed", stage, job["id"], exc_info=True)
+                await session.rollback()
+                error, retry = f"{type(e).__name__}: {e}", record["attempts"] < self.max_attempts
+            else:
+                error = None
+            duration = time.perf_counter() - started
+            observe_stage("ingest", stage, duration)
+            record["duration_ms"] = round(duration * 1000, 3)
+            record["error"] = error
+            if error is None:
+                record["status"] = STAGE_SUCCEEDED
+                await self._update(session, job["id"], stages=job["stages"], state=state)
+                return None
+            if not retry:
+                record["status"] = STAGE_FAILED
+                return error
+            record["status"] = STAGE_RETRYING
+            await self._update(session, job["id"], stages=job["stages"])
+            await asyncio.sleep(self.retry_backoff * 2 ** (record["attempts"] - 1))
+
+    async def _fail(self, session: AsyncSession, job: Dict[str, Any], state: Dict[str, Any], error: str) -> None:
+        if "ingest" in state:
+            await discard_dataset_db(job["file_name"], state["ingest"]["content_hash"], session=session)
+        await self._update(session, job["id"], status=JOB_FAILED, stages=job["stages"], error=error)
+        remove_job_data(job["id"])
+
+    async def _update(self, session: AsyncSession, job_id: str, **values: Any) -> None:
+        await session.execute(update(ingest_job).where(ingest_job.c.id == job_id).values(**values))
+        await session.commit()
+
+    async def _store(self, session: AsyncSession, job: Dict[str, Any], state: Dict[str, Any]) -> None:
+        with open(job_data_path(job["id"]), "rb") as f:
+            ingest_result = await run_in_threadpool(store_dataset, job["file_name"], f)
+        state["ingest"] = asdict(ingest_result)
+
+    async def _profile(self, session: AsyncSession, job: Dict[str, Any], state: Dict[str, Any]) -> None:
+        ingest_result = IngestResult(**state["ingest"])
+        existing = None
+        if ingest_result.reused:
+            existing = await get_file_db(blob_hash=ingest_result.content_hash, session=session)
+        if existing is not None:
+            column_types, column_stats, read_schema = existing.column_types, existing.column_stats, existing.read_schema
+        else:
+            column_types, column_stats, read_schema = await run_in_threadpool(
+                profile_dataset, job["file_name"], ingest_result.content_hash, ingest_result.encoding
+            )
+        state["profile"] = {"column_types": column_types, "column_stats": column_stats, "read_schema": read_schema}
+
+    async def _index(self, session: AsyncSession, job: Dict[str, Any], state: Dict[str, Any]) -> None:
+        ingest_result = IngestResult(**state["ingest"])
+        index_columns, sort_columns = job["options"]["index_columns"], job["options"]["sort_columns"]
+        check_index_columns(ingest_result.column_names, index_columns, sort_columns)
+        await run_in_threadpool(
+            index_dataset, ingest_result.content_hash, index_columns, sort_columns,
+            state["profile"].get("read_schema"), ingest_result.encoding,
+        )
+
+    async def _register(self, session: AsyncSession, job: Dict[str, Any], state: Dict[str, Any]) -> None:
+        file_values = dataset_values(
+            job["file_name"], IngestResult(**state["ingest"]), state["profile"]["column_types"],
+            state["profile"]["column_stats"], job["options"]["index_columns"], state["profile"].get("read_schema"),
+        )
+        try:
+            state["file_id"] = await register_file_db(file_values, session=session)
+        except IntegrityError:
+            # The name was registered by another upload meanwhile; the dataset has already been removed.
+            del state["ingest"]
+            raise DatasetExistsError(dataset_path(job["file_name"]))
+
+
+ingest_pipeline = IngestPipeline(
+    {
+        STAGE_STORE: INGEST_STORE_CONCURRENCY,
+        STAGE_PROFILE: INGEST_PROFILE_CONCURRENCY,
+        STAGE_INDEX: INGEST_INDEX_CONCURRENCY,
+        STAGE_REGISTER: INGEST_REGISTER_CONCURRENCY,
+    },
+    INGEST_MAX_ATTEMPTS,
+    INGEST_RETRY_BACKOFF,
+    INGEST_JOB_LEASE,
+)
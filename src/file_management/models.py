@@ -1,14 +1,60 @@
 from datetime import datetime
 
-from sqlalchemy import Table, Column, Integer, String, TIMESTAMP, ARRAY
+from sqlalchemy import Table, Column, ForeignKey, Index, Integer, BigInteger, String, TIMESTAMP, ARRAY, JSON, text
 
 from src.database import metadata
 
+blob = Table(
+    'blob',
+    metadata,
+    Column('content_hash', String(64), primary_key=True),
+    Column('ref_count', Integer, nullable=False),
+    Column('created_time', TIMESTAMP, default=datetime.utcnow),
+)
+
 file_info = Table(
     'file_info',
     metadata,
     Column('id', Integer, primary_key=True),
     Column('file_name', String, nullable=False),
     Column('uploaded_time', TIMESTAMP, default=datetime.utcnow),
-    Column('column_names', ARRAY(String))
+    Column('column_names', ARRAY(String)),
+    Column('content_hash', String(64)),
+    Column('file_size', BigInteger),
+    Column('stored_size', BigInteger),
+    Column('compression', String),
+    Column('row_count', BigInteger),
+    Column('column_types', JSON),
+    Column('indexed_columns', ARRAY(String)),
+    Column('column_stats', JSON),
+    Column('blob_hash', String(64), ForeignKey('blob.content_hash')),
+    Column('encoding', String),
+    Column('read_schema', JSON),
+    Column('version', Integer, nullable=False, server_default='1'),
+    Index('ix_file_info_file_name', 'file_name', unique=True),
+    Index('ix_file_info_file_name_pattern', 'file_name', postgresql_ops={'file_name': 'varchar_pattern_ops'}),
+    Index('ix_file_info_uploaded_time', 'uploaded_time', 'id'),
+    Index('ix_file_info_blob_hash', 'blob_hash'),
+)
+
+ingest_job = Table(
+    'ingest_job',
+    metadata,
+    Column('id', String(32), primary_key=True),
+    Column('file_name', String, nullable=False),
+    Column('status', String, nullable=False),
+    Column('stage', String),
+    Column('stages', JSON),
+    Column('options', JSON),
+    Column('state', JSON),
+    Column('error', String),
+    Column('file_id', Integer),
+    Column('owner', String),
+    Column('heartbeat', TIMESTAMP),
+    Column('created_time', TIMESTAMP, default=datetime.utcnow),
+    Column('updated_time', TIMESTAMP, default=datetime.utcnow, onupdate=datetime.utcnow),
+    Index(
+        'ix_ingest_job_active_file_name', 'file_name', unique=True,
+        postgresql_where=text("status IN ('queued', 'running')"),
+    ),
 )
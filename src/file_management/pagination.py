@@ -0,0 +1,38 @@
+import base64
+import binascii
+import hashlib
+import json
+from typing import Any, Hashable
+
+
+class InvalidCursorError(Exception):
+    pass
+
+
+def query_fingerprint(*parts: Any) -> str:
+    return hashlib.sha1(json.dumps(parts, default=str).encode()).hexdigest()[:16]
+
+
+def encode_cursor(offset: int, version: Hashable, fingerprint: str) -> str:
+    payload = json.dumps({"o": offset, "v": version, "q": fingerprint}, separators=(",", ":"))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str, version: Hashable, fingerprint: str) -> int:
+    """
+    Return the offset stored in a cursor issued for the same query over the same dataset version.
+
+    Offsets are exact because a given dataset version is immutable and sorting is stable.
+    """
+    try:
+        payload = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        offset, cursor_version, cursor_fingerprint = payload["o"], payload["v"], payload["q"]
+    except (binascii.Error, ValueError, KeyError, TypeError):
+        raise InvalidCursorError("Malformed cursor.")
+    if cursor_fingerprint != fingerprint:
+        raise InvalidCursorError("Cursor was issued for a different query.")
+    if cursor_version != version:
+        raise InvalidCursorError("Cursor is no longer valid, the file has changed.")
+    if not isinstance(offset, int) or offset < 0:
+        raise InvalidCursorError("Malformed cursor.")
+    return offset
@@ -0,0 +1,345 @@
+import re
+import time
+from dataclasses import dataclass, field
+from typing import Any, Dict, List, Optional, Tuple
+
+import numpy as np
+import pandas as pd
+
+from src.file_management.filters import (
+    FilterExpression, InvalidFilterError, check_filter, normalize_filter, parse_filter, stats_kind
+)
+from src.file_management.indexes import load_sort_index, load_trigram_index
+from src.file_management.serializers import SERIALIZERS, text_values
+
+SELECTIVITY_SAMPLE_ROWS = 1024
+
+OUTPUT_FRAME = "frame"
+OUTPUT_NONE = "none"
+
+
+class InvalidQueryError(Exception):
+    pass
+
+
+@dataclass
+class ContainsPredicate:
+    column: str
+    value: str
+    regex: bool = False
+    index_path: Optional[str] = None
+    estimated_selectivity: Optional[float] = None
+    index_used: bool = False
+
+    def evaluate(self, values: pd.Series) -> np.ndarray:
+        if not isinstance(values.dtype, pd.CategoricalDtype):
+            # Dates and timestamps are matched against the text they were read from.
+            values = text_values(values)
+        if self.regex and isinstance(values.dtype, pd.StringDtype):
+            # Arrow-backed text is matched with RE2; keep Python's regex syntax and errors.
+            values = values.astype(object)
+        try:
+            return values.str.contains(self.value, regex=self.regex, na=False).to_numpy(dtype=bool)
+        except AttributeError:
+            raise InvalidQueryError(f"Filter column '{self.column}' does not contain text values")
+        except re.error as e:
+            raise InvalidQueryError(f"Invalid filter pattern '{self.value}': {e}")
+
+    def index_candidates(self, row_count: int) -> Optional[np.ndarray]:
+        """Rows that may match according to the column's trigram index, or None if it can not help."""
+        if self.regex or self.index_path is None:
+            return None
+        index = load_trigram_index(self.index_path)
+        if index is None or index.row_count != row_count:
+            return None
+        return index.candidates(self.value)
+
+    def explain(self) -> Dict[str, Any]:
+        return {
+            "column": self.column,
+            "contains": self.value,
+            "regex": self.regex,
+            "index_used": self.index_used,
+            "estimated_selectivity": self.estimated_selectivity,
+        }
+
+
+@dataclass
+class QueryPlan:
+    read_columns: Optional[List[str]]
+    output_columns: Optional[List[str]]
+    filters: List[ContainsPredicate] = field(default_factory=list)
+    where: Optional[FilterExpression] = None
+    sort_by: List[str] = field(default_factory=list)
+    ascending: List[bool] = field(default_factory=list)
+    sort_index_paths: Dict[str, str] = field(default_factory=dict)
+    sort_index_used: bool = False
+    pruned_by: Optional[str] = None
+
+    @property
+    def read_columns_key(self) -> Optional[Tuple[str, ...]]:
+        return None if self.read_columns is None else tuple(sorted(self.read_columns))
+
+    def explain(self) -> Dict[str, Any]:
+        return {
+            "read_columns": self.read_columns,
+            "output_columns": self.output_columns,
+            "filters": [predicate.explain() for predicate in self.filters],
+            "where": None if self.where is None else self.where.explain(),
+            "sort": [
+                {"column": column, "order": "asc" if ascending else "desc"}
+                for column, ascending in zip(self.sort_by, self.ascending)
+            ],
+            "sort_index_used": self.sort_index_used,
+            "pruned_by": self.pruned_by,
+        }
+
+
+def normalize_query(
+        columns: Optional[List[str]] = None,
+        sort_by: Optional[List[str]] = None,
+        sort_orders: Optional[List[str]] = None,
+        filter_by: Optional[List[str]] = None,
+        filter_values: Optional[List[str]] = None,
+        filter_regex: bool = False,
+        where: Any = None,
+) -> Tuple:
+    """
+    Canonical, hashable form of a query: default sort orders are spelled out and filters, which
+    are all ANDed together, are sorted, so equivalent requests share cache entries and cursors.
+    """
+    sort_by = list(sort_by or [])
+    sort_orders = [str(getattr(sort_order, "value", sort_order)) for sort_order in sort_orders or []]
+    filters = sorted(zip(filter_by or [], filter_values or []))
+    return (
+        tuple(columns or ()),
+        tuple(zip(sort_by, sort_orders or ["asc"] * len(sort_by))),
+        tuple(filters),
+        filter_regex,
+        normalize_filter(where),
+    )
+
+
+def plan_query(
+        column_names: List[str],
+        columns: Optional[List[str]] = None,
+        sort_by: Optional[List[str]] = None,
+        sort_orders: Optional[List[str]] = None,
+        filter_by: Optional[List[str]] = None,
+        filter_values: Optional[List[str]] = None,
+        filter_regex: bool = False,
+        index_paths: Optional[Dict[str, str]] = None,
+        sort_index_paths: Optional[Dict[str, str]] = None,
+        column_stats: Optional[Dict[str, Dict[str, Any]]] = None,
+        where: Any = None,
+        read_schema: Optional[Dict[str, str]] = None,
+) -> QueryPlan:
+    """
+    Validate a fetch_data query against the file header and decide which columns have to be read.
+
+    Only the projected, sorted and filtered columns are read when a projection is given. Filter
+    order is decided later by `execute_plan`, once the data is available to estimate selectivity.
+    `index_paths` maps columns to their trigram index, which literal filters use to skip rows, and
+    `sort_index_paths` maps sort columns to where their precomputed sort index would be.
+
+    `where` is a typed filter expression (see `parse_filter`), ANDed with the text filters. With
+    the upload-time `column_stats` and `read_schema` its values are checked against the column
+    types. With `column_stats`, filters on non-text columns are rejected and filters that can not
+    match any row are detected up front; such plans have `pruned_by` set and need no data.
+    """
+    known_columns = set(column_names)
+    for column in columns or []:
+        if column not in known_columns:
+            raise InvalidQueryError(f"Invalid column name: {column}")
+    for column in sort_by or []:
+        if column not in known_columns:
+            raise InvalidQueryError(f"Invalid sort column name: '{column}'")
+    for column in filter_by or []:
+        if column not in known_columns:
+            raise InvalidQueryError(f"Invalid filter column name: {column}")
+
+    index_paths = index_paths or {}
+    filters = [
+        ContainsPredicate(column, value, regex=filter_regex, index_path=index_paths.get(column))
+        for column, value in zip(filter_by or [], filter_values or [])
+    ]
+    pruned_by = None
+    for predicate in filters:
+        stats = (column_stats or {}).get(predicate.column)
+        if stats is None:
+            continue
+        if stats["dtype"] != "string":
+            raise InvalidQueryError(f"Filter column '{predicate.column}' does not contain text values")
+        if pruned_by is None:
+            pruned_by = _prune_reason(predicate, stats)
+
+    expression = None
+    if where is not None:
+        kinds = {
+            column: stats_kind(stats, (read_schema or {}).get(column)) for column, stats in (column_stats or {}).items()
+        }
+        try:
+            expression = parse_filter(where, column_names)
+            check_filter(expression, kinds)
+            if pruned_by is None and column_stats:
+                pruned_by = expression.prune_reason(column_stats, kinds)
+        except InvalidFilterError as e:
+            raise InvalidQueryError(str(e))
+
+    sort_by = list(sort_by or [])
+    ascending = [sort_order != "desc" for sort_order in sort_orders] if sort_orders else [True] * len(sort_by)
+
+    read_columns = None
+    if columns:
+        filter_columns = [predicate.column for predicate in filters] + (expression.columns() if expression else [])
+        read_columns = list(dict.fromkeys([*columns, *sort_by, *filter_columns]))
+    return QueryPlan(
+        read_columns=read_columns,
+        output_columns=list(dict.fromkeys(columns)) if columns else None,
+        filters=filters,
+        where=expression,
+        sort_by=sort_by,
+        ascending=ascending,
+        sort_index_paths=sort_index_paths or {},
+        pruned_by=pruned_by,
+    )
+
+
+def _prune_reason(predicate: ContainsPredicate, stats: Dict[str, Any]) -> Optional[str]:
+    if not stats["count"]:
+        return f"column '{predicate.column}' only contains nulls"
+    if not predicate.regex and len(predicate.value) > stats.get("max_length", len(predicate.value)):
+        return f"'{predicate.value}' is longer than every value of column '{predicate.column}'"
+    return None
+
+
+def _estimate_selectivity(df: pd.DataFrame, predicate: ContainsPredicate) -> float:
+    step = max(len(df) // SELECTIVITY_SAMPLE_ROWS, 1)
+    sample = df[predicate.column].iloc[::step]
+    if sample.empty:
+        return 1.0
+    return float(predicate.evaluate(sample).mean())
+
+
+def _sort_with_indexes(df: pd.DataFrame, mask: Optional[np.ndarray], plan: QueryPlan) -> Optional[np.ndarray]:
+    """
+    Return the positions of the selected rows in sorted order using persisted sort indexes, or None
+    when no sort key has a usable one. A single ascending key is a pure gather from the permutation;
+    otherwise indexed keys are replaced by their ranks and only those small arrays are sorted.
+    """
+    sort_indexes = []
+    for column in plan.sort_by:
+        path = plan.sort_index_paths.get(column)
+        sort_index = load_sort_index(path) if path else None
+        sort_indexes.append(sort_index if sort_index is not None and sort_index.row_count == len(df) else None)
+    if not any(sort_indexes):
+        return None
+    plan.sort_index_used = True
+
+    if len(plan.sort_by) == 1 and plan.ascending[0]:
+        perm = sort_indexes[0].perm
+        return np.asarray(perm) if mask is None else perm[mask[perm]]
+
+    rows = np.arange(len(df)) if mask is None else np.flatnonzero(mask)
+    keys = pd.DataFrame({
+        position: sort_index.ranks[rows] if sort_index is not None else df[column].to_numpy()[rows]
+        for position, (column, sort_index) in enumerate(zip(plan.sort_by, sort_indexes))
+    })
+    order = keys.sort_values(by=list(keys.columns), ascending=plan.ascending, kind="stable").index.to_numpy()
+    return rows[order]
+
+
+def execute_plan(df: pd.DataFrame, plan: QueryPlan) -> Tuple[pd.DataFrame, Dict[str, Any]]:
+    """
+    Run a plan: filters first, folded into a single boolean mask; then a stable sort of the
+    surviving rows, through persisted sort indexes when there are any; then the output projection.
+
+    The typed `where` expression is compiled into vectorized comparisons over whole columns and
+    goes first. Text filters follow, most selective first, and each only evaluates the rows that
+    are still candidates, narrowed further by the column's trigram index when there is one.
+    """
+    stats: Dict[str, Any] = {"rows_scanned": len(df)}
+
+    started = time.perf_counter()
+    mask = None
+    if plan.where is not None:
+        try:
+            mask = plan.where.evaluate(df)
+        except InvalidFilterError as e:
+            raise InvalidQueryError(str(e))
+    candidates_by_predicate = {}
+    for predicate in plan.filters:
+        candidates = predicate.index_candidates(len(df))
+        if candidates is None:
+            predicate.estimated_selectivity = _estimate_selectivity(df, predicate)
+        else:
+            predicate.index_used = True
+            predicate.estimated_selectivity = len(candidates) / max(len(df), 1)
+            candidates_by_predicate[id(predicate)] = candidates
+    plan.filters.sort(key=lambda predicate: predicate.estimated_selectivity)
+
+    for predicate in plan.filters:
+        values = df[predicate.column]
+        rows = candidates_by_predicate.get(id(predicate))
+        if mask is not None:
+            remaining = np.flatnonzero(mask)
+            rows = remaining if rows is None else np.intersect1d(remaining, rows, assume_unique=True)
+        if rows is None:
+            mask = predicate.evaluate(values)
+            continue
+        mask = np.zeros(len(df), dtype=bool)
+        if len(rows):
+            mask[rows] = predicate.evaluate(values.iloc[rows])
+    stats["filter_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    stats["rows_matched"] = len(df) if mask is None else int(mask.sum())
+
+    started = time.perf_counter()
+    order = _sort_with_indexes(df, mask, plan) if plan.sort_by else None
+    if order is not None:
+        df = df.take(order)
+    else:
+        if mask is not None:
+            df = df[mask]
+        if plan.sort_by:
+            df = df.sort_values(by=plan.sort_by, ascending=plan.ascending, kind="stable")
+    stats["sort_ms"] = round((time.perf_counter() - started) * 1000, 3)
+
+    if plan.output_columns is not None:
+        df = df[plan.output_columns]
+    return df, stats
+
+
+@dataclass
+class QueryResult:
+    total_count: int
+    end: int
+    plan: Dict[str, Any]
+    stats: Dict[str, Any]
+    body: Optional[bytes] = None
+    page: Optional[pd.DataFrame] = None
+
+
+def run_query(df: pd.DataFrame, plan: QueryPlan, offset: int, limit: Optional[int], output: str) -> QueryResult:
+    """
+    Execute a plan, cut the requested page and render it.
+
+    This is the CPU-bound part of fetch_data and runs on the query executor. `output` selects what
+    is handed back: the page serialized in one of the `SERIALIZERS` formats, the page itself for
+    streaming, or nothing for explain.
+    """
+    df, stats = execute_plan(df, plan)
+    total_count = len(df)
+    end = total_count if limit is None else min(offset + limit, total_count)
+    result = QueryResult(total_count=total_count, end=end, plan=plan.explain(), stats=stats)
+    if output == OUTPUT_NONE:
+        return result
+
+    page = df.iloc[offset:end]
+    if output == OUTPUT_FRAME:
+        result.page = page
+        return result
+
+    started = time.perf_counter()
+    result.body = SERIALIZERS[output](page)
+    stats["serialize_ms"] = round((time.perf_counter() - started) * 1000, 3)
+    return result
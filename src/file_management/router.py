@@ -1,18 +1,66 @@
-import csv
+import asyncio
 import json
 import os
-from typing import List, Optional
+import tarfile
+import time
+import uuid
+import zipfile
+import zlib
+from contextlib import asynccontextmanager
+from functools import partial
+from typing import Any, BinaryIO, Callable, Dict, List, Optional, Tuple
 
+import orjson
 import pandas as pd
-from fastapi import APIRouter, UploadFile, HTTPException, status, Depends
-from fastapi.responses import JSONResponse
+from fastapi import APIRouter, UploadFile, HTTPException, status, Depends, Query, Header, Request
+from fastapi.responses import FileResponse, JSONResponse, Response, StreamingResponse
 from sqlalchemy import insert, delete
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
+from src.config import BULK_UPLOAD_CONCURRENCY, BULK_UPLOAD_MAX_FILES, MAX_UPLOAD_SIZE
 from src.database import get_async_session
+from src.file_management.aggregate import (
+    AggregateResult, AggregateSpec, normalize_aggregate, plan_aggregate, run_aggregate
+)
+from src.file_management.cache import (
+    dataframe_cache, load_appended_frame, load_dataset_frame, result_cache, shared_dataset_cache
+)
+from src.file_management.executor import ExecutorSaturatedError, load_and_run, query_executor
+from src.file_management.indexes import InvalidIndexColumnError, sort_index_path, sort_index_tracker, trigram_index_path
+from src.file_management.ingest import (
+    DatasetExistsError, IngestResult, InvalidAppendError, InvalidArchiveError, UploadTooLargeError, check_index_columns,
+    dataset_values, derive_dataset, index_appended_dataset, ingest_member, is_archive, list_archive_members,
+    profile_appended_dataset, read_csv_header, store_appended_dataset
+)
+from src.file_management.jobs import (
+    JOB_FAILED, SessionFactory, create_job_db, get_job_db, ingest_pipeline, job_info, remove_job_data, stage_upload
+)
 from src.file_management.models import file_info
-from src.file_management.schemas import FileInfoInDB, SortOrderEnum
-from src.file_management.utils import get_all_file_info_db, get_file_db
+from src.file_management.pagination import InvalidCursorError, decode_cursor, encode_cursor, query_fingerprint
+from src.file_management.query import (
+    OUTPUT_FRAME, OUTPUT_NONE, InvalidQueryError, QueryPlan, QueryResult, normalize_query, plan_query, run_query
+)
+from src.file_management.schemas import (
+    Aggregation, FileInfoInDB, FileSortEnum, FilterModeEnum, OutputFormatEnum, SortOrderEnum
+)
+from src.file_management.serializers import (
+    FORMAT_CSV, FORMAT_JSON, MEDIA_TYPES, STREAM_MEDIA_TYPES, STREAM_SERIALIZERS, negotiate_format
+)
+from src.file_management.storage import (
+    COMPRESSION_NONE, CSV_ENCODING, blob_key, dataset_path, dataset_version, iter_dataset_file, remove_artifacts,
+    remove_dataset, storage_key
+)
+from src.file_management.uploads import (
+    ChecksumMismatchError, ChunkWriter, InvalidChunkError, UploadIncompleteError, UploadSessionNotFoundError,
+    create_upload_session, finalize_upload_session, get_upload_session, parse_checksum, remove_upload_session
+)
+from src.file_management.utils import (
+    claim_blobs_db, discard_dataset_db, get_existing_file_names_db, get_file_db, get_file_info_page_db, register_file_db,
+    release_blob_db, update_file_content_db
+)
+from src.metrics import observe_query, time_stage
+from src.profiling import run_in_threadpool
 
 router = APIRouter(
     tags=['File Management']
@@ -23,14 +71,28 @@ router = APIRouter(
     "/upload_file",
     response_class=JSONResponse,
     summary="Upload a CSV file",
-    description="Upload a CSV file, store it on the server, and record information in a database.",
+    description="Upload a CSV file. It is accepted as soon as it is stored durably and ingested in the background; "
+                "the returned job reports the progress. With `wait=true` the response is only sent once the file is ingested.",
     response_description="File upload status",
-    status_code=status.HTTP_201_CREATED,
+    status_code=status.HTTP_202_ACCEPTED,
     responses={
         status.HTTP_201_CREATED: {
+            "description": "File uploaded and ingested, with `wait=true`.",
             "content": {
                 "application/json": {
-                    "example": {"message": "File uploaded successfully."}
+                    "example": {"message": "File uploaded successfully.", "job_id": "3f2b9c0e8d7a4c1b9e6f5a4d3c2b1a09"}
+                }
+            }
+        },
+        status.HTTP_202_ACCEPTED: {
+            "description": "File stored, ingestion job queued.",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "message": "File accepted for ingestion.",
+                        "job_id": "3f2b9c0e8d7a4c1b9e6f5a4d3c2b1a09",
+                        "status_url": "/jobs/3f2b9c0e8d7a4c1b9e6f5a4d3c2b1a09"
+                    }
                 }
             }
         },
@@ -41,79 +103,694 @@ router = APIRouter(
                     "example": {"detail": "File must be a CSV file."}
                 }
             }
+        },
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {
+            "description": "Request Entity Too Large - The file exceeds the maximum upload size.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "File exceeds the maximum upload size of 10737418240 bytes."}
+                }
+            }
         }
     }
 )
-async def upload_file(file: UploadFile, session: AsyncSession = Depends(get_async_session)):
+async def upload_file(
+        request: Request,
+        file: UploadFile,
+        index_columns: List[str] | None = Query(None),
+        sort_columns: List[str] | None = Query(None),
+        wait: bool = False,
+        session: AsyncSession = Depends(get_async_session),
+):
     if file.content_type != 'text/csv':
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File must be a CSV file.")
 
-    if os.path.exists(f"datasets/{file.filename}"):
+    file_path = dataset_path(file.filename)
+    if os.path.exists(file_path) or await get_file_db(file_name=file.filename, session=session):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"File '{file.filename}' already exists")
 
-    file_path = os.path.join("datasets", file.filename)
-    with open(file_path, "wb") as buffer:
-        buffer.write(await file.read())
+    job_id = uuid.uuid4().hex
+    try:
+        with time_stage("upload_file", "receive"):
+            staged_path = await run_in_threadpool(stage_upload, file.file, job_id)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+    index_columns, sort_columns = list(dict.fromkeys(index_columns or [])), list(dict.fromkeys(sort_columns or []))
+    try:
+        check_index_columns(await run_in_threadpool(read_csv_header, staged_path), index_columns, sort_columns)
+        await create_job_db(
+            job_id, file.filename, {"index_columns": index_columns, "sort_columns": sort_columns}, session,
+            owner=ingest_pipeline.worker_id,
+        )
+    except InvalidIndexColumnError as e:
+        remove_job_data(job_id)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    except IntegrityError:
+        remove_job_data(job_id)
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"File '{file.filename}' already exists")
+    ingest_pipeline.submit(job_id, background_sessions(request))
+
+    if wait:
+        await ingest_pipeline.wait(job_id)
+        job = await get_job_db(job_id, session)
+        if job["status"] == JOB_FAILED:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=job["error"])
+        return JSONResponse(
+            status_code=status.HTTP_201_CREATED, content={"message": "File uploaded successfully.", "job_id": job_id}
+        )
+    return JSONResponse(
+        status_code=status.HTTP_202_ACCEPTED,
+        content={
+            "message": "File accepted for ingestion.",
+            "job_id": job_id,
+            "status_url": router.url_path_for("get_ingest_job", job_id=job_id),
+        },
+    )
+
+
+def background_sessions(request: Request) -> SessionFactory:
+    """Opens database sessions for work outliving the request, through the same dependency, overrides included."""
+    return asynccontextmanager(request.app.dependency_overrides.get(get_async_session, get_async_session))
 
-    with open(file_path, "r", encoding="latin1") as f:
-        reader = csv.DictReader(f)
-        column_names = reader.fieldnames
 
-    insert_query = insert(file_info).values(
-        file_name=file.filename,
-        column_names=column_names
+@router.get(
+    "/jobs/{job_id}",
+    response_class=JSONResponse,
+    summary="Get the status of an ingestion job",
+    description="Get the status of a background ingestion job started by /upload_file, with the attempts and duration of every stage.",
+    response_description="Ingestion job status",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Ingestion job status.",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "job_id": "3f2b9c0e8d7a4c1b9e6f5a4d3c2b1a09",
+                        "file_name": "example.csv",
+                        "status": "running",
+                        "stage": "profile",
+                        "progress": 0.25,
+                        "file_id": None,
+                        "error": None,
+                        "created_time": "2023-10-19 14:03:11.592604",
+                        "updated_time": "2023-10-19 14:03:12.104512",
+                        "stages": [
+                            {"name": "store", "status": "succeeded", "attempts": 1, "duration_ms": 412.5, "error": None},
+                            {"name": "profile", "status": "running", "attempts": 1, "duration_ms": None, "error": None},
+                            {"name": "index", "status": "pending", "attempts": 0, "duration_ms": None, "error": None},
+                            {"name": "register", "status": "pending", "attempts": 0, "duration_ms": None, "error": None}
+                        ]
+                    }
+                }
+            }
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "description": "Not Found - Job not found.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Job not found."}
+                }
+            }
+        },
+    }
+)
+async def get_ingest_job(
+        job_id: str,
+        session: AsyncSession = Depends(get_async_session),
+):
+    job = await get_job_db(job_id, session)
+    if job is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Job not found.")
+    return JSONResponse(status_code=status.HTTP_200_OK, content=job_info(job))
+
+
+async def derive_stored_dataset(
+        file_name: str,
+        ingest_result: IngestResult,
+        index_columns: Optional[List[str]],
+        sort_columns: Optional[List[str]],
+        session: AsyncSession,
+) -> Dict[str, Any]:
+    """Derive the artifacts of a stored dataset, reusing those of a registered file with the same content."""
+    existing = None
+    if ingest_result.reused:
+        existing = await get_file_db(blob_hash=ingest_result.content_hash, session=session)
+    return await run_in_threadpool(
+        derive_dataset, file_name, ingest_result, index_columns or [], sort_columns or [], existing
     )
 
-    await session.execute(insert_query)
-    await session.commit()
 
+async def register_file(file_values: Dict[str, Any], session: AsyncSession) -> None:
+    """Insert the `file_info` row of an ingested dataset, removing the dataset again if its name is taken."""
+    try:
+        await register_file_db(file_values, session=session)
+    except IntegrityError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"File '{file_values['file_name']}' already exists")
+
+
+@router.post(
+    "/upload_files",
+    response_class=JSONResponse,
+    summary="Upload many CSV files",
+    description="Upload several CSV files, or zip/tar archives of CSV files, in one request. "
+                "Files are ingested concurrently and registered in a single insert; the response reports the outcome per file.",
+    response_description="Per-file upload status",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Per-file upload status",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "uploaded": 1,
+                        "failed": 1,
+                        "files": [
+                            {"file_name": "example1.csv", "status_code": 201, "detail": "File uploaded successfully."},
+                            {"file_name": "example2.csv", "status_code": 400, "detail": "File 'example2.csv' already exists"}
+                        ]
+                    }
+                }
+            }
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Bad Request - Too many files in one request.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Too many files, at most 10000 can be uploaded at once."}
+                }
+            }
+        },
+    }
+)
+async def upload_files(
+        files: List[UploadFile],
+        session: AsyncSession = Depends(get_async_session),
+):
+    report: List[Dict[str, Any]] = []
+    # (report entry, opener of the CSV contents, lock serializing reads from a shared archive stream)
+    sources: List[Tuple[Dict[str, Any], Callable[[], BinaryIO], Optional[asyncio.Lock]]] = []
+    for file in files:
+        if is_archive(file.filename):
+            try:
+                members = await run_in_threadpool(list_archive_members, file.file, file.filename)
+            except InvalidArchiveError as e:
+                report.append({"file_name": file.filename, "status_code": status.HTTP_400_BAD_REQUEST, "detail": str(e)})
+                continue
+            read_lock = None if file.filename.lower().endswith(".zip") else asyncio.Lock()
+            for member_name, opener in members:
+                entry = {"file_name": member_name}
+                report.append(entry)
+                sources.append((entry, opener, read_lock))
+        else:
+            entry = {"file_name": file.filename}
+            report.append(entry)
+            if file.content_type != 'text/csv':
+                entry.update(status_code=status.HTTP_400_BAD_REQUEST, detail="File must be a CSV file.")
+                continue
+            sources.append((entry, partial(getattr, file, "file"), None))
+    if len(sources) > BULK_UPLOAD_MAX_FILES:
+        raise HTTPException(
+            status_code=status.HTTP_400_BAD_REQUEST,
+            detail=f"Too many files, at most {BULK_UPLOAD_MAX_FILES} can be uploaded at once.",
+        )
+
+    existing_names = await get_existing_file_names_db([entry["file_name"] for entry, _, _ in sources], session=session)
+    seen_names = set()
+    accepted_sources = []
+    for entry, opener, read_lock in sources:
+        file_name = entry["file_name"]
+        if file_name in seen_names:
+            entry.update(status_code=status.HTTP_400_BAD_REQUEST, detail=f"File '{file_name}' appears more than once in the request")
+        elif file_name in existing_names or os.path.exists(dataset_path(file_name)):
+            entry.update(status_code=status.HTTP_400_BAD_REQUEST, detail=f"File '{file_name}' already exists")
+        else:
+            accepted_sources.append((entry, opener, read_lock))
+        seen_names.add(file_name)
+
+    semaphore = asyncio.Semaphore(BULK_UPLOAD_CONCURRENCY)
+
+    async def ingest(entry: Dict[str, Any], opener: Callable[[], BinaryIO], read_lock: Optional[asyncio.Lock]) -> Optional[Dict[str, Any]]:
+        async with semaphore:
+            try:
+                if read_lock is None:
+                    ingest_result = await run_in_threadpool(ingest_member, entry["file_name"], opener)
+                else:
+                    async with read_lock:
+                        ingest_result = await run_in_threadpool(ingest_member, entry["file_name"], opener)
+                return await run_in_threadpool(derive_dataset, entry["file_name"], ingest_result)
+            except UploadTooLargeError as e:
+                entry.update(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+            except DatasetExistsError as e:
+                entry.update(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+            except (zipfile.BadZipFile, tarfile.TarError, zlib.error, EOFError) as e:
+                entry.update(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Could not read '{entry['file_name']}' from its archive: {e}")
+            return None
+
+    results = await asyncio.gather(*(ingest(*source) for source in accepted_sources))
+    ingested = [(entry, values) for (entry, _, _), values in zip(accepted_sources, results) if values is not None]
+
+    if ingested:
+        try:
+            await claim_blobs_db([values for _, values in ingested], session=session)
+            await session.execute(insert(file_info).values([values for _, values in ingested]))
+            await session.commit()
+        except IntegrityError:
+            # A file of the same name was registered meanwhile; fall back to one insert per file to find out which.
+            await session.rollback()
+            for entry, values in ingested:
+                try:
+                    await register_file(values, session)
+                except HTTPException as e:
+                    entry.update(status_code=e.status_code, detail=e.detail)
+        for entry, _ in ingested:
+            entry.setdefault("status_code", status.HTTP_201_CREATED)
+            entry.setdefault("detail", "File uploaded successfully.")
+
+    uploaded = sum(entry["status_code"] == status.HTTP_201_CREATED for entry in report)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={"uploaded": uploaded, "failed": len(report) - uploaded, "files": report},
+    )
+
+
+UPLOAD_SESSION_NOT_FOUND = {
+    "description": "Not Found - Upload session not found or expired.",
+    "content": {
+        "application/json": {
+            "example": {"detail": "Upload session not found."}
+        }
+    }
+}
+
+
+@router.post(
+    "/uploads",
+    response_class=JSONResponse,
+    summary="Start a resumable upload",
+    description="Create a resumable upload session for a CSV file of `length` bytes. "
+                "Its chunks are then sent with PATCH /uploads/{upload_id}, in any order and in parallel.",
+    response_description="Created upload session",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_201_CREATED: {
+            "description": "Upload session created.",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "upload_id": "0f8c1d8a6b1e4b4f9d8e3c2a1b0f9e8d",
+                        "file_name": "example.csv",
+                        "length": 20000000000,
+                        "offset": 0,
+                        "received_ranges": [],
+                        "expires_at": 1697544000.0
+                    }
+                }
+            }
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Bad Request - Invalid input or parameter values.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "File 'example.csv' already exists"}
+                }
+            }
+        },
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {
+            "description": "Request Entity Too Large - The declared length exceeds the maximum upload size.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "File exceeds the maximum upload size of 10737418240 bytes."}
+                }
+            }
+        },
+    }
+)
+async def create_upload(
+        file_name: str,
+        length: int = Query(ge=0),
+        session: AsyncSession = Depends(get_async_session),
+):
+    if not file_name.lower().endswith(".csv") or os.path.basename(file_name) != file_name:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File must be a CSV file.")
+    if length > MAX_UPLOAD_SIZE:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(UploadTooLargeError(MAX_UPLOAD_SIZE)))
+    if os.path.exists(dataset_path(file_name)) or await get_file_db(file_name=file_name, session=session):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"File '{file_name}' already exists")
+
+    upload = await run_in_threadpool(create_upload_session, file_name, length)
+    return JSONResponse(
+        status_code=status.HTTP_201_CREATED,
+        content=await run_in_threadpool(upload.info),
+        headers={"Location": f"/uploads/{upload.upload_id}", "Upload-Offset": "0", "Upload-Length": str(length)},
+    )
+
+
+@router.get(
+    "/uploads/{upload_id}",
+    response_class=JSONResponse,
+    summary="Get the state of a resumable upload",
+    description="Report how much of a resumable upload has been received, to know where to resume. "
+                "`offset` is the end of the gapless prefix, `received_ranges` lists every received byte range.",
+    response_description="Upload session state",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Upload session state.",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "upload_id": "0f8c1d8a6b1e4b4f9d8e3c2a1b0f9e8d",
+                        "file_name": "example.csv",
+                        "length": 20000000000,
+                        "offset": 8388608,
+                        "received_ranges": [[0, 8388608], [16777216, 25165824]],
+                        "expires_at": 1697544000.0
+                    }
+                }
+            }
+        },
+        status.HTTP_404_NOT_FOUND: UPLOAD_SESSION_NOT_FOUND,
+    }
+)
+async def get_upload(upload_id: str):
+    try:
+        upload = await run_in_threadpool(get_upload_session, upload_id)
+    except UploadSessionNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found.")
+    upload_info = await run_in_threadpool(upload.info)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=upload_info,
+        headers={"Upload-Offset": str(upload_info["offset"]), "Upload-Length": str(upload.length)},
+    )
+
+
+@router.patch(
+    "/uploads/{upload_id}",
+    response_class=JSONResponse,
+    summary="Upload a chunk of a resumable upload",
+    description="Write the request body at byte `Upload-Offset` of the upload. With an `Upload-Checksum: <md5|sha1|sha256> "
+                "<base64 digest>` header the chunk is only accepted if its digest matches.",
+    response_description="Upload session state",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Chunk stored.",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "upload_id": "0f8c1d8a6b1e4b4f9d8e3c2a1b0f9e8d",
+                        "file_name": "example.csv",
+                        "length": 20000000000,
+                        "offset": 16777216,
+                        "received_ranges": [[0, 16777216]],
+                        "expires_at": 1697544000.0
+                    }
+                }
+            }
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Bad Request - Invalid offset, chunk or checksum.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Chunk checksum does not match Upload-Checksum."}
+                }
+            }
+        },
+        status.HTTP_404_NOT_FOUND: UPLOAD_SESSION_NOT_FOUND,
+    }
+)
+async def upload_chunk(
+        upload_id: str,
+        request: Request,
+        upload_offset: int = Header(),
+        upload_checksum: str | None = Header(None),
+):
+    try:
+        upload = await run_in_threadpool(get_upload_session, upload_id)
+        writer = await run_in_threadpool(ChunkWriter, upload, upload_offset, parse_checksum(upload_checksum))
+    except UploadSessionNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found.")
+    except (InvalidChunkError, FileNotFoundError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    try:
+        async for chunk in request.stream():
+            await run_in_threadpool(writer.write, chunk)
+        await run_in_threadpool(writer.commit)
+    except (InvalidChunkError, ChecksumMismatchError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    finally:
+        await run_in_threadpool(writer.close)
+
+    upload_info = await run_in_threadpool(upload.info)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content=upload_info,
+        headers={"Upload-Offset": str(upload_info["offset"]), "Upload-Length": str(upload.length)},
+    )
+
+
+@router.post(
+    "/uploads/{upload_id}/finalize",
+    response_class=JSONResponse,
+    summary="Finish a resumable upload",
+    description="Register a completely received upload as a dataset, exactly like /upload_file would.",
+    response_description="Upload status",
+    status_code=status.HTTP_201_CREATED,
+    responses={
+        status.HTTP_201_CREATED: {
+            "description": "File uploaded successfully.",
+            "content": {
+                "application/json": {
+                    "example": {"message": "File uploaded successfully."}
+                }
+            }
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Bad Request - The upload is incomplete or the file already exists.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Upload is incomplete, 8388608 of 20000000000 bytes received."}
+                }
+            }
+        },
+        status.HTTP_404_NOT_FOUND: UPLOAD_SESSION_NOT_FOUND,
+    }
+)
+async def finalize_upload(
+        upload_id: str,
+        index_columns: List[str] | None = Query(None),
+        sort_columns: List[str] | None = Query(None),
+        session: AsyncSession = Depends(get_async_session),
+):
+    try:
+        upload = await run_in_threadpool(get_upload_session, upload_id)
+        ingest_result = await run_in_threadpool(
+            finalize_upload_session, upload, [*(index_columns or []), *(sort_columns or [])]
+        )
+        file_values = await derive_stored_dataset(upload.file_name, ingest_result, index_columns, sort_columns, session)
+    except UploadSessionNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found.")
+    except (UploadIncompleteError, DatasetExistsError, InvalidIndexColumnError) as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+
+    await register_file(file_values, session)
     return JSONResponse(status_code=status.HTTP_201_CREATED, content={"message": "File uploaded successfully."})
 
 
+@router.delete(
+    "/uploads/{upload_id}",
+    response_class=JSONResponse,
+    summary="Cancel a resumable upload",
+    description="Discard a resumable upload and everything received for it.",
+    response_description="Cancellation status",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Upload cancelled.",
+            "content": {
+                "application/json": {
+                    "example": {"message": "Upload cancelled."}
+                }
+            }
+        },
+        status.HTTP_404_NOT_FOUND: UPLOAD_SESSION_NOT_FOUND,
+    }
+)
+async def cancel_upload(upload_id: str):
+    try:
+        upload = await run_in_threadpool(get_upload_session, upload_id)
+    except UploadSessionNotFoundError:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="Upload session not found.")
+    await run_in_threadpool(remove_upload_session, upload)
+    return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "Upload cancelled."})
+
+
 @router.get(
     "/files",
     summary="Get information about uploaded files",
-    description="Retrieve information about files that have been uploaded and recorded in the database.",
-    response_description="List of uploaded files",
+    description="Retrieve information about files that have been uploaded and recorded in the database, one keyset page at a time.",
+    response_description="Page of uploaded files",
     status_code=status.HTTP_200_OK,
     responses={
         status.HTTP_200_OK: {
             "description": "Successful response",
             "content": {
                 "application/json": {
-                    "example": [
-                        {
-                            "id": 1,
-                            "file_name": "example1.csv",
-                            "uploaded_time": "2023-10-02 12:34:56",
-                            "column_names": ["model", "color", "cost"]
-                        },
-                        {
-                            "id": 2,
-                            "file_name": "example2.csv",
-                            "uploaded_time": "2023-10-02 13:45:00",
-                            "column_names": ["name", "age", "city"]
-                        }
-                    ]
+                    "example": {
+                        "files": [
+                            {
+                                "id": 1,
+                                "file_name": "example1.csv",
+                                "uploaded_time": "2023-10-02 12:34:56",
+                                "column_names": ["model", "color", "cost"],
+                                "file_size": 52428800,
+                                "stored_size": 9646899,
+                                "compression": "zstd"
+                            },
+                            {
+                                "id": 2,
+                                "file_name": "example2.csv",
+                                "uploaded_time": "2023-10-02 13:45:00",
+                                "column_names": ["name", "age", "city"],
+                                "file_size": 1024,
+                                "stored_size": 1024,
+                                "compression": "none"
+                            }
+                        ],
+                        "next_after_id": 2
+                    }
                 }
             }
-        }
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Bad Request - Invalid input or parameter values.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "File with id 42 not found, invalid 'after_id'."}
+                }
+            }
+        },
     }
 )
-async def get_file_info(session: AsyncSession = Depends(get_async_session)):
-    files: List[FileInfoInDB] = await get_all_file_info_db(session=session)
+async def get_file_info(
+        after_id: int | None = None,
+        limit: int = Query(100, ge=1, le=1000),
+        sort_by: FileSortEnum = FileSortEnum.id,
+        sort_order: SortOrderEnum = SortOrderEnum.asc,
+        name_prefix: str | None = None,
+        session: AsyncSession = Depends(get_async_session),
+):
+    files = await get_file_info_page_db(
+        after_id=after_id,
+        limit=limit,
+        sort_by=sort_by.value,
+        sort_order=sort_order.value,
+        name_prefix=name_prefix,
+        session=session,
+    )
+    if files is None:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"File with id {after_id} not found, invalid 'after_id'.")
+    # Row keys are SQLAlchemy `quoted_name` str subclasses, which orjson only accepts with OPT_NON_STR_KEYS.
     files_data = {
-        "files": [
-            {
-                "id": files[x].id,
-                "file_name": files[x].file_name,
-                "uploaded_time": str(files[x].uploaded_time),
-                "column_names": files[x].column_names,
-            }
-            for x in range(len(files))
-        ]
+        "files": [file._asdict() for file in files],
+        "next_after_id": files[-1].id if len(files) == limit else None,
+    }
+    return Response(status_code=status.HTTP_200_OK, content=orjson.dumps(files_data, option=orjson.OPT_NON_STR_KEYS), media_type="application/json")
+
+
+@router.get(
+    "/files/{file_id}/stats",
+    summary="Get column statistics of a file",
+    description="Retrieve the per-column statistics, encoding and read schema detected when the file was uploaded.",
+    response_description="Column statistics",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "id": 1,
+                        "file_name": "example1.csv",
+                        "row_count": 3,
+                        "version": 1,
+                        "encoding": "utf-8",
+                        "columns": {
+                            "model": {
+                                "dtype": "string", "count": 3, "null_count": 0, "distinct_count": 3,
+                                "min": "audi", "max": "volvo", "max_length": 5
+                            },
+                            "cost": {
+                                "dtype": "int64", "count": 2, "null_count": 1, "distinct_count": 2,
+                                "min": 1200, "max": 5400
+                            }
+                        },
+                        "read_schema": {}
+                    }
+                }
+            }
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "description": "Not Found - File not found.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "File not found."}
+                }
+            }
+        },
     }
-    return JSONResponse(status_code=status.HTTP_200_OK, content=files_data)
+)
+async def get_file_stats(
+        file_id: int,
+        session: AsyncSession = Depends(get_async_session),
+):
+    file: Optional[FileInfoInDB] = await get_file_db(file_id=file_id, session=session)
+    if file is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found.")
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "id": file.id,
+            "file_name": file.file_name,
+            "row_count": file.row_count,
+            "version": file.version,
+            "encoding": file.encoding,
+            "columns": file.column_stats,
+            "read_schema": file.read_schema,
+        },
+    )
+
+
+async def run_on_dataset(file: FileInfoInDB, plan: QueryPlan, fn: Callable[..., Any], *args: Any) -> Any:
+    """
+    Load the columns `plan` reads through the dataframe cache and run `fn(df, *args)` on the query
+    executor, or both in a worker process when it uses processes. The load time goes into `stats`.
+    With the shared dataset cache enabled, loads map the dataset built once for all workers.
+    Columns are read with the file's recorded encoding and read schema.
+    """
+    key, version = storage_key(file), dataset_version(file)
+    read_schema, encoding = file.read_schema, file.encoding or CSV_ENCODING
+    async with query_executor.admit():
+        if query_executor.uses_processes:
+            return await query_executor.run(
+                load_and_run, key, version, plan.read_columns, read_schema, encoding, fn, *args
+            )
+        if shared_dataset_cache is not None and not shared_dataset_cache.contains(key, version):
+            # Deleted by another worker (or never shared), so frames this worker holds may be stale.
+            dataframe_cache.invalidate(key)
+        started = time.perf_counter()
+        df = await dataframe_cache.get_or_load(
+            key,
+            (version, plan.read_columns_key),
+            partial(load_dataset_frame, key, version, plan.read_columns, read_schema, encoding),
+        )
+        load_ms = round((time.perf_counter() - started) * 1000, 3)
+        result = await query_executor.run(fn, df, *args)
+        result.stats["load_ms"] = load_ms
+        return result
 
 
 @router.post(
@@ -139,7 +816,15 @@ async def get_file_info(session: AsyncSession = Depends(get_async_session)):
                             "column3": "value6"
                         }
                     ]
-                }
+                },
+                "application/vnd.columnar+json": {
+                    "example": {
+                        "columns": ["column1", "column2"],
+                        "data": {"column1": ["value1", "value4"], "column2": ["value2", "value5"]}
+                    }
+                },
+                "application/vnd.apache.arrow.stream": {},
+                "text/csv": {},
             }
         },
         status.HTTP_400_BAD_REQUEST: {
@@ -158,6 +843,14 @@ async def get_file_info(session: AsyncSession = Depends(get_async_session)):
                 }
             }
         },
+        status.HTTP_503_SERVICE_UNAVAILABLE: {
+            "description": "Service Unavailable - Too many queries are already running or waiting.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Server is busy, please retry later."}
+                }
+            }
+        },
     },
 )
 async def fetch_data(
@@ -167,7 +860,17 @@ async def fetch_data(
         sort_by: List[str] | None = None,
         sort_orders: List[SortOrderEnum] | None = None,
         filter_by: List[str] | None = None,
-        filter_values: List[str] | None = None
+        filter_values: List[str] | None = None,
+        where: Dict[str, Any] | None = None,
+        columns: List[str] | None = None,
+        filter_mode: FilterModeEnum = FilterModeEnum.literal,
+        limit: int | None = Query(None, ge=1),
+        offset: int = Query(0, ge=0),
+        cursor: str | None = None,
+        stream: bool = False,
+        explain: bool = False,
+        output_format: OutputFormatEnum | None = Query(None, alias="format"),
+        accept: str | None = Header(None),
 ):
     if not file_name and not file_id:
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Either 'file_id' or 'file_name' is required.")
@@ -177,30 +880,341 @@ async def fetch_data(
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Number of sort orders must match number of sort columns.")
     if filter_by and filter_values and len(filter_by) != len(filter_values):
         raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Number of filter values must match number of filter columns.")
+    if offset and cursor:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only one of 'offset' or 'cursor' can be provided.")
 
-    file: Optional[FileInfoInDB] = await get_file_db(file_name=file_name, file_id=file_id, session=session)
+    normalized_query = normalize_query(
+        columns, sort_by, sort_orders, filter_by, filter_values, filter_regex=filter_mode == FilterModeEnum.regex,
+        where=where,
+    )
+    output_format = output_format.value if output_format else negotiate_format(accept)
+    with time_stage("fetch_data", "db_lookup"):
+        file: Optional[FileInfoInDB] = await get_file_db(file_name=file_name, file_id=file_id, session=session)
     if file is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found.")
 
-    file_path = f"datasets/{file.file_name}"
-    df = pd.read_csv(file_path, encoding="latin1")
+    version = dataset_version(file)
+    key = storage_key(file)
+    result_key = None
+    if not stream and not explain:
+        result_key = (file.id, version, file.version, normalized_query, offset, cursor, limit, output_format)
+        cached_result = result_cache.get(result_key)
+        if cached_result is not None:
+            return Response(content=cached_result.body, media_type=cached_result.media_type, headers=cached_result.headers)
+    try:
+        plan = plan_query(
+            file.column_names, columns, sort_by, sort_orders, filter_by, filter_values,
+            filter_regex=filter_mode == FilterModeEnum.regex,
+            index_paths={column: trigram_index_path(key, column) for column in file.indexed_columns or []},
+            sort_index_paths={column: sort_index_path(key, column, version) for column in sort_by or []},
+            column_stats=file.column_stats,
+            where=where,
+            read_schema=file.read_schema,
+        )
+    except InvalidQueryError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    sort_index_tracker.record(key, version, plan.sort_by, file.read_schema, file.encoding or CSV_ENCODING)
 
-    if sort_by:
+    fingerprint = query_fingerprint(file.id, normalized_query)
+    if cursor:
         try:
-            df = df.sort_values(by=sort_by, ascending=[True if sort_order == "asc" else False for sort_order in sort_orders])
-        except KeyError as e:
-            invalid_column_name = str(e)
-            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid sort column name: {invalid_column_name}")
+            offset = decode_cursor(cursor, version, fingerprint)
+        except InvalidCursorError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
 
-    if filter_by and filter_values:
-        for column, filter_value in zip(filter_by, filter_values):
-            try:
-                df = df[df[column].str.contains(filter_value)]
-            except KeyError:
-                raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=f"Invalid filter column name: {column}")
-    df = df.fillna('')
-    df_json = df.to_dict(orient="records")
-    return JSONResponse(status_code=status.HTTP_200_OK, content=df_json)
+    passthrough = not (plan.filters or plan.where or plan.sort_by or plan.output_columns or offset or limit or explain)
+    if output_format == FORMAT_CSV and passthrough:
+        headers = {"X-Total-Count": str(file.row_count)} if file.row_count is not None else None
+        if file.compression and file.compression != COMPRESSION_NONE:
+            return StreamingResponse(iter_dataset_file(key), media_type=MEDIA_TYPES[FORMAT_CSV], headers=headers)
+        return FileResponse(dataset_path(key), media_type=MEDIA_TYPES[FORMAT_CSV], headers=headers)
+
+    if explain:
+        output = OUTPUT_NONE
+    elif stream:
+        output = OUTPUT_FRAME
+    else:
+        output = output_format
+
+    try:
+        if plan.pruned_by is not None:
+            result = run_query(pd.DataFrame(columns=plan.read_columns or file.column_names), plan, offset, limit, output)
+        else:
+            result: QueryResult = await run_on_dataset(file, plan, run_query, plan, offset, limit, output)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
+    except InvalidQueryError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    observe_query("fetch_data", result.stats, None if explain else max(result.end - offset, 0))
+
+    if explain:
+        return JSONResponse(status_code=status.HTTP_200_OK, content={"plan": result.plan, "stats": result.stats})
+
+    headers = {"X-Total-Count": str(result.total_count)}
+    if result.end < result.total_count:
+        headers["X-Next-Cursor"] = encode_cursor(result.end, version, fingerprint)
+
+    if stream:
+        return StreamingResponse(
+            STREAM_SERIALIZERS[output_format](result.page), media_type=STREAM_MEDIA_TYPES[output_format], headers=headers
+        )
+    result_cache.put(result_key, file.id, result.body, MEDIA_TYPES[output_format], headers)
+    return Response(status_code=status.HTTP_200_OK, content=result.body, media_type=MEDIA_TYPES[output_format], headers=headers)
+
+
+@router.post(
+    "/aggregate_data",
+    summary="Aggregate data of a CSV file",
+    description="Compute counts, sums, means, minima, maxima, distinct counts and percentiles of a CSV file, "
+                "optionally per group and over the rows matching the same filters as /fetch_data.",
+    response_description="Aggregated data",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Successful response",
+            "content": {
+                "application/json": {
+                    "example": [
+                        {"region": "east", "count": 120, "sum_amount": 5310.5, "p95_amount": 98.0},
+                        {"region": "west", "count": 87, "sum_amount": 4102.25, "p95_amount": 91.5}
+                    ]
+                }
+            }
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Bad Request - Invalid input or parameter values.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Aggregation 'sum' requires a numeric column, 'region' is not"}
+                }
+            }
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "description": "Not Found - File not found.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "File not found."}
+                }
+            }
+        },
+        status.HTTP_503_SERVICE_UNAVAILABLE: {
+            "description": "Service Unavailable - Too many queries are already running or waiting.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Server is busy, please retry later."}
+                }
+            }
+        },
+    },
+)
+async def aggregate_data(
+        aggregations: List[Aggregation],
+        file_name: str = None,
+        file_id: int = None,
+        session: AsyncSession = Depends(get_async_session),
+        group_by: List[str] | None = None,
+        filter_by: List[str] | None = None,
+        filter_values: List[str] | None = None,
+        where: Dict[str, Any] | None = None,
+        filter_mode: FilterModeEnum = FilterModeEnum.literal,
+        explain: bool = False,
+):
+    if not file_name and not file_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Either 'file_id' or 'file_name' is required.")
+    if file_id and file_name:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only one of 'file_id' or 'file_name' can be provided.")
+    if filter_by and filter_values and len(filter_by) != len(filter_values):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Number of filter values must match number of filter columns.")
+
+    specs = [AggregateSpec(aggregation.function.value, aggregation.column, aggregation.percentile) for aggregation in aggregations]
+    filter_regex = filter_mode == FilterModeEnum.regex
+    with time_stage("aggregate_data", "db_lookup"):
+        file: Optional[FileInfoInDB] = await get_file_db(file_name=file_name, file_id=file_id, session=session)
+    if file is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found.")
+
+    key = storage_key(file)
+    result_key = None
+    if not explain:
+        normalized_aggregate = normalize_aggregate(group_by, specs, filter_by, filter_values, filter_regex, where)
+        result_key = ("aggregate", file.id, dataset_version(file), file.version, normalized_aggregate)
+        cached_result = result_cache.get(result_key)
+        if cached_result is not None:
+            return Response(content=cached_result.body, media_type=cached_result.media_type, headers=cached_result.headers)
+    try:
+        plan = plan_aggregate(
+            file.column_names, group_by, specs, filter_by, filter_values, filter_regex=filter_regex,
+            index_paths={column: trigram_index_path(key, column) for column in file.indexed_columns or []},
+            column_stats=file.column_stats,
+            where=where,
+            read_schema=file.read_schema,
+        )
+        if plan.query.pruned_by is not None:
+            result = run_aggregate(pd.DataFrame(columns=plan.query.read_columns), plan, explain)
+        else:
+            result: AggregateResult = await run_on_dataset(file, plan.query, run_aggregate, plan, explain)
+    except ExecutorSaturatedError as e:
+        raise HTTPException(status_code=status.HTTP_503_SERVICE_UNAVAILABLE, detail=str(e), headers={"Retry-After": "1"})
+    except InvalidQueryError as e:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+    observe_query("aggregate_data", result.stats, None if explain else result.group_count)
+
+    if explain:
+        return JSONResponse(status_code=status.HTTP_200_OK, content={"plan": result.plan, "stats": result.stats})
+
+    headers = {"X-Total-Count": str(result.group_count)}
+    result_cache.put(result_key, file.id, result.body, MEDIA_TYPES[FORMAT_JSON], headers)
+    return Response(status_code=status.HTTP_200_OK, content=result.body, media_type=MEDIA_TYPES[FORMAT_JSON], headers=headers)
+
+
+@router.post(
+    "/append_file",
+    response_class=JSONResponse,
+    summary="Append rows to a file",
+    description="Append the rows of a CSV file to an uploaded file, identified by its name or ID. The CSV's header must "
+                "list the file's columns in order. The rows are appended atomically and the file's version is bumped; "
+                "its sidecar, statistics, indexes and cached data are extended with the new rows instead of being rebuilt.",
+    response_description="File append status",
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Rows appended successfully.",
+            "content": {
+                "application/json": {
+                    "example": {
+                        "message": "Rows appended successfully.", "file_id": 1, "version": 2, "row_count": 5, "appended_rows": 2
+                    }
+                }
+            },
+        },
+        status.HTTP_400_BAD_REQUEST: {
+            "description": "Bad Request - The request is invalid or the rows do not match the file.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "Columns of the appended rows must be those of 'example1.csv': model, cost"}
+                }
+            }
+        },
+        status.HTTP_404_NOT_FOUND: {
+            "description": "Not Found - File not found.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "File not found."}
+                }
+            }
+        },
+        status.HTTP_409_CONFLICT: {
+            "description": "Conflict - The file was changed by another request meanwhile.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "File 'example1.csv' was changed while the rows were appended, please retry."}
+                }
+            }
+        },
+        status.HTTP_413_REQUEST_ENTITY_TOO_LARGE: {
+            "description": "Request Entity Too Large - The file exceeds the maximum upload size.",
+            "content": {
+                "application/json": {
+                    "example": {"detail": "File exceeds the maximum upload size of 10737418240 bytes."}
+                }
+            }
+        }
+    },
+)
+async def append_file(
+        file: UploadFile,
+        file_name: str = None,
+        file_id: int = None,
+        session: AsyncSession = Depends(get_async_session),
+):
+    if file.content_type != 'text/csv':
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="File must be a CSV file.")
+    if not file_name and not file_id:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Either 'file_id' or 'file_name' is required.")
+    if file_id and file_name:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail="Only one of 'file_id' or 'file_name' can be provided.")
+
+    target: Optional[FileInfoInDB] = await get_file_db(file_name=file_name, file_id=file_id, session=session)
+    if target is None:
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found.")
+    append_id = uuid.uuid4().hex
+    try:
+        with time_stage("append_file", "receive"):
+            staged_path = await run_in_threadpool(stage_upload, file.file, append_id)
+    except UploadTooLargeError as e:
+        raise HTTPException(status_code=status.HTTP_413_REQUEST_ENTITY_TOO_LARGE, detail=str(e))
+
+    # The appended content is a new blob; it is stored under a temporary name until the file points at it.
+    temp_name = f".{target.file_name}.{append_id}.append"
+    key, version = storage_key(target), dataset_version(target)
+    try:
+        try:
+            with time_stage("append_file", "store"):
+                ingest_result, appended = await run_in_threadpool(store_appended_dataset, target, staged_path, temp_name)
+        except InvalidAppendError as e:
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(e))
+        appended_key = blob_key(ingest_result.content_hash)
+        try:
+            existing = None
+            if ingest_result.reused:
+                existing = await get_file_db(blob_hash=ingest_result.content_hash, session=session)
+            with time_stage("append_file", "profile"):
+                if existing is not None:
+                    column_types, column_stats, read_schema = existing.column_types, existing.column_stats, existing.read_schema
+                else:
+                    column_types, column_stats, read_schema = await run_in_threadpool(
+                        profile_appended_dataset, target, ingest_result.content_hash, staged_path, appended.encoding
+                    )
+            with time_stage("append_file", "index"):
+                await run_in_threadpool(
+                    index_appended_dataset, target, ingest_result.content_hash, read_schema, ingest_result.encoding
+                )
+            if column_types is not None and target.column_types is not None and read_schema == target.read_schema:
+                await dataframe_cache.extend(key, version, appended_key, ingest_result.content_hash, partial(
+                    load_appended_frame, appended_key, staged_path, read_schema, appended.encoding
+                ))
+
+            file_values = dataset_values(
+                target.file_name, ingest_result, column_types, column_stats, target.indexed_columns or [], read_schema
+            )
+            await claim_blobs_db([{"file_name": temp_name, "blob_hash": ingest_result.content_hash}], session=session)
+            new_version = await update_file_content_db(target, file_values, session=session)
+            if new_version is None:
+                raise HTTPException(
+                    status_code=status.HTTP_409_CONFLICT,
+                    detail=f"File '{target.file_name}' was changed while the rows were appended, please retry.",
+                )
+            last_reference = not target.blob_hash or await release_blob_db(target.blob_hash, session=session) == 0
+            await session.commit()
+        except BaseException:
+            await session.rollback()
+            await discard_dataset_db(temp_name, ingest_result.content_hash, session=session)
+            raise
+    finally:
+        remove_job_data(append_id)
+
+    # The old data is only removed once the row points at the new blob, as in delete_file.
+    os.replace(dataset_path(temp_name), dataset_path(target.file_name))
+    if last_reference:
+        dataframe_cache.invalidate(key)
+        if shared_dataset_cache is not None:
+            shared_dataset_cache.invalidate(key)
+        sort_index_tracker.forget(key)
+        if target.blob_hash:
+            remove_dataset(key)
+    if not target.blob_hash:
+        remove_artifacts(target.file_name)
+    result_cache.invalidate(target.id)
+    return JSONResponse(
+        status_code=status.HTTP_200_OK,
+        content={
+            "message": "Rows appended successfully.",
+            "file_id": target.id,
+            "version": new_version,
+            "row_count": ingest_result.row_count,
+            "appended_rows": appended.row_count,
+        },
+    )
 
 
 @router.delete(
@@ -252,9 +1266,19 @@ async def delete_file(
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail="File not found.")
     delete_query = delete(file_info).where(file_info.c.id == file.id)
     await session.execute(delete_query)
+    key = storage_key(file)
+    last_reference = not file.blob_hash or await release_blob_db(file.blob_hash, session=session) == 0
     await session.commit()
 
-    file_path = f"datasets/{file.file_name}"
-    os.remove(file_path)
+    # Data is only removed once the row is gone; an upload referencing the blob meanwhile recreates it through `link_blob`.
+    if last_reference:
+        dataframe_cache.invalidate(key)
+        if shared_dataset_cache is not None:
+            shared_dataset_cache.invalidate(key)
+        sort_index_tracker.forget(key)
+        remove_dataset(key)
+    result_cache.invalidate(file.id)
+    if key != file.file_name:
+        remove_dataset(file.file_name)
 
     return JSONResponse(status_code=status.HTTP_200_OK, content={"message": "File deleted successfully."})
@@ -1,6 +1,6 @@
 import datetime
 from enum import Enum
-from typing import List
+from typing import Any, Dict, List, Optional
 
 from pydantic import BaseModel
 
@@ -10,6 +10,18 @@ class FileInfoInDB(BaseModel):
     file_name: str
     uploaded_time: datetime.datetime
     column_names: List[str]
+    content_hash: Optional[str] = None
+    file_size: Optional[int] = None
+    stored_size: Optional[int] = None
+    compression: Optional[str] = None
+    row_count: Optional[int] = None
+    column_types: Optional[Dict[str, str]] = None
+    indexed_columns: Optional[List[str]] = None
+    column_stats: Optional[Dict[str, Dict[str, Any]]] = None
+    blob_hash: Optional[str] = None
+    encoding: Optional[str] = None
+    read_schema: Optional[Dict[str, str]] = None
+    version: int = 1
 
 
 class SortOrderEnum(str, Enum):
@@ -17,6 +29,40 @@ class SortOrderEnum(str, Enum):
     desc = "desc"
 
 
+class FileSortEnum(str, Enum):
+    id = "id"
+    file_name = "file_name"
+    uploaded_time = "uploaded_time"
+
+
+class FilterModeEnum(str, Enum):
+    literal = "literal"
+    regex = "regex"
+
+
+class OutputFormatEnum(str, Enum):
+    json = "json"
+    columnar = "columnar"
+    arrow = "arrow"
+    csv = "csv"
+
+
+class AggregateFunctionEnum(str, Enum):
+    count = "count"
+    sum = "sum"
+    mean = "mean"
+    min = "min"
+    max = "max"
+    distinct_count = "distinct_count"
+    percentile = "percentile"
+
+
+class Aggregation(BaseModel):
+    function: AggregateFunctionEnum
+    column: Optional[str] = None
+    percentile: Optional[float] = None
+
+
 class FileQueryParams(BaseModel):
     file_id: int = None
     file_name: str = None
@@ -0,0 +1,145 @@
+import io
+from typing import Callable, Dict, Iterator
+
+import numpy as np
+import orjson
+import pandas as pd
+import pyarrow as pa
+
+from src.config import STREAM_BATCH_ROWS
+
+FORMAT_JSON = "json"
+FORMAT_COLUMNAR = "columnar"
+FORMAT_ARROW = "arrow"
+FORMAT_CSV = "csv"
+
+MEDIA_TYPES = {
+    FORMAT_JSON: "application/json",
+    FORMAT_COLUMNAR: "application/vnd.columnar+json",
+    FORMAT_ARROW: "application/vnd.apache.arrow.stream",
+    FORMAT_CSV: "text/csv",
+}
+STREAM_MEDIA_TYPES = {**MEDIA_TYPES, FORMAT_JSON: "application/x-ndjson"}
+
+DATE_FORMAT = "%Y-%m-%d"
+DATETIME_FORMAT = "%Y-%m-%d %H:%M:%S"
+
+
+def negotiate_format(accept: str | None) -> str:
+    """Pick the first supported format listed in an Accept header, JSON when none is."""
+    for media_range in (accept or "").split(","):
+        media_type = media_range.split(";")[0].strip().lower()
+        for media_types in (MEDIA_TYPES, STREAM_MEDIA_TYPES):
+            for output_format, format_media_type in media_types.items():
+                if media_type == format_media_type:
+                    return output_format
+    return FORMAT_JSON
+
+
+def text_values(series: pd.Series) -> pd.Series:
+    """
+    Values of a column read with a compact dtype as they were before: dates and timestamps as the
+    text they were parsed from and categoricals as plain text, with missing values as NaN, and
+    float32 numbers widened back. Other columns are returned as they are.
+    """
+    dtype = series.dtype
+    if isinstance(dtype, pd.CategoricalDtype):
+        return series.astype(object)
+    if isinstance(dtype, pd.ArrowDtype) and pa.types.is_date(dtype.pyarrow_dtype):
+        return series.dt.strftime(DATE_FORMAT).astype(object).where(series.notna(), np.nan)
+    if pd.api.types.is_datetime64_dtype(dtype):
+        return series.dt.strftime(DATETIME_FORMAT)
+    if dtype == np.float32:
+        return series.astype(np.float64)
+    return series
+
+
+def with_text_values(df: pd.DataFrame) -> pd.DataFrame:
+    """`df` with every column converted by `text_values`; no copy when none needs converting."""
+    converted = {column: text_values(df[column]) for column in df.columns}
+    changed = {column: series for column, series in converted.items() if series is not df[column]}
+    return df.assign(**changed) if changed else df
+
+
+def to_json_records(df: pd.DataFrame) -> bytes:
+    """Rows as a JSON array of objects, with missing values rendered as empty strings."""
+    return orjson.dumps(with_text_values(df).fillna('').to_dict(orient="records"))
+
+
+def to_columnar_json(df: pd.DataFrame) -> bytes:
+    """`{"columns": [...], "data": {column: [...]}}`, so column names are not repeated per row and
+    missing values stay `null`. Numeric columns are encoded straight from their NumPy buffers."""
+    df = with_text_values(df)
+    data = {}
+    for column in df.columns:
+        series = df[column]
+        if series.dtype.kind in "biuf":
+            data[column] = np.ascontiguousarray(series.to_numpy())
+        else:
+            data[column] = series.astype(object).where(series.notna(), None).tolist()
+    return orjson.dumps({"columns": list(df.columns), "data": data}, option=orjson.OPT_SERIALIZE_NUMPY)
+
+
+def to_arrow_ipc(df: pd.DataFrame) -> bytes:
+    table = pa.Table.from_pandas(df, preserve_index=False)
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, table.schema) as writer:
+        writer.write_table(table)
+    return sink.getvalue().to_pybytes()
+
+
+def to_csv(df: pd.DataFrame) -> bytes:
+    return with_text_values(df).to_csv(index=False).encode("utf-8")
+
+
+SERIALIZERS: Dict[str, Callable[[pd.DataFrame], bytes]] = {
+    FORMAT_JSON: to_json_records,
+    FORMAT_COLUMNAR: to_columnar_json,
+    FORMAT_ARROW: to_arrow_ipc,
+    FORMAT_CSV: to_csv,
+}
+
+
+def iter_ndjson(df: pd.DataFrame, batch_rows: int = STREAM_BATCH_ROWS) -> Iterator[bytes]:
+    """Serialize rows as newline-delimited JSON, one batch of rows at a time."""
+    for start in range(0, len(df), batch_rows):
+        batch = with_text_values(df.iloc[start:start + batch_rows]).fillna('')
+        yield batch.to_json(orient="records", lines=True, double_precision=15, force_ascii=False).encode()
+
+
+def iter_columnar_json(df: pd.DataFrame, batch_rows: int = STREAM_BATCH_ROWS) -> Iterator[bytes]:
+    """One columnar JSON document per batch, newline-delimited."""
+    for start in range(0, len(df), batch_rows):
+        yield to_columnar_json(df.iloc[start:start + batch_rows]) + b"\n"
+
+
+def iter_arrow_ipc(df: pd.DataFrame, batch_rows: int = STREAM_BATCH_ROWS) -> Iterator[bytes]:
+    """A single Arrow IPC stream, flushed to the client one record batch at a time."""
+    schema = pa.Schema.from_pandas(df, preserve_index=False)
+    sink = io.BytesIO()
+    with pa.ipc.new_stream(sink, schema) as writer:
+        for start in range(0, len(df), batch_rows):
+            writer.write_table(pa.Table.from_pandas(df.iloc[start:start + batch_rows], schema=schema, preserve_index=False))
+            yield _drain(sink)
+    yield _drain(sink)
+
+
+def iter_csv(df: pd.DataFrame, batch_rows: int = STREAM_BATCH_ROWS) -> Iterator[bytes]:
+    yield df.iloc[:0].to_csv(index=False).encode("utf-8")
+    for start in range(0, len(df), batch_rows):
+        yield with_text_values(df.iloc[start:start + batch_rows]).to_csv(index=False, header=False).encode("utf-8")
+
+
+STREAM_SERIALIZERS: Dict[str, Callable[[pd.DataFrame], Iterator[bytes]]] = {
+    FORMAT_JSON: iter_ndjson,
+    FORMAT_COLUMNAR: iter_columnar_json,
+    FORMAT_ARROW: iter_arrow_ipc,
+    FORMAT_CSV: iter_csv,
+}
+
+
+def _drain(sink: io.BytesIO) -> bytes:
+    chunk = sink.getvalue()
+    sink.seek(0)
+    sink.truncate()
+    return chunk
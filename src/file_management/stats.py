@@ -0,0 +1,239 @@
+import os
+import uuid
+from typing import Any, Dict, List, Optional
+
+import numpy as np
+import pandas as pd
+import pyarrow as pa
+import pyarrow.compute as pc
+
+from src.file_management.storage import artifact_dir
+
+HLL_PRECISION = 12
+
+# Text columns with at most this many distinct values, and this share of their non-null values, are read as categoricals.
+CATEGORY_MAX_VALUES = 65536
+CATEGORY_MAX_RATIO = 0.5
+
+DATE_DTYPE = "date32[pyarrow]"
+DATETIME_DTYPE = "datetime64[ns]"
+CATEGORY_DTYPE = "category"
+FLOAT32_DTYPE = "float32"
+INTEGER_DTYPES = ("int8", "int16", "int32")
+
+# Text columns are read as dates or timestamps only when every value is written the one way the
+# service renders them back, so responses do not change.
+TEMPORAL_PATTERNS = {
+    DATE_DTYPE: r"^\d{4}-\d{2}-\d{2}$",
+    DATETIME_DTYPE: r"^\d{4}-\d{2}-\d{2} \d{2}:\d{2}:\d{2}$",
+}
+DATETIME_RANGE = ("1678", "2262")
+
+
+class HyperLogLog:
+    """
+    Distinct-count sketch over 64-bit hashes with 2 ** `precision` one-byte registers (about 1.6%
+    standard error at the default precision). Sketches of the same precision can be merged, so
+    statistics can be kept up to date when rows are added without rescanning the dataset.
+    """
+
+    def __init__(self, precision: int = HLL_PRECISION, registers: Optional[np.ndarray] = None):
+        self.precision = precision
+        self.registers = np.zeros(1 << precision, dtype=np.uint8) if registers is None else registers
+
+    def add_hashes(self, hashes: np.ndarray) -> None:
+        if not len(hashes):
+            return
+        value_bits = 64 - self.precision
+        buckets = (hashes >> np.uint64(value_bits)).astype(np.intp)
+        # The remaining bits fit in a float64 mantissa, so frexp gives their exact bit length.
+        _, bit_lengths = np.frexp((hashes & np.uint64((1 << value_bits) - 1)).astype(np.float64))
+        ranks = (value_bits - bit_lengths + 1).astype(np.uint8)
+        np.maximum.at(self.registers, buckets, ranks)
+
+    def add(self, values: np.ndarray) -> None:
+        self.add_hashes(pd.util.hash_array(values))
+
+    def merge(self, other: "HyperLogLog") -> None:
+        np.maximum(self.registers, other.registers, out=self.registers)
+
+    def estimate(self) -> int:
+        m = len(self.registers)
+        raw = (0.7213 / (1 + 1.079 / m)) * m * m / np.sum(np.ldexp(1.0, -self.registers.astype(np.int64)))
+        empty_registers = int(np.count_nonzero(self.registers == 0))
+        if raw <= 2.5 * m and empty_registers:
+            return round(m * np.log(m / empty_registers))
+        return round(raw)
+
+
+class _ColumnProfile:
+    def __init__(self, data_type: pa.DataType):
+        self.data_type = data_type
+        self.count = 0
+        self.null_count = 0
+        self.min: Any = None
+        self.max: Any = None
+        self.max_length: Optional[int] = 0 if pa.types.is_string(data_type) else None
+        self.sketch = HyperLogLog()
+        self.float32_exact = pa.types.is_float64(data_type)
+        self.temporal_dtypes = list(TEMPORAL_PATTERNS) if pa.types.is_string(data_type) else []
+
+    @classmethod
+    def restore(
+            cls,
+            data_type: pa.DataType,
+            stats: Dict[str, Any],
+            registers: np.ndarray,
+            read_dtype: Optional[str],
+    ) -> "_ColumnProfile":
+        """
+        The profile a column's statistics, sketch and read schema dtype were finished from. Which
+        compact dtypes the values fit is only known for the one they were read with, so the column
+        keeps at most that one.
+        """
+        profile = cls(data_type)
+        profile.count, profile.null_count = stats["count"], stats["null_count"]
+        profile.min, profile.max = stats["min"], stats["max"]
+        if profile.max_length is not None:
+            profile.max_length = stats.get("max_length") or 0
+        profile.sketch = HyperLogLog(registers=registers.copy())
+        profile.float32_exact = profile.float32_exact and read_dtype == FLOAT32_DTYPE
+        profile.temporal_dtypes = [dtype for dtype in profile.temporal_dtypes if dtype == read_dtype]
+        return profile
+
+    def update(self, values: pa.Array) -> None:
+        self.null_count += values.null_count
+        self.count += len(values) - values.null_count
+        if len(values) == values.null_count:
+            return
+        min_max = pc.min_max(values)
+        for bound, keep in (("min", min), ("max", max)):
+            value = min_max[bound].as_py()
+            if value is not None:
+                current = getattr(self, bound)
+                setattr(self, bound, value if current is None else keep(current, value))
+        if self.max_length is not None:
+            self.max_length = max(self.max_length, pc.max(pc.utf8_length(values)).as_py())
+        if self.float32_exact:
+            self.float32_exact = pc.all(pc.equal(values.cast(pa.float32(), safe=False).cast(pa.float64()), values)).as_py()
+        if self.temporal_dtypes:
+            self.temporal_dtypes = [dtype for dtype in self.temporal_dtypes if _is_temporal(values, dtype)]
+        self.sketch.add(values.drop_null().to_numpy(zero_copy_only=False))
+
+    def compact_dtype(self) -> Optional[str]:
+        """The smallest pandas dtype holding every value of the column unchanged, if smaller than the default one."""
+        if not self.count:
+            return None
+        if pa.types.is_integer(self.data_type) and not self.null_count:
+            for dtype in INTEGER_DTYPES:
+                bounds = np.iinfo(dtype)
+                if bounds.min <= self.min and self.max <= bounds.max:
+                    return dtype if np.dtype(dtype).itemsize < self.data_type.bit_width // 8 else None
+            return None
+        if self.float32_exact:
+            return FLOAT32_DTYPE
+        if self.temporal_dtypes:
+            dtype = self.temporal_dtypes[0]
+            if dtype == DATE_DTYPE or DATETIME_RANGE[0] <= self.min and self.max < DATETIME_RANGE[1]:
+                return dtype
+        if pa.types.is_string(self.data_type):
+            distinct_count = self.sketch.estimate()
+            if distinct_count <= min(CATEGORY_MAX_VALUES, self.count * CATEGORY_MAX_RATIO):
+                return CATEGORY_DTYPE
+        return None
+
+    def finish(self) -> Dict[str, Any]:
+        stats = {
+            "dtype": str(self.data_type),
+            "count": self.count,
+            "null_count": self.null_count,
+            "distinct_count": min(self.sketch.estimate(), self.count),
+            "min": self.min,
+            "max": self.max,
+        }
+        if self.max_length is not None:
+            stats["max_length"] = self.max_length
+        return stats
+
+
+class ColumnProfiler:
+    """
+    Collects per-column statistics from the record batches of a dataset as they stream past: type,
+    non-null and null counts, an estimated number of distinct values, min/max and, for text
+    columns, the longest value. Meant to be fed by `build_sidecar` so profiling costs no extra pass.
+    """
+
+    def __init__(self):
+        self._profiles: Dict[str, _ColumnProfile] = {}
+
+    @classmethod
+    def resume(
+            cls,
+            schema: pa.Schema,
+            column_stats: Dict[str, Dict[str, Any]],
+            sketches: Dict[str, np.ndarray],
+            read_schema: Optional[Dict[str, str]],
+    ) -> "ColumnProfiler":
+        """
+        A profiler that has already seen the rows the statistics and sketches were collected from,
+        so that feeding it rows appended since keeps them up to date without rescanning the dataset.
+        """
+        profiler = cls()
+        profiler._profiles = {
+            field.name: _ColumnProfile.restore(
+                field.type, column_stats[field.name], sketches[field.name], (read_schema or {}).get(field.name)
+            )
+            for field in schema
+        }
+        return profiler
+
+    def update(self, batch: pa.RecordBatch) -> None:
+        if not self._profiles:
+            self._profiles = {field.name: _ColumnProfile(field.type) for field in batch.schema}
+        for name, values in zip(batch.schema.names, batch.columns):
+            self._profiles[name].update(values)
+
+    def finish(self) -> Dict[str, Dict[str, Any]]:
+        return {name: profile.finish() for name, profile in self._profiles.items()}
+
+    def read_schema(self) -> Dict[str, str]:
+        """Compact dtypes to read the profiled columns with, for the columns that have one; see `_ColumnProfile.compact_dtype`."""
+        schema = {name: profile.compact_dtype() for name, profile in self._profiles.items()}
+        return {name: dtype for name, dtype in schema.items() if dtype is not None}
+
+    def save_sketches(self, file_name: str) -> None:
+        names = list(self._profiles)
+        registers = [self._profiles[name].sketch.registers for name in names]
+        save_sketches(file_name, names, registers)
+
+
+def _is_temporal(values: pa.Array, dtype: str) -> bool:
+    if not pc.all(pc.match_substring_regex(values, TEMPORAL_PATTERNS[dtype])).as_py():
+        return False
+    try:
+        values.cast(pa.timestamp("s"))
+    except pa.ArrowInvalid:
+        return False
+    return True
+
+
+def sketch_path(file_name: str) -> str:
+    return os.path.join(artifact_dir(file_name), "distinct_sketches.npz")
+
+
+def save_sketches(file_name: str, columns: List[str], registers: List[np.ndarray]) -> None:
+    path = sketch_path(file_name)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    temp_path = f"{path}.{uuid.uuid4().hex}.part"
+    with open(temp_path, "wb") as f:
+        np.savez(f, columns=np.array(columns, dtype=str), registers=np.array(registers, dtype=np.uint8).reshape(len(columns), -1))
+    os.replace(temp_path, path)
+
+
+def load_sketches(file_name: str) -> Optional[Dict[str, np.ndarray]]:
+    """The distinct-count sketch registers saved for each column of a dataset, or None if it has none."""
+    try:
+        with np.load(sketch_path(file_name), allow_pickle=False) as data:
+            return dict(zip(data["columns"].tolist(), data["registers"]))
+    except FileNotFoundError:
+        return None
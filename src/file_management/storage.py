@@ -0,0 +1,403 @@
+import os
+import shutil
+import uuid
+from typing import Any, Callable, Dict, Hashable, Iterator, List, Optional
+
+import pandas as pd
+import pyarrow as pa
+import pyarrow.csv as pa_csv
+import pyarrow.parquet as pq
+
+from src.config import (
+    DATASET_COMPRESSION, DATASET_COMPRESSION_BLOCK_SIZE, DATASET_COMPRESSION_LEVEL, DATASETS_DIR, SIDECAR_BLOCK_SIZE,
+    SIDECAR_DIR, SIDECAR_MAX_SEGMENTS, UPLOAD_CHUNK_SIZE
+)
+from src.file_management.schemas import FileInfoInDB
+from src.metrics import DATASET_BYTES_READ
+
+# Encoding of datasets stored before their encoding was detected.
+CSV_ENCODING = "latin1"
+ARROW_ENCODINGS = {"utf-8": "utf8", "utf-8-sig": "utf8"}
+
+COMPRESSION_NONE = "none"
+COMPRESSION_MAGIC = {b"\x1f\x8b": "gzip", b"\x28\xb5\x2f\xfd": "zstd"}
+
+BLOB_NAMESPACE = ".blobs"
+
+
+def dataset_path(file_name: str) -> str:
+    return os.path.join(DATASETS_DIR, file_name)
+
+
+def sidecar_path(file_name: str) -> str:
+    return os.path.join(SIDECAR_DIR, f"{file_name}.parquet")
+
+
+def artifact_dir(file_name: str) -> str:
+    """Directory holding derived per-dataset artifacts such as search indexes."""
+    return os.path.join(SIDECAR_DIR, f"{file_name}.artifacts")
+
+
+def sidecar_segment_dir(file_name: str) -> str:
+    """Directory holding the Parquet segments of rows appended to a dataset after its sidecar was built."""
+    return os.path.join(artifact_dir(file_name), "segments")
+
+
+def sidecar_files(file_name: str) -> List[str]:
+    """The Parquet files making up a dataset's sidecar, in row order, or an empty list if it has none."""
+    parquet_path = sidecar_path(file_name)
+    if not os.path.exists(parquet_path):
+        return []
+    segment_dir = sidecar_segment_dir(file_name)
+    if not os.path.isdir(segment_dir):
+        return [parquet_path]
+    segments = sorted(name for name in os.listdir(segment_dir) if name.endswith(".parquet"))
+    return [parquet_path, *(os.path.join(segment_dir, name) for name in segments)]
+
+
+def blob_key(content_hash: str) -> str:
+    """
+    Storage key of the content-addressed copy of a dataset. Keys are used like file names by the
+    path helpers above, so a blob has its data file, sidecar and artifacts like any dataset.
+    """
+    return os.path.join(BLOB_NAMESPACE, content_hash)
+
+
+def storage_key(file: FileInfoInDB) -> str:
+    """Key a file's data and derived artifacts are stored under: its blob, or its own name for files stored before blobs."""
+    return blob_key(file.blob_hash) if file.blob_hash else file.file_name
+
+
+def dataset_version(file: FileInfoInDB) -> Hashable:
+    if file.content_hash:
+        return file.content_hash
+    return os.path.getmtime(dataset_path(storage_key(file)))
+
+
+def link_blob(file_name: str, content_hash: str) -> bool:
+    """
+    Make dataset `file_name` and the blob of its content hard links to one file, so identical
+    datasets take the space of one. Returns True if the blob already existed, in which case the
+    dataset is replaced by a link to it. Idempotent, and recreates a blob removed meanwhile.
+    """
+    path, blob_path = dataset_path(file_name), dataset_path(blob_key(content_hash))
+    os.makedirs(os.path.dirname(blob_path), exist_ok=True)
+    try:
+        os.link(path, blob_path)
+        return False
+    except FileExistsError:
+        pass
+    if not os.path.samefile(path, blob_path):
+        temp_path = f"{path}.{uuid.uuid4().hex}.part"
+        os.link(blob_path, temp_path)
+        os.replace(temp_path, path)
+    return True
+
+
+def detect_compression(path: str) -> Optional[str]:
+    """Codec a stored dataset is compressed with, recognized by its magic bytes, or None for a plain CSV."""
+    with open(path, "rb") as f:
+        head = f.read(4)
+    for magic, compression in COMPRESSION_MAGIC.items():
+        if head.startswith(magic):
+            return compression
+    return None
+
+
+def open_dataset_file(path: str) -> pa.NativeFile:
+    """Open a stored dataset for reading, decompressing it on the fly if it is compressed."""
+    return pa.input_stream(path, compression=detect_compression(path), buffer_size=SIDECAR_BLOCK_SIZE)
+
+
+def iter_dataset_file(file_name: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> Iterator[bytes]:
+    """Yield the raw CSV of a stored dataset block by block."""
+    with open_dataset_file(dataset_path(file_name)) as f:
+        while chunk := f.read(chunk_size):
+            yield chunk
+
+
+class DatasetWriter:
+    """
+    Writes the bytes of a dataset to `path`, compressed with `compression` (`none`, `gzip` or
+    `zstd`). Data is compressed in blocks of `block_size` bytes, each an independent gzip member or
+    zstd frame, which every reader treats as one continuous stream.
+    """
+
+    def __init__(
+            self,
+            path: str,
+            compression: str = DATASET_COMPRESSION,
+            level: int = DATASET_COMPRESSION_LEVEL,
+            block_size: int = DATASET_COMPRESSION_BLOCK_SIZE,
+    ):
+        if compression != COMPRESSION_NONE and compression not in COMPRESSION_MAGIC.values():
+            raise ValueError(f"Unknown dataset compression: {compression}")
+        self.compression = compression
+        self.stored_size = 0
+        self._codec = None if compression == COMPRESSION_NONE else pa.Codec(compression, compression_level=level)
+        self._block_size = block_size
+        self._buffer = bytearray()
+        self._file = open(path, "wb")
+
+    def write(self, chunk: bytes) -> None:
+        if self._codec is None:
+            self._write(chunk)
+            return
+        self._buffer += chunk
+        if len(self._buffer) >= self._block_size:
+            self._flush_block()
+
+    def close(self, sync: bool = True) -> None:
+        if self._buffer:
+            self._flush_block()
+        if sync:
+            self._file.flush()
+            os.fsync(self._file.fileno())
+        self._file.close()
+
+    def copy_stored(self, path: str, chunk_size: int = UPLOAD_CHUNK_SIZE) -> None:
+        """
+        Write the stored bytes of a dataset compressed with the same codec as they are. Its blocks
+        are independent gzip members or zstd frames, so blocks written after them still follow on.
+        """
+        if self._buffer:
+            self._flush_block()
+        with open(path, "rb") as f:
+            while chunk := f.read(chunk_size):
+                self._write(chunk)
+
+    def discard(self) -> None:
+        self._file.close()
+
+    def _flush_block(self) -> None:
+        self._write(self._codec.compress(bytes(self._buffer), asbytes=True))
+        self._buffer.clear()
+
+    def _write(self, data: bytes) -> None:
+        self._file.write(data)
+        self.stored_size += len(data)
+
+
+def _open_csv(
+        csv_path: str,
+        column_types: Optional[Dict[str, pa.DataType]] = None,
+        encoding: str = CSV_ENCODING,
+) -> pa_csv.CSVStreamingReader:
+    # Arrow decodes UTF-8 natively, skipping a byte order mark; other encodings go through Python's codecs.
+    return pa_csv.open_csv(
+        open_dataset_file(csv_path),
+        read_options=pa_csv.ReadOptions(encoding=ARROW_ENCODINGS.get(encoding, encoding), block_size=SIDECAR_BLOCK_SIZE),
+        convert_options=pa_csv.ConvertOptions(column_types=column_types, strings_can_be_null=True),
+    )
+
+
+def _sidecar_column_types(csv_path: str, encoding: str) -> Dict[str, pa.DataType]:
+    with _open_csv(csv_path, encoding=encoding) as reader:
+        inferred_schema = reader.schema
+    return {
+        field.name: pa.string() if pa.types.is_temporal(field.type) or pa.types.is_null(field.type) else field.type
+        for field in inferred_schema
+    }
+
+
+def build_sidecar(
+        csv_path: str,
+        parquet_path: str,
+        on_batch: Optional[Callable[[pa.RecordBatch], None]] = None,
+        encoding: str = CSV_ENCODING,
+) -> Dict[str, str]:
+    """
+    Convert a CSV dataset into a Parquet sidecar one record batch at a time and return its schema.
+    Each batch is also handed to `on_batch`, if given, before it is written.
+
+    Types are inferred from the first block. Temporal and all-null columns are kept as strings so
+    the sidecar yields the same values `pd.read_csv` would. Raises `pyarrow.ArrowException` when a
+    later block does not fit the inferred schema; callers then simply serve the CSV.
+    """
+    column_types = _sidecar_column_types(csv_path, encoding)
+
+    os.makedirs(os.path.dirname(parquet_path), exist_ok=True)
+    temp_path = f"{parquet_path}.{uuid.uuid4().hex}.part"
+    try:
+        with _open_csv(csv_path, column_types, encoding) as reader, pq.ParquetWriter(temp_path, reader.schema) as writer:
+            for batch in reader:
+                if on_batch is not None:
+                    on_batch(batch)
+                writer.write_batch(batch)
+        os.replace(temp_path, parquet_path)
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return {name: str(data_type) for name, data_type in column_types.items()}
+
+
+def read_sidecar_schema(file_name: str) -> Optional[pa.Schema]:
+    parquet_path = sidecar_path(file_name)
+    return pq.read_schema(parquet_path) if os.path.exists(parquet_path) else None
+
+
+def read_sidecar_rows(file_name: str, csv_path: str, encoding: str = CSV_ENCODING) -> pa.Table:
+    """Rows of a CSV with the columns of a dataset, such as rows appended to it, read with the types of its sidecar."""
+    column_types = {field.name: field.type for field in read_sidecar_schema(file_name)}
+    with _open_csv(csv_path, column_types, encoding) as reader:
+        return reader.read_all()
+
+
+def _link_replacing(path: str, destination: str) -> None:
+    temp_path = f"{destination}.{uuid.uuid4().hex}.part"
+    os.link(path, temp_path)
+    os.replace(temp_path, destination)
+
+
+def append_sidecar(
+        file_name: str,
+        appended_file_name: str,
+        csv_path: str,
+        on_batch: Optional[Callable[[pa.RecordBatch], None]] = None,
+        encoding: str = CSV_ENCODING,
+        max_segments: int = SIDECAR_MAX_SEGMENTS,
+) -> Dict[str, str]:
+    """
+    Build the sidecar of `appended_file_name`, which holds the rows of `file_name` followed by those
+    of the CSV at `csv_path`, converting only the new rows, and return its schema. They are read
+    with the types of the existing sidecar and written as a new segment; the sidecar and its
+    earlier segments are shared as hard links. Once there would be more than `max_segments`
+    segments, they are compacted into a single sidecar by copying record batches, which still
+    parses no CSV. Raises `pyarrow.ArrowException` when the new rows do not fit the sidecar's types.
+    """
+    schema = read_sidecar_schema(file_name)
+    column_types = {field.name: field.type for field in schema}
+    parts = sidecar_files(file_name)
+    segment_dir = sidecar_segment_dir(appended_file_name)
+    os.makedirs(segment_dir, exist_ok=True)
+    segment_path = os.path.join(segment_dir, f"{len(parts):06d}.parquet")
+    temp_path = f"{segment_path}.{uuid.uuid4().hex}.part"
+    try:
+        with _open_csv(csv_path, column_types, encoding) as reader, pq.ParquetWriter(temp_path, schema) as writer:
+            for batch in reader:
+                if on_batch is not None:
+                    on_batch(batch)
+                writer.write_batch(batch)
+        if len(parts) > max_segments:
+            compacted_path = f"{sidecar_path(appended_file_name)}.{uuid.uuid4().hex}.part"
+            try:
+                with pq.ParquetWriter(compacted_path, schema) as writer:
+                    for path in [*parts, temp_path]:
+                        for batch in pq.ParquetFile(path).iter_batches():
+                            writer.write_batch(batch)
+                os.replace(compacted_path, sidecar_path(appended_file_name))
+            finally:
+                if os.path.exists(compacted_path):
+                    os.remove(compacted_path)
+            shutil.rmtree(segment_dir, ignore_errors=True)
+        else:
+            for position, path in enumerate(parts[1:], 1):
+                _link_replacing(path, os.path.join(segment_dir, f"{position:06d}.parquet"))
+            os.replace(temp_path, segment_path)
+            _link_replacing(parts[0], sidecar_path(appended_file_name))
+    except BaseException:
+        shutil.rmtree(segment_dir, ignore_errors=True)
+        raise
+    finally:
+        if os.path.exists(temp_path):
+            os.remove(temp_path)
+    return {name: str(data_type) for name, data_type in column_types.items()}
+
+
+def _arrow_type(dtype: str) -> pa.DataType:
+    if dtype == "date32[pyarrow]":
+        return pa.date32()
+    if dtype == "datetime64[ns]":
+        return pa.timestamp("ns")
+    return pa.from_numpy_dtype(dtype)
+
+
+def cast_to_schema(table: pa.Table, schema: Optional[Dict[str, str]]) -> pa.Table:
+    """
+    Convert the columns of a table to the Arrow types matching the pandas dtypes of its read
+    schema: narrower numbers, parsed dates and timestamps, and dictionary-encoded categoricals.
+    """
+    for name, dtype in (schema or {}).items():
+        if name not in table.column_names:
+            continue
+        position = table.column_names.index(name)
+        column = table.column(position)
+        if dtype == "category":
+            column = column.dictionary_encode()
+        else:
+            if pa.types.is_string(column.type) and dtype == "date32[pyarrow]":
+                column = column.cast(pa.timestamp("s"))
+            column = column.cast(_arrow_type(dtype))
+        table = table.set_column(position, name, column)
+    return table
+
+
+def _order_categories(series: pd.Series) -> pd.Series:
+    # Sorted, ordered categories keep sorting and min/max on categoricals as they are on text.
+    return series.cat.reorder_categories(series.cat.categories.sort_values(), ordered=True)
+
+
+def table_to_frame(
+        table: pa.Table,
+        types: Optional[Dict[pa.DataType, Any]] = None,
+        split_blocks: bool = False,
+) -> pd.DataFrame:
+    """Convert a table cast by `cast_to_schema` to the pandas dtypes of its read schema; `types` maps further Arrow types."""
+    types_mapper = {pa.date32(): pd.ArrowDtype(pa.date32()), **(types or {})}.get
+    df = table.to_pandas(split_blocks=split_blocks, types_mapper=types_mapper)
+    for name in df.columns:
+        if isinstance(df[name].dtype, pd.CategoricalDtype):
+            df[name] = _order_categories(df[name])
+    return df
+
+
+def _read_sidecar(paths: List[str], columns: Optional[List[str]] = None) -> pa.Table:
+    DATASET_BYTES_READ.inc(sum(os.path.getsize(path) for path in paths))
+    tables = [pq.read_table(path, columns=columns) for path in paths]
+    return tables[0] if len(tables) == 1 else pa.concat_tables(tables)
+
+
+def load_table(file_name: str, schema: Optional[Dict[str, str]] = None, encoding: str = CSV_ENCODING) -> pa.Table:
+    """All columns of a dataset as an Arrow table cast to its read schema, from its sidecar or, without one, from the CSV."""
+    parquet_paths = sidecar_files(file_name)
+    if parquet_paths:
+        return cast_to_schema(_read_sidecar(parquet_paths), schema)
+    return pa.Table.from_pandas(load_dataframe(file_name, schema=schema, encoding=encoding), preserve_index=False)
+
+
+def load_dataframe(
+        file_name: str,
+        columns: Optional[List[str]] = None,
+        schema: Optional[Dict[str, str]] = None,
+        encoding: str = CSV_ENCODING,
+) -> pd.DataFrame:
+    """
+    Columns of a dataset from its sidecar or, without one, from the CSV. With a read schema, as
+    recorded at upload, columns are read straight into their compact dtypes without type inference.
+    """
+    parquet_paths = sidecar_files(file_name)
+    if parquet_paths:
+        return table_to_frame(cast_to_schema(_read_sidecar(parquet_paths, columns), schema))
+    csv_path = dataset_path(file_name)
+    DATASET_BYTES_READ.inc(os.path.getsize(csv_path))
+    if schema:
+        # Read schemas come from the sidecar's profile, so Arrow can read the CSV the way it did then.
+        with _open_csv(csv_path, _sidecar_column_types(csv_path, encoding), encoding) as reader:
+            table = reader.read_all()
+        if columns is not None:
+            table = table.select(columns)
+        return table_to_frame(cast_to_schema(table, schema))
+    with open_dataset_file(csv_path) as f:
+        return pd.read_csv(f, encoding=encoding, usecols=columns)
+
+
+def remove_artifacts(file_name: str) -> None:
+    parquet_path = sidecar_path(file_name)
+    if os.path.exists(parquet_path):
+        os.remove(parquet_path)
+    shutil.rmtree(artifact_dir(file_name), ignore_errors=True)
+
+
+def remove_dataset(file_name: str) -> None:
+    os.remove(dataset_path(file_name))
+    remove_artifacts(file_name)
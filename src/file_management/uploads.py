@@ -0,0 +1,237 @@
+import asyncio
+import base64
+import binascii
+import hashlib
+import json
+import logging
+import os
+import shutil
+import time
+import uuid
+from dataclasses import asdict, dataclass
+from typing import Any, Dict, List, Optional, Sequence, Tuple
+
+from src.config import UPLOAD_SESSION_DIR, UPLOAD_SESSION_GC_INTERVAL, UPLOAD_SESSION_TTL
+from src.file_management.indexes import InvalidIndexColumnError
+from src.file_management.ingest import IngestResult, adopt_file, read_csv_header
+from src.file_management.storage import dataset_path, link_blob
+from src.profiling import run_in_threadpool
+
+logger = logging.getLogger(__name__)
+
+CHECKSUM_ALGORITHMS = ("md5", "sha1", "sha256")
+
+
+class UploadSessionNotFoundError(Exception):
+    pass
+
+
+class InvalidChunkError(Exception):
+    pass
+
+
+class ChecksumMismatchError(Exception):
+    pass
+
+
+class UploadIncompleteError(Exception):
+    pass
+
+
+@dataclass
+class UploadSession:
+    """
+    A resumable upload: the declared file is assembled in `data` at whatever offsets its chunks are
+    sent to, so chunks may arrive in any order and in parallel. Every verified chunk is recorded as
+    a `start end` line in `ranges`; bytes outside recorded ranges are never trusted.
+    """
+    upload_id: str
+    file_name: str
+    length: int
+    expires_at: float
+
+    @property
+    def directory(self) -> str:
+        return os.path.join(UPLOAD_SESSION_DIR, self.upload_id)
+
+    @property
+    def data_path(self) -> str:
+        return os.path.join(self.directory, "data")
+
+    @property
+    def ranges_path(self) -> str:
+        return os.path.join(self.directory, "ranges")
+
+    @property
+    def meta_path(self) -> str:
+        return os.path.join(self.directory, "meta.json")
+
+    def received_ranges(self) -> List[Tuple[int, int]]:
+        """Merged, sorted byte ranges `[start, end)` received so far."""
+        with open(self.ranges_path) as f:
+            ranges = sorted(tuple(map(int, line.split())) for line in f if line.strip())
+        merged: List[List[int]] = []
+        for start, end in ranges:
+            if merged and start <= merged[-1][1]:
+                merged[-1][1] = max(merged[-1][1], end)
+            else:
+                merged.append([start, end])
+        return [(start, end) for start, end in merged]
+
+    def offset(self) -> int:
+        """Number of bytes received without a gap from the start, where a sequential client resumes."""
+        ranges = self.received_ranges()
+        return ranges[0][1] if ranges and ranges[0][0] == 0 else 0
+
+    def info(self) -> Dict[str, Any]:
+        return {
+            "upload_id": self.upload_id,
+            "file_name": self.file_name,
+            "length": self.length,
+            "offset": self.offset(),
+            "received_ranges": self.received_ranges(),
+            "expires_at": self.expires_at,
+        }
+
+
+def create_upload_session(file_name: str, length: int, ttl: float = UPLOAD_SESSION_TTL) -> UploadSession:
+    upload = UploadSession(uuid.uuid4().hex, file_name, length, time.time() + ttl)
+    os.makedirs(upload.directory)
+    with open(upload.data_path, "wb") as f:
+        f.truncate(length)
+    open(upload.ranges_path, "w").close()
+    with open(upload.meta_path, "w") as f:
+        json.dump(asdict(upload), f)
+    return upload
+
+
+def get_upload_session(upload_id: str) -> UploadSession:
+    if not upload_id.isalnum():
+        raise UploadSessionNotFoundError(upload_id)
+    try:
+        with open(os.path.join(UPLOAD_SESSION_DIR, upload_id, "meta.json")) as f:
+            upload = UploadSession(**json.load(f))
+    except FileNotFoundError:
+        raise UploadSessionNotFoundError(upload_id)
+    if upload.expires_at < time.time():
+        remove_upload_session(upload)
+        raise UploadSessionNotFoundError(upload_id)
+    return upload
+
+
+def parse_checksum(header: Optional[str]) -> Optional[Tuple[str, bytes]]:
+    """Parse an `Upload-Checksum: <algorithm> <base64 digest>` header."""
+    if not header:
+        return None
+    try:
+        algorithm, digest = header.split()
+        digest = base64.b64decode(digest, validate=True)
+    except (ValueError, binascii.Error):
+        raise InvalidChunkError("Upload-Checksum must be '<algorithm> <base64 digest>'.")
+    if algorithm not in CHECKSUM_ALGORITHMS:
+        raise InvalidChunkError(f"Unsupported checksum algorithm '{algorithm}', use one of {', '.join(CHECKSUM_ALGORITHMS)}.")
+    return algorithm, digest
+
+
+class ChunkWriter:
+    """
+    Writes one chunk of an upload at its offset as it is received. The chunk only counts once
+    `commit` has checked its length and checksum and recorded its range. Methods are blocking.
+    """
+
+    def __init__(self, upload: UploadSession, offset: int, checksum: Optional[Tuple[str, bytes]] = None):
+        if offset < 0 or offset > upload.length:
+            raise InvalidChunkError(f"Upload-Offset must be between 0 and {upload.length}.")
+        self.upload = upload
+        self.start = offset
+        self.position = offset
+        self.checksum = checksum
+        self._hash = hashlib.new(checksum[0]) if checksum else None
+        self._fd = os.open(upload.data_path, os.O_WRONLY)
+
+    def write(self, chunk: bytes) -> None:
+        if self.position + len(chunk) > self.upload.length:
+            raise InvalidChunkError(f"Chunk extends past the declared upload length of {self.upload.length} bytes.")
+        if self._hash is not None:
+            self._hash.update(chunk)
+        view = memoryview(chunk)
+        while view:
+            written = os.pwrite(self._fd, view, self.position)
+            self.position += written
+            view = view[written:]
+
+    def commit(self) -> None:
+        if self._hash is not None and self._hash.digest() != self.checksum[1]:
+            raise ChecksumMismatchError("Chunk checksum does not match Upload-Checksum.")
+        os.fsync(self._fd)
+        if self.position > self.start:
+            # A single short O_APPEND write, so concurrent chunks never interleave their records.
+            with open(self.upload.ranges_path, "a") as f:
+                f.write(f"{self.start} {self.position}\n")
+
+    def close(self) -> None:
+        os.close(self._fd)
+
+
+def finalize_upload_session(upload: UploadSession, index_columns: Sequence[str] = ()) -> IngestResult:
+    """
+    Move the assembled file of a complete upload into the datasets directory, scan it and share the
+    blob of identical content. The data file is first renamed, so concurrent finalize calls for the
+    same upload can not both proceed. Columns to be indexed are checked against the header
+    beforehand, so a typo does not cost the upload.
+    """
+    offset = upload.offset()
+    if offset < upload.length:
+        raise UploadIncompleteError(f"Upload is incomplete, {offset} of {upload.length} bytes received.")
+    column_names = read_csv_header(upload.data_path)
+    for column in index_columns:
+        if column not in column_names:
+            raise InvalidIndexColumnError(f"Invalid index column name: {column}")
+    claimed_path = f"{upload.data_path}.{uuid.uuid4().hex}.finalizing"
+    try:
+        os.rename(upload.data_path, claimed_path)
+    except FileNotFoundError:
+        raise UploadSessionNotFoundError(upload.upload_id)
+    try:
+        ingest_result = adopt_file(claimed_path, dataset_path(upload.file_name))
+    except BaseException:
+        os.rename(claimed_path, upload.data_path)
+        raise
+    ingest_result.reused = link_blob(upload.file_name, ingest_result.content_hash)
+    remove_upload_session(upload)
+    return ingest_result
+
+
+async def collect_expired_upload_sessions(interval: float = UPLOAD_SESSION_GC_INTERVAL) -> None:
+    """Background task removing expired upload sessions every `interval` seconds."""
+    while True:
+        removed = await run_in_threadpool(remove_expired_upload_sessions)
+        if removed:
+            logger.info("Removed %d expired upload sessions", len(removed))
+        await asyncio.sleep(interval)
+
+
+def remove_upload_session(upload: UploadSession) -> None:
+    shutil.rmtree(upload.directory, ignore_errors=True)
+
+
+def remove_expired_upload_sessions(now: Optional[float] = None) -> List[str]:
+    """Delete the partial data of every expired upload session and return their ids."""
+    now = time.time() if now is None else now
+    removed = []
+    try:
+        upload_ids = os.listdir(UPLOAD_SESSION_DIR)
+    except FileNotFoundError:
+        return removed
+    for upload_id in upload_ids:
+        directory = os.path.join(UPLOAD_SESSION_DIR, upload_id)
+        try:
+            with open(os.path.join(directory, "meta.json")) as f:
+                expires_at = json.load(f)["expires_at"]
+        except (OSError, ValueError, KeyError):
+            # Sessions without readable metadata are leftovers of a crash during creation.
+            expires_at = os.path.getmtime(directory) + UPLOAD_SESSION_TTL if os.path.isdir(directory) else now
+        if expires_at < now:
+            shutil.rmtree(directory, ignore_errors=True)
+            removed.append(upload_id)
+    return removed
@@ -1,28 +1,75 @@
-from typing import List, Optional
+import os
+from collections import Counter
+from typing import Any, Dict, List, Optional, Set
 
 from fastapi import Depends
-from sqlalchemy import select
+from sqlalchemy import Row, String, cast, delete, select, tuple_, update
+from sqlalchemy.dialects.postgresql import insert
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.ext.asyncio import AsyncSession
 
 from src.database import get_async_session
-from src.file_management.models import file_info
+from src.file_management.models import blob, file_info
 from src.file_management.schemas import FileInfoInDB
+from src.file_management.storage import blob_key, dataset_path, link_blob, remove_dataset
+from src.profiling import run_in_threadpool
 
 
-async def get_all_file_info_db(
+async def get_file_info_page_db(
+        after_id: int = None,
+        limit: int = 100,
+        sort_by: str = "id",
+        sort_order: str = "asc",
+        name_prefix: str = None,
         session: AsyncSession = Depends(get_async_session)
-) -> List[FileInfoInDB]:
-    column_names = [column.name for column in file_info.columns]
-    select_query = (select(file_info))
+) -> Optional[List[Row]]:
+    """
+    Return one keyset page of file_info rows ordered by `sort_by` with `id` as tie breaker, or None
+    if `after_id` does not exist. Rows only carry the listed columns, with `uploaded_time` already
+    rendered as text, so they can be serialized as they are. `file_size` is the size of the raw CSV
+    and `stored_size` the size it takes on disk, which is smaller when it is stored compressed.
+    """
+    sort_column = file_info.c[sort_by]
+    descending = sort_order == "desc"
+    select_query = select(
+        file_info.c.id,
+        file_info.c.file_name,
+        cast(file_info.c.uploaded_time, String).label("uploaded_time"),
+        file_info.c.column_names,
+        file_info.c.file_size,
+        file_info.c.stored_size,
+        file_info.c.compression,
+    )
+    if name_prefix:
+        select_query = select_query.where(file_info.c.file_name.startswith(name_prefix, autoescape=True))
+    if after_id is not None:
+        anchor = await session.execute(select(sort_column).where(file_info.c.id == after_id))
+        anchor = anchor.fetchone()
+        if anchor is None:
+            return None
+        anchor_key, page_key = tuple_(anchor[0], after_id), tuple_(sort_column, file_info.c.id)
+        select_query = select_query.where(page_key < anchor_key if descending else page_key > anchor_key)
+    if descending:
+        select_query = select_query.order_by(sort_column.desc(), file_info.c.id.desc())
+    else:
+        select_query = select_query.order_by(sort_column, file_info.c.id)
+    result = await session.execute(select_query.limit(limit))
+    return result.fetchall()
+
+
+async def get_existing_file_names_db(
+        file_names: List[str],
+        session: AsyncSession = Depends(get_async_session)
+) -> Set[str]:
+    select_query = select(file_info.c.file_name).where(file_info.c.file_name.in_(file_names))
     result = await session.execute(select_query)
-    file_info_in_db = result.fetchall()
-    file_info_in_db_with_column_names = [{column_name: value for column_name, value in zip(column_names, row)} for row in file_info_in_db]
-    return [FileInfoInDB(**file_info_row) for file_info_row in file_info_in_db_with_column_names]
+    return set(result.scalars())
 
 
 async def get_file_db(
         file_name: str = None,
         file_id: int = None,
+        blob_hash: str = None,
         session: AsyncSession = Depends(get_async_session)
 ) -> Optional[FileInfoInDB]:
     select_query = select(file_info)
@@ -30,6 +77,8 @@ async def get_file_db(
         select_query = select_query.where(file_info.c.file_name == file_name)
     elif file_id:
         select_query = select_query.where(file_info.c.id == file_id)
+    elif blob_hash:
+        select_query = select_query.where(file_info.c.blob_hash == blob_hash).order_by(file_info.c.id).limit(1)
     file = await session.execute(select_query)
     file = file.fetchone()
     if file is None:
@@ -38,6 +87,129 @@ async def get_file_db(
         id=file.id,
         file_name=file.file_name,
         uploaded_time=file.uploaded_time,
-        column_names=file.column_names
+        column_names=file.column_names,
+        content_hash=file.content_hash,
+        file_size=file.file_size,
+        stored_size=file.stored_size,
+        compression=file.compression,
+        row_count=file.row_count,
+        column_types=file.column_types,
+        indexed_columns=file.indexed_columns,
+        column_stats=file.column_stats,
+        blob_hash=file.blob_hash,
+        encoding=file.encoding,
+        read_schema=file.read_schema,
+        version=file.version,
     )
     return result
+
+
+async def update_file_content_db(
+        file: FileInfoInDB,
+        file_values: Dict[str, Any],
+        session: AsyncSession = Depends(get_async_session),
+) -> Optional[int]:
+    """
+    Point the `file_info` row of `file` at new content described by `file_values` and bump its
+    version, unless the row was changed or deleted since `file` was read. Returns the new version,
+    or None if nothing was updated. The row stays locked until the transaction ends.
+    """
+    update_query = (
+        update(file_info).where(file_info.c.id == file.id, file_info.c.version == file.version)
+        .values(**file_values, version=file_info.c.version + 1).returning(file_info.c.version)
+    )
+    return (await session.execute(update_query)).scalar_one_or_none()
+
+
+async def acquire_blobs_db(
+        content_hashes: List[str],
+        session: AsyncSession = Depends(get_async_session)
+) -> Dict[str, int]:
+    """
+    Add one reference per occurrence of each content hash to its blob, creating missing blob rows,
+    and return the new reference counts. The rows stay locked until the transaction ends, so no
+    blob can be released and removed while a file referencing it is being registered.
+    """
+    references = Counter(content_hashes)
+    # Locks are taken in hash order, so concurrent registrations can not deadlock each other.
+    insert_query = insert(blob).values([
+        {"content_hash": content_hash, "ref_count": references[content_hash]} for content_hash in sorted(references)
+    ])
+    insert_query = insert_query.on_conflict_do_update(
+        index_elements=[blob.c.content_hash],
+        set_={"ref_count": blob.c.ref_count + insert_query.excluded.ref_count},
+    ).returning(blob.c.content_hash, blob.c.ref_count)
+    result = await session.execute(insert_query)
+    return {row.content_hash: row.ref_count for row in result}
+
+
+async def release_blob_db(
+        content_hash: str,
+        session: AsyncSession = Depends(get_async_session)
+) -> int:
+    """Drop one reference to a blob and return how many are left; the row is deleted at zero but stays locked."""
+    update_query = (
+        update(blob).where(blob.c.content_hash == content_hash)
+        .values(ref_count=blob.c.ref_count - 1).returning(blob.c.ref_count)
+    )
+    ref_count = (await session.execute(update_query)).scalar_one()
+    if ref_count <= 0:
+        await session.execute(delete(blob).where(blob.c.content_hash == content_hash))
+    return ref_count
+
+
+async def claim_blobs_db(
+        files_values: List[Dict[str, Any]],
+        session: AsyncSession = Depends(get_async_session)
+) -> Dict[str, int]:
+    """
+    Reference the blobs of ingested datasets before their `file_info` rows are inserted. With the
+    blob rows locked, a blob whose last file was deleted meanwhile is recreated from the dataset.
+    """
+    ref_counts = await acquire_blobs_db([values["blob_hash"] for values in files_values], session=session)
+    for values in files_values:
+        await run_in_threadpool(link_blob, values["file_name"], values["blob_hash"])
+    return ref_counts
+
+
+async def register_file_db(
+        file_values: Dict[str, Any],
+        session: AsyncSession = Depends(get_async_session)
+) -> int:
+    """
+    Insert the `file_info` row of an ingested dataset, referencing its blob, and return its id. If
+    the name is taken, the dataset is removed again and the IntegrityError is raised.
+    """
+    ref_counts = {}
+    try:
+        ref_counts = await claim_blobs_db([file_values], session=session)
+        result = await session.execute(insert(file_info).values(**file_values).returning(file_info.c.id))
+        file_id = result.scalar_one()
+        await session.commit()
+        return file_id
+    except IntegrityError:
+        if ref_counts.get(file_values["blob_hash"]) == 1:
+            # No other file references the blob and its row is still locked, so it goes with the dataset.
+            remove_dataset(blob_key(file_values["blob_hash"]))
+        await session.rollback()
+        remove_dataset(file_values["file_name"])
+        raise
+
+
+async def discard_dataset_db(
+        file_name: str,
+        content_hash: str,
+        session: AsyncSession = Depends(get_async_session)
+) -> None:
+    """
+    Remove an ingested dataset that will not be registered, with its blob if no file references it.
+    The blob row is locked meanwhile, so a concurrent upload of the same content waits and then
+    recreates the blob from its own copy. A dataset registered under the name meanwhile is kept.
+    """
+    ref_counts = await acquire_blobs_db([content_hash], session=session)
+    if ref_counts[content_hash] == 1 and os.path.exists(dataset_path(blob_key(content_hash))):
+        remove_dataset(blob_key(content_hash))
+    registered = await get_file_db(file_name=file_name, session=session)
+    await session.rollback()
+    if registered is None:
+        remove_dataset(file_name)
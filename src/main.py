@@ -1,14 +1,58 @@
+import asyncio
+from contextlib import asynccontextmanager
+
 import uvicorn
 from fastapi import FastAPI, status
-from fastapi.responses import JSONResponse
+from fastapi.responses import JSONResponse, Response
+from prometheus_client import CONTENT_TYPE_LATEST
 
-from src.config import APP_NAME
+from src.config import APP_NAME, PROFILING_ENABLED
+from src.database import engine, get_async_session
+from src.file_management.cache import dataframe_cache, result_cache, shared_dataset_cache
+from src.file_management.executor import query_executor
+from src.file_management.jobs import ingest_pipeline
 from src.file_management.router import router as router_file_management
+from src.file_management.uploads import collect_expired_upload_sessions
+from src.metrics import MetricsMiddleware, RuntimeCollector, render_metrics
+from src.profiling import ProfilingMiddleware
 
 app = FastAPI(title=APP_NAME)
 
+app.add_middleware(MetricsMiddleware)
+if PROFILING_ENABLED:
+    app.add_middleware(ProfilingMiddleware)
 app.include_router(router_file_management)
 
+runtime_metrics = RuntimeCollector(
+    engine, {"dataframe": dataframe_cache, "result": result_cache}, query_executor, shared_dataset_cache
+)
+
+
+@app.on_event("startup")
+async def start_upload_session_collector():
+    app.state.upload_session_collector = asyncio.create_task(collect_expired_upload_sessions())
+
+
+@app.on_event("startup")
+async def start_ingest_job_watcher():
+    app.state.ingest_job_watcher = asyncio.create_task(ingest_pipeline.watch(asynccontextmanager(get_async_session)))
+
+
+@app.on_event("shutdown")
+def shutdown_query_executor():
+    query_executor.shutdown()
+
+
+@app.on_event("shutdown")
+def stop_upload_session_collector():
+    app.state.upload_session_collector.cancel()
+
+
+@app.on_event("shutdown")
+def stop_ingest_pipeline():
+    app.state.ingest_job_watcher.cancel()
+    ingest_pipeline.shutdown()
+
 
 @app.get(
     '/healthcheck',
@@ -33,5 +77,29 @@ async def get_healthcheck_response():
     return JSONResponse(status_code=status.HTTP_200_OK, content={'message': 'It works!'})
 
 
+@app.get(
+    '/metrics',
+    response_class=Response,
+    summary="Service metrics",
+    description="Request latencies, per-stage timings, bytes and rows processed, database pool usage and cache "
+                "hit ratios in the Prometheus text format.",
+    response_description="Metrics in the Prometheus text exposition format",
+    tags=["Healthcheck"],
+    status_code=status.HTTP_200_OK,
+    responses={
+        status.HTTP_200_OK: {
+            "description": "Current metrics.",
+            "content": {
+                "text/plain": {
+                    "example": 'cache_hit_ratio{cache="dataframe"} 0.92\n'
+                }
+            }
+        },
+    },
+)
+async def get_metrics():
+    return Response(status_code=status.HTTP_200_OK, content=render_metrics(runtime_metrics), media_type=CONTENT_TYPE_LATEST)
+
+
 if __name__ == "__main__":
     uvicorn.run(app, host="0.0.0.0", port=8765)
@@ -0,0 +1,155 @@
+import time
+from contextlib import contextmanager
+from typing import Any, Dict, Iterator, Mapping, Optional
+
+from prometheus_client import REGISTRY, CollectorRegistry, Counter, Histogram, generate_latest
+from prometheus_client.core import CounterMetricFamily, GaugeMetricFamily
+from prometheus_client.multiprocess import MultiProcessCollector
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.config import PROMETHEUS_MULTIPROC_DIR
+
+# Stages of a request range from sub-millisecond filters to multi-second loads of large files.
+STAGE_BUCKETS = (0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1, 2.5, 5, 10, 30, 60)
+
+REQUEST_LATENCY = Histogram(
+    "http_request_duration_seconds", "Latency of HTTP requests by route template.", ["method", "route", "status"]
+)
+REQUEST_BYTES = Counter("http_request_bytes", "Bytes of request bodies read from clients.", ["route"])
+RESPONSE_BYTES = Counter("http_response_bytes", "Bytes of response bodies written to clients.", ["route"])
+STAGE_LATENCY = Histogram(
+    "stage_duration_seconds", "Time spent in each stage of an operation.", ["operation", "stage"], buckets=STAGE_BUCKETS
+)
+DATASET_BYTES_READ = Counter("dataset_bytes_read", "Bytes of dataset files read to load datasets.")
+DATASET_BYTES_WRITTEN = Counter("dataset_bytes_written", "Bytes of dataset files written by ingestion.")
+ROWS_SCANNED = Counter("rows_scanned", "Rows of loaded datasets that queries ran over.", ["operation"])
+ROWS_RETURNED = Counter("rows_returned", "Rows (or groups) returned by queries.", ["operation"])
+
+
+def observe_stage(operation: str, stage: str, seconds: float) -> None:
+    STAGE_LATENCY.labels(operation, stage).observe(seconds)
+
+
+@contextmanager
+def time_stage(operation: str, stage: str) -> Iterator[None]:
+    started = time.perf_counter()
+    try:
+        yield
+    finally:
+        observe_stage(operation, stage, time.perf_counter() - started)
+
+
+def observe_query(operation: str, stats: Mapping[str, Any], rows_returned: Optional[int] = None) -> None:
+    """Record the `<stage>_ms` timings and row counts a query put into its `stats`."""
+    for name, value in stats.items():
+        if name.endswith("_ms") and value is not None:
+            observe_stage(operation, name[:-3], value / 1000)
+    if "rows_scanned" in stats:
+        ROWS_SCANNED.labels(operation).inc(stats["rows_scanned"])
+    if rows_returned is not None:
+        ROWS_RETURNED.labels(operation).inc(rows_returned)
+
+
+class MetricsMiddleware:
+    """
+    ASGI middleware recording the latency and body sizes of every HTTP request, labelled with the
+    route template (e.g. `/jobs/{job_id}`) rather than the raw path, so label values stay bounded.
+    """
+
+    def __init__(self, app: ASGIApp):
+        self.app = app
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        started = time.perf_counter()
+        status_code = 500
+        received = sent = 0
+
+        async def counting_receive() -> Message:
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            return message
+
+        async def counting_send(message: Message) -> None:
+            nonlocal status_code, sent
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            elif message["type"] == "http.response.body":
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        try:
+            await self.app(scope, counting_receive, counting_send)
+        finally:
+            # The router puts the matched route into the scope.
+            route = scope.get("route")
+            path = route.path if route is not None else "unmatched"
+            REQUEST_LATENCY.labels(scope["method"], path, str(status_code)).observe(time.perf_counter() - started)
+            if received:
+                REQUEST_BYTES.labels(path).inc(received)
+            if sent:
+                RESPONSE_BYTES.labels(path).inc(sent)
+
+
+class RuntimeCollector:
+    """
+    Reports state that already exists elsewhere at scrape time, so it costs nothing per request:
+    database pool usage, cache hit ratios and sizes, and query executor load.
+    """
+
+    def __init__(self, engine: Any, caches: Dict[str, Any], executor: Any, shared_cache: Any = None):
+        self.engine = engine
+        self.caches = caches
+        self.executor = executor
+        self.shared_cache = shared_cache
+
+    def collect(self):
+        pool = self.engine.pool
+        yield GaugeMetricFamily("db_pool_size", "Connections the database pool keeps open.", value=pool.size())
+        yield GaugeMetricFamily("db_pool_checked_out", "Database connections currently in use.", value=pool.checkedout())
+        yield GaugeMetricFamily("db_pool_overflow", "Connections open beyond the pool size.", value=max(pool.overflow(), 0))
+
+        hits = CounterMetricFamily("cache_hits", "Cache lookups served from the cache.", labels=["cache"])
+        misses = CounterMetricFamily("cache_misses", "Cache lookups that had to load or compute.", labels=["cache"])
+        ratio = GaugeMetricFamily("cache_hit_ratio", "Share of cache lookups served from the cache.", labels=["cache"])
+        size = GaugeMetricFamily("cache_bytes", "Bytes held by the cache.", labels=["cache"])
+        entries = GaugeMetricFamily("cache_entries", "Entries held by the cache.", labels=["cache"])
+        evictions = CounterMetricFamily("cache_evictions", "Entries evicted to stay within budget.", labels=["cache"])
+        for name, cache in self.caches.items():
+            stats = cache.stats()
+            # Lookups that waited for another request's load did not load anything themselves.
+            served = stats["hits"] + stats.get("coalesced", 0)
+            lookups = served + stats["misses"]
+            hits.add_metric([name], served)
+            misses.add_metric([name], stats["misses"])
+            ratio.add_metric([name], served / lookups if lookups else 0.0)
+            size.add_metric([name], stats["bytes"])
+            entries.add_metric([name], stats["entries"])
+            evictions.add_metric([name], stats["evictions"])
+        yield from (hits, misses, ratio, size, entries, evictions)
+
+        if self.shared_cache is not None:
+            stats = self.shared_cache.stats()
+            yield CounterMetricFamily("shared_dataset_builds", "Datasets written to the shared cache.", value=stats["builds"])
+            yield CounterMetricFamily("shared_dataset_maps", "Datasets mapped from the shared cache.", value=stats["maps"])
+
+        yield GaugeMetricFamily("query_executor_in_flight", "Queries running or waiting on the executor.", value=self.executor.in_flight)
+        yield CounterMetricFamily("query_executor_rejected", "Queries rejected as the executor was saturated.", value=self.executor.rejected)
+
+
+def render_metrics(runtime: RuntimeCollector) -> bytes:
+    """
+    Metrics in the Prometheus text format. With `PROMETHEUS_MULTIPROC_DIR` set, counters and
+    histograms are those of all worker processes combined, and the runtime state that of this worker.
+    """
+    if PROMETHEUS_MULTIPROC_DIR:
+        registry = CollectorRegistry()
+        MultiProcessCollector(registry)
+    else:
+        registry = REGISTRY
+    runtime_registry = CollectorRegistry()
+    runtime_registry.register(runtime)
+    return generate_latest(registry) + generate_latest(runtime_registry)
@@ -0,0 +1,249 @@
+import cProfile
+import json
+import logging
+import os
+import pstats
+import threading
+import time
+import tracemalloc
+import uuid
+from contextvars import ContextVar
+from datetime import datetime, timezone
+from functools import partial
+from typing import Any, Callable, Dict, List, Optional, Sequence, Tuple
+from urllib.parse import parse_qs
+
+from starlette import concurrency
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from src.config import PROFILE_DIR, PROFILE_RETENTION, PROFILING_PATHS, PROFILING_TOKEN
+
+logger = logging.getLogger(__name__)
+
+PROFILE_HEADER = b"x-profile"
+PROFILE_PARAM = "profile"
+TOP_FUNCTIONS = 30
+
+# Own time of a function is counted in the first category whose marker appears in its file or name.
+CATEGORIES = (
+    ("pandas", ("pandas", "numpy", "pyarrow")),
+    ("starlette_json", ("starlette", "fastapi", "anyio", "uvicorn", "pydantic", "json")),
+    ("asyncpg", ("asyncpg", "sqlalchemy")),
+    ("application", (f"{os.sep}src{os.sep}",)),
+)
+
+RawStats = Dict[Tuple[str, int, str], tuple]
+
+
+class RequestProfile:
+    """
+    The profile of one request: cProfile statistics gathered in every thread or process that did
+    work for the request, merged when the request is done.
+    """
+
+    def __init__(self, profile_id: str):
+        self.profile_id = profile_id
+        self.closed = False
+        self._collected: List[RawStats] = []
+        self._lock = threading.Lock()
+
+    def run(self, fn: Callable[..., Any], *args: Any) -> Any:
+        profiler = cProfile.Profile()
+        profiler.enable()
+        try:
+            return fn(*args)
+        finally:
+            profiler.disable()
+            profiler.create_stats()
+            self.add(profiler.stats)
+
+    def add(self, stats: RawStats) -> None:
+        with self._lock:
+            # Background work started by the request may outlive it; it is not part of the profile.
+            if not self.closed:
+                self._collected.append(stats)
+
+    def close(self) -> pstats.Stats:
+        with self._lock:
+            self.closed = True
+            collected, self._collected = self._collected, []
+        stats = pstats.Stats()
+        if collected:
+            stats.add(*(_CollectedStats(raw) for raw in collected))
+        return stats
+
+
+class _CollectedStats:
+    """Raw cProfile statistics in the shape pstats loads."""
+
+    def __init__(self, stats: RawStats):
+        self.stats = stats
+
+    def create_stats(self) -> None:
+        pass
+
+
+current_profile: ContextVar[Optional[RequestProfile]] = ContextVar("current_profile", default=None)
+
+
+def run_with_profiler(fn: Callable[..., Any], *args: Any) -> Tuple[Any, RawStats]:
+    """Run `fn(*args)` under cProfile and return its result with the raw statistics, e.g. in a worker process."""
+    profiler = cProfile.Profile()
+    profiler.enable()
+    try:
+        result = fn(*args)
+    finally:
+        profiler.disable()
+    profiler.create_stats()
+    return result, profiler.stats
+
+
+def profiled_call(fn: Callable[..., Any], *args: Any) -> Any:
+    profile = current_profile.get()
+    if profile is None:
+        return fn(*args)
+    return profile.run(fn, *args)
+
+
+async def run_in_threadpool(fn: Callable[..., Any], *args: Any, **kwargs: Any) -> Any:
+    """Starlette's `run_in_threadpool`, profiling the call when the request it runs for is profiled."""
+    if kwargs:
+        fn = partial(fn, **kwargs)
+    return await concurrency.run_in_threadpool(profiled_call, fn, *args)
+
+
+def summarize_stats(stats: pstats.Stats, top: int = TOP_FUNCTIONS) -> Tuple[Dict[str, float], List[Dict[str, Any]]]:
+    """Own time per library category, and the functions with the most own time."""
+    breakdown = {category: 0.0 for category, _ in CATEGORIES}
+    breakdown["other"] = 0.0
+    functions = []
+    for (file_name, line, name), (_, calls, own_time, cumulative_time, _) in stats.stats.items():
+        location = f"{file_name}:{name}"
+        category = next(
+            (category for category, markers in CATEGORIES if any(marker in location for marker in markers)), "other"
+        )
+        breakdown[category] += own_time
+        functions.append((own_time, cumulative_time, calls, pstats.func_std_string((file_name, line, name))))
+    functions.sort(reverse=True)
+    top_functions = [
+        {"function": function, "calls": calls, "own_ms": round(own_time * 1000, 3), "cumulative_ms": round(cumulative_time * 1000, 3)}
+        for own_time, cumulative_time, calls, function in functions[:top]
+    ]
+    return {category: round(seconds * 1000, 3) for category, seconds in breakdown.items()}, top_functions
+
+
+def save_profile(directory: str, report: Dict[str, Any], stats: pstats.Stats, retention: int) -> None:
+    """
+    Write the report as `<id>.json` and the full statistics as `<id>.prof` (loadable with pstats or
+    snakeviz), then remove the oldest profiles beyond `retention`. Profile ids sort by creation time.
+    """
+    os.makedirs(directory, exist_ok=True)
+    base_path = os.path.join(directory, report["profile_id"])
+    with open(f"{base_path}.json", "w") as f:
+        json.dump(report, f, indent=2)
+    if stats.stats:
+        stats.dump_stats(f"{base_path}.prof")
+    profile_ids = sorted(name[:-len(".json")] for name in os.listdir(directory) if name.endswith(".json"))
+    for profile_id in profile_ids[:max(len(profile_ids) - retention, 0)]:
+        for extension in (".json", ".prof"):
+            path = os.path.join(directory, f"{profile_id}{extension}")
+            if os.path.exists(path):
+                os.remove(path)
+
+
+class ProfilingMiddleware:
+    """
+    Profiles requests to `paths` that ask for it with an `X-Profile` header or a `profile` query
+    parameter, whose value must be `token` if one is configured and `1` or `true` otherwise.
+
+    The work a profiled request hands to threads and executor workers runs under cProfile, and the
+    request under tracemalloc for its peak memory. The event loop is shared with every concurrent
+    request, so it is not profiled; the time spent there is only part of the wall time. The response
+    carries an `X-Profile-Id` header naming the report saved to `directory`. tracemalloc covers the
+    whole process, so only one request is profiled at a time; others asking meanwhile are served
+    normally with `X-Profile-Id: busy`. The middleware is only installed when profiling is enabled.
+    """
+
+    def __init__(
+            self,
+            app: ASGIApp,
+            paths: Sequence[str] = PROFILING_PATHS,
+            token: Optional[str] = PROFILING_TOKEN,
+            directory: str = PROFILE_DIR,
+            retention: int = PROFILE_RETENTION,
+    ):
+        self.app = app
+        self.paths = frozenset(paths)
+        self.token = token
+        self.directory = directory
+        self.retention = retention
+        self._busy = threading.Lock()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http" or scope["path"] not in self.paths or not self._requested(scope):
+            await self.app(scope, receive, send)
+            return
+        if not self._busy.acquire(blocking=False):
+            await self.app(scope, receive, partial(_send_with_profile_id, send, "busy"))
+            return
+        try:
+            await self._profile(scope, receive, send)
+        finally:
+            self._busy.release()
+
+    def _requested(self, scope: Scope) -> bool:
+        values = [value.decode("latin-1") for name, value in scope["headers"] if name == PROFILE_HEADER]
+        values += parse_qs(scope["query_string"].decode("latin-1")).get(PROFILE_PARAM, [])
+        if self.token:
+            return self.token in values
+        return any(value.lower() in ("1", "true") for value in values)
+
+    async def _profile(self, scope: Scope, receive: Receive, send: Send) -> None:
+        profile = RequestProfile(f"{datetime.now(timezone.utc):%Y%m%dT%H%M%S%f}-{uuid.uuid4().hex[:8]}")
+        status_code = None
+
+        async def send_with_id(message: Message) -> None:
+            nonlocal status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            await _send_with_profile_id(send, profile.profile_id, message)
+
+        was_tracing = tracemalloc.is_tracing()
+        if not was_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        baseline = tracemalloc.get_traced_memory()[0]
+        context_token = current_profile.set(profile)
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive, send_with_id)
+        finally:
+            wall_time = time.perf_counter() - started
+            current_profile.reset(context_token)
+            current, peak = tracemalloc.get_traced_memory()
+            if not was_tracing:
+                tracemalloc.stop()
+            stats = profile.close()
+            breakdown, top_functions = summarize_stats(stats)
+            report = {
+                "profile_id": profile.profile_id,
+                "method": scope["method"],
+                "path": scope["path"],
+                "query_string": scope["query_string"].decode("latin-1"),
+                "status_code": status_code,
+                "wall_ms": round(wall_time * 1000, 3),
+                "peak_memory_bytes": peak - baseline,
+                "retained_memory_bytes": current - baseline,
+                "breakdown_ms": breakdown,
+                "top_functions": top_functions,
+            }
+            try:
+                await concurrency.run_in_threadpool(save_profile, self.directory, report, stats, self.retention)
+            except OSError:
+                logger.warning("Could not save profile %s", profile.profile_id, exc_info=True)
+
+
+async def _send_with_profile_id(send: Send, profile_id: str, message: Message) -> None:
+    if message["type"] == "http.response.start":
+        message = {**message, "headers": [*message.get("headers", []), (b"x-profile-id", profile_id.encode())]}
+    await send(message)
@@ -0,0 +1,45 @@
+import json
+
+import pandas as pd
+import pytest
+
+from src.file_management.aggregate import AggregateSpec, plan_aggregate, run_aggregate
+from src.file_management.query import InvalidQueryError
+
+
+def test_aggregate_groups_after_filtering():
+    df = pd.DataFrame({
+        "region": ["east", "west", "east", None, "east"],
+        "product": ["apple", "apple", "pear", "apple", "apricot"],
+        "amount": [10.0, 4.0, 7.0, 1.0, None],
+    })
+    specs = [
+        AggregateSpec("count"), AggregateSpec("sum", "amount"), AggregateSpec("max", "amount"),
+        AggregateSpec("distinct_count", "product"), AggregateSpec("percentile", "amount", 50),
+    ]
+    plan = plan_aggregate(list(df.columns), ["region"], specs, filter_by=["product"], filter_values=["ap"])
+    assert plan.query.read_columns == ["region", "amount", "product"]
+
+    result = run_aggregate(df, plan)
+    assert result.group_count == 3
+    assert json.loads(result.body) == [
+        {"region": "east", "count": 2, "sum_amount": 10.0, "max_amount": 10.0, "distinct_count_product": 2, "p50_amount": 10.0},
+        {"region": "west", "count": 1, "sum_amount": 4.0, "max_amount": 4.0, "distinct_count_product": 1, "p50_amount": 4.0},
+        {"region": None, "count": 1, "sum_amount": 1.0, "max_amount": 1.0, "distinct_count_product": 1, "p50_amount": 1.0},
+    ]
+
+
+def test_aggregate_validates_columns_and_functions():
+    column_stats = {"region": {"dtype": "string"}, "amount": {"dtype": "double"}}
+    with pytest.raises(InvalidQueryError, match="requires a numeric column"):
+        plan_aggregate(["region", "amount"], None, [AggregateSpec("mean", "region")], column_stats=column_stats)
+    with pytest.raises(InvalidQueryError, match="requires a column"):
+        plan_aggregate(["region", "amount"], None, [AggregateSpec("sum")])
+    with pytest.raises(InvalidQueryError, match="between 0 and 100"):
+        plan_aggregate(["region", "amount"], None, [AggregateSpec("percentile", "amount", 101)])
+    with pytest.raises(InvalidQueryError, match="Invalid group by column name: missing"):
+        plan_aggregate(["region", "amount"], ["missing"], [AggregateSpec("count")])
+
+    plan = plan_aggregate(["region", "amount"], None, [AggregateSpec("count"), AggregateSpec("mean", "amount")])
+    result = run_aggregate(pd.DataFrame({"region": ["a", "b"], "amount": [1, 2]}), plan)
+    assert result.body == b'[{"count":2,"mean_amount":1.5}]'
@@ -0,0 +1,105 @@
+import asyncio
+
+import os
+
+import pandas as pd
+import pyarrow as pa
+
+from src.file_management.cache import DataFrameCache, ResultCache, SharedDatasetCache
+
+
+async def test_dataframe_cache_coalesces_concurrent_misses():
+    cache = DataFrameCache(max_bytes=1024 ** 2)
+    loads = []
+
+    def loader():
+        loads.append(1)
+        return pd.DataFrame({"ints": [1, 2, 3]})
+
+    frames = await asyncio.gather(*(cache.get_or_load(1, "v1", loader) for _ in range(5)))
+    assert len(loads) == 1
+    assert all(df is frames[0] for df in frames)
+
+    await cache.get_or_load(1, "v1", loader)
+    assert (cache.misses, cache.coalesced, cache.hits) == (1, 4, 1)
+
+    cache.invalidate(1)
+    await cache.get_or_load(1, "v1", loader)
+    assert len(loads) == 2
+
+
+def test_shared_dataset_cache_builds_once_and_maps(tmp_path):
+    cache = SharedDatasetCache(str(tmp_path))
+    builds = []
+
+    def builder():
+        builds.append(1)
+        return pa.table({"ints": [1, 2, 3], "text": ["a", "b", None]})
+
+    first = cache.get_table("data.csv", "v1", builder)
+    second = cache.get_table("data.csv", "v1", builder)
+    assert len(builds) == 1
+    assert second.equals(first)
+    assert cache.contains("data.csv", "v1")
+    assert not cache.contains("data.csv", "v2")
+
+    df = second.to_pandas(split_blocks=True, types_mapper={pa.string(): pd.StringDtype("pyarrow")}.get)
+    assert df["ints"].tolist() == [1, 2, 3]
+    assert isinstance(df["text"].dtype, pd.StringDtype)
+
+    cache.invalidate("data.csv")
+    assert not os.path.exists(cache.path("data.csv", "v1"))
+    cache.get_table("data.csv", "v1", builder)
+    assert len(builds) == 2
+
+
+async def test_dataframe_cache_evicts_least_recently_used():
+    df = pd.DataFrame({"ints": range(100)})
+    nbytes = int(df.memory_usage(deep=True).sum())
+    cache = DataFrameCache(max_bytes=2 * nbytes)
+
+    await cache.get_or_load(1, "v1", lambda: df.copy())
+    await cache.get_or_load(2, "v1", lambda: df.copy())
+    await cache.get_or_load(1, "v1", lambda: df.copy())
+    await cache.get_or_load(3, "v1", lambda: df.copy())
+
+    assert cache.evictions == 1
+    assert cache.current_bytes == 2 * nbytes
+    await cache.get_or_load(1, "v1", lambda: df.copy())
+    assert cache.hits == 2
+
+
+async def test_dataframe_cache_extends_cached_frames_with_appended_rows():
+    cache = DataFrameCache(max_bytes=1024 ** 2)
+    df = pd.DataFrame({"city": pd.Categorical(["Oslo", "Bern"], categories=["Bern", "Oslo"], ordered=True), "n": [1, 2]})
+    await cache.get_or_load("a", ("v1", None), lambda: df)
+    await cache.get_or_load("a", ("v1", ("n",)), lambda: df[["n"]])
+    rows = pd.DataFrame({"city": pd.Categorical(["Arles", "Oslo"], categories=["Arles", "Oslo"], ordered=True), "n": [3, 4]})
+
+    assert await cache.extend("a", "v1", "b", "v2", lambda: rows) == 2
+    extended = await cache.get_or_load("b", ("v2", None), lambda: None)
+    assert extended["city"].tolist() == ["Oslo", "Bern", "Arles", "Oslo"]
+    assert extended["city"].cat.categories.tolist() == ["Arles", "Bern", "Oslo"] and extended["city"].cat.ordered
+    assert extended.index.tolist() == [0, 1, 2, 3]
+    assert (await cache.get_or_load("b", ("v2", ("n",)), lambda: None))["n"].tolist() == [1, 2, 3, 4]
+    assert cache.misses == 2
+    assert await cache.extend("a", "v0", "c", "v2", lambda: rows) == 0
+
+
+def test_result_cache_expires_and_respects_size_budget(monkeypatch):
+    now = [100.0]
+    monkeypatch.setattr("src.file_management.cache.time.monotonic", lambda: now[0])
+    cache = ResultCache(max_bytes=10, ttl=5)
+
+    cache.put("a", 1, b"12345", "application/json", {})
+    cache.put("b", 2, b"12345", "application/json", {})
+    assert cache.get("a").body == b"12345"
+    cache.put("c", 2, b"123", "application/json", {})
+    assert cache.get("b") is None
+    assert cache.evictions == 1
+
+    cache.invalidate(1)
+    assert cache.get("a") is None
+    now[0] += 5
+    assert cache.get("c") is None
+    assert cache.current_bytes == 0
@@ -0,0 +1,27 @@
+import asyncio
+
+import pytest
+
+from src.file_management.executor import EXECUTOR_THREAD, ExecutorSaturatedError, QueryExecutor
+
+
+async def test_query_executor_rejects_when_saturated():
+    executor = QueryExecutor(EXECUTOR_THREAD, max_workers=1, max_queue=1)
+    release = asyncio.Event()
+
+    async def hold_slot():
+        async with executor.admit():
+            await release.wait()
+
+    holders = [asyncio.create_task(hold_slot()) for _ in range(2)]
+    await asyncio.sleep(0)
+    with pytest.raises(ExecutorSaturatedError):
+        async with executor.admit():
+            pass
+    assert executor.rejected == 1
+
+    release.set()
+    await asyncio.gather(*holders)
+    async with executor.admit():
+        assert await executor.run(sum, [1, 2, 3]) == 6
+    executor.shutdown()
@@ -9,7 +9,7 @@ async def test_integration_file_management(ac: AsyncClient):
     sample_csv_content = "strings,ints\nd,1\nc,2\nb,3\na,4"
     sample_csv_content = sample_csv_content.encode("utf-8")
     sample_csv_file = UploadFile(filename="sample.csv", file=BytesIO(sample_csv_content))
-    response = await ac.post("/upload_file", files={"file": (sample_csv_file.filename, sample_csv_file.file)})
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": (sample_csv_file.filename, sample_csv_file.file)})
     assert response.status_code == 201
     file_path = os.path.join("datasets", sample_csv_file.filename)
     assert os.path.exists(file_path)
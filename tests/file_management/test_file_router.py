@@ -1,16 +1,33 @@
+import asyncio
+import base64
 import csv
+import hashlib
 import os
+import tarfile
+import uuid
+import zipfile
+from contextlib import asynccontextmanager
 from io import BytesIO
 
+import pyarrow as pa
+import pyarrow.parquet as pq
 from fastapi import UploadFile
 from httpx import AsyncClient
 
+from src.database import get_async_session
+from src.file_management import jobs
+from src.file_management.cache import result_cache
+from src.file_management.ingest import profile_dataset, store_dataset
+from src.file_management.jobs import ingest_pipeline
+from src.file_management.storage import blob_key, dataset_path, sidecar_files, sidecar_path
+from src.main import app
+
 
 async def test_upload_file_success(ac: AsyncClient):
     sample_csv_content = "column1,column2\nvalue1,value2\n"
     sample_csv_content = sample_csv_content.encode("utf-8")
     sample_csv_file = UploadFile(filename="sample.csv", file=BytesIO(sample_csv_content))
-    response = await ac.post("/upload_file", files={"file": (sample_csv_file.filename, sample_csv_file.file)})
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": (sample_csv_file.filename, sample_csv_file.file)})
 
     assert response.status_code == 201
     file_path = os.path.join("datasets", sample_csv_file.filename)
@@ -30,7 +47,7 @@ async def test_upload_file_duplicat(ac: AsyncClient):
 
     sample_csv_content = sample_csv_content.encode("utf-8")
     sample_csv_file = UploadFile(filename="sample.csv", file=BytesIO(sample_csv_content))
-    response = await ac.post("/upload_file", files={"file": (sample_csv_file.filename, sample_csv_file.file)})
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": (sample_csv_file.filename, sample_csv_file.file)})
     assert response.status_code == 400
     assert response.json()["detail"] == f"File '{sample_csv_file.filename}' already exists"
     os.remove(file_path)
@@ -40,7 +57,7 @@ async def test_upload_file_not_csv(ac: AsyncClient):
     sample_text_content = "text content"
     sample_text_content = sample_text_content.encode("utf-8")
     sample_text_file = UploadFile(filename="sample.txt", file=BytesIO(sample_text_content))
-    response = await ac.post("/upload_file", files={"file": (sample_text_file.filename, sample_text_file.file)})
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": (sample_text_file.filename, sample_text_file.file)})
     assert response.status_code == 400
     assert response.json()["detail"] == "File must be a CSV file."
 
@@ -49,3 +66,601 @@ async def test_get_file_info(ac: AsyncClient):
     response = await ac.get("/files")
     assert response.status_code == 200
     assert response.json()["files"]
+
+
+async def test_get_file_info_keyset_pages(ac: AsyncClient):
+    for file_name in ("page_b.csv", "page_a.csv", "other.csv"):
+        response = await ac.post("/upload_file", params={"wait": True}, files={"file": (file_name, BytesIO(b"column1\nvalue1\n"), "text/csv")})
+        assert response.status_code == 201
+
+    params = {"name_prefix": "page_", "sort_by": "file_name", "limit": 1}
+    response = await ac.get("/files", params=params)
+    assert response.status_code == 200
+    first_page = response.json()
+    assert [file["file_name"] for file in first_page["files"]] == ["page_a.csv"]
+    assert first_page["files"][0]["file_size"] == first_page["files"][0]["stored_size"] == len(b"column1\nvalue1\n")
+
+    response = await ac.get("/files", params={**params, "after_id": first_page["next_after_id"]})
+    second_page = response.json()
+    assert [file["file_name"] for file in second_page["files"]] == ["page_b.csv"]
+
+    response = await ac.get("/files", params={**params, "after_id": second_page["next_after_id"]})
+    assert response.json() == {"files": [], "next_after_id": None}
+
+    response = await ac.get("/files", params={"after_id": 10 ** 9})
+    assert response.status_code == 400
+
+    for file_name in ("page_b.csv", "page_a.csv", "other.csv"):
+        response = await ac.delete("/delete_file", params={"file_name": file_name})
+        assert response.status_code == 200
+
+
+async def test_upload_file_builds_sidecar(ac: AsyncClient):
+    sample_csv_content = "day,count,label\n2023-10-01,1,a\n2023-10-02,2,b\n".encode("utf-8")
+    sample_csv_file = UploadFile(filename="sidecar.csv", file=BytesIO(sample_csv_content))
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": (sample_csv_file.filename, sample_csv_file.file)})
+    assert response.status_code == 201
+    parquet_path = sidecar_path(blob_key(hashlib.sha256(sample_csv_content).hexdigest()))
+    assert os.path.exists(parquet_path)
+
+    response = await ac.post("/fetch_data", params={"file_name": "sidecar.csv"}, json={"sort_by": ["count"], "sort_orders": ["desc"]})
+    assert response.status_code == 200
+    assert response.json() == [
+        {"day": "2023-10-02", "count": 2, "label": "b"},
+        {"day": "2023-10-01", "count": 1, "label": "a"},
+    ]
+
+    response = await ac.delete("/delete_file", params={"file_name": "sidecar.csv"})
+    assert response.status_code == 200
+    assert not os.path.exists(parquet_path)
+    assert not os.path.exists(os.path.join("datasets", sample_csv_file.filename))
+
+
+async def test_fetch_data_pagination_and_streaming(ac: AsyncClient):
+    sample_csv_content = "ints\n1\n2\n3\n4\n5\n".encode("utf-8")
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": ("paged.csv", BytesIO(sample_csv_content))})
+    assert response.status_code == 201
+
+    body = {"sort_by": ["ints"], "sort_orders": ["asc"]}
+    response = await ac.post("/fetch_data", params={"file_name": "paged.csv", "limit": 2}, json=body)
+    assert response.json() == [{"ints": 1}, {"ints": 2}]
+    assert response.headers["X-Total-Count"] == "5"
+
+    cursor = response.headers["X-Next-Cursor"]
+    response = await ac.post("/fetch_data", params={"file_name": "paged.csv", "limit": 2, "cursor": cursor}, json=body)
+    assert response.json() == [{"ints": 3}, {"ints": 4}]
+
+    response = await ac.post("/fetch_data", params={"file_name": "paged.csv", "limit": 2, "cursor": cursor}, json={})
+    assert response.status_code == 400
+
+    response = await ac.post("/fetch_data", params={"file_name": "paged.csv", "offset": 3, "stream": True}, json=body)
+    assert response.headers["content-type"] == "application/x-ndjson"
+    assert response.text == '{"ints":4}\n{"ints":5}\n'
+    assert "X-Next-Cursor" not in response.headers
+
+    response = await ac.delete("/delete_file", params={"file_name": "paged.csv"})
+    assert response.status_code == 200
+
+
+async def test_fetch_data_uses_trigram_index(ac: AsyncClient):
+    sample_csv_content = "name,cost\napple pie,3\nbanana,1\npineapple,5\ngrape,2\n".encode("utf-8")
+    response = await ac.post(
+        "/upload_file", params={"wait": True, "index_columns": ["name"]}, files={"file": ("indexed.csv", BytesIO(sample_csv_content))}
+    )
+    assert response.status_code == 201
+
+    body = {"filter_by": ["name"], "filter_values": ["apple"], "sort_by": ["cost"], "sort_orders": ["asc"]}
+    response = await ac.post("/fetch_data", params={"file_name": "indexed.csv"}, json=body)
+    assert response.json() == [{"name": "apple pie", "cost": 3}, {"name": "pineapple", "cost": 5}]
+
+    response = await ac.post("/fetch_data", params={"file_name": "indexed.csv", "explain": True}, json=body)
+    assert response.json()["plan"]["filters"][0]["index_used"] is True
+
+    body["filter_values"] = ["^apple"]
+    response = await ac.post("/fetch_data", params={"file_name": "indexed.csv"}, json=body)
+    assert response.json() == []
+    response = await ac.post("/fetch_data", params={"file_name": "indexed.csv", "filter_mode": "regex"}, json=body)
+    assert response.json() == [{"name": "apple pie", "cost": 3}]
+
+    response = await ac.delete("/delete_file", params={"file_name": "indexed.csv"})
+    assert response.status_code == 200
+
+
+async def test_upload_file_rejects_unknown_index_column(ac: AsyncClient):
+    response = await ac.post(
+        "/upload_file", params={"wait": True, "index_columns": ["missing"]}, files={"file": ("bad_index.csv", BytesIO(b"name\na\n"))}
+    )
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Invalid index column name: missing"
+    assert not os.path.exists(os.path.join("datasets", "bad_index.csv"))
+
+
+async def test_fetch_data_uses_sort_indexes(ac: AsyncClient):
+    sample_csv_content = "name,cost\npear,3\napple,1\nfig,2\n".encode("utf-8")
+    response = await ac.post(
+        "/upload_file", params={"wait": True, "sort_columns": ["name"]}, files={"file": ("sorted.csv", BytesIO(sample_csv_content))}
+    )
+    assert response.status_code == 201
+
+    response = await ac.post("/fetch_data", params={"file_name": "sorted.csv", "explain": True}, json={"sort_by": ["name"]})
+    assert response.json()["plan"]["sort_index_used"] is True
+
+    for _ in range(3):
+        response = await ac.post("/fetch_data", params={"file_name": "sorted.csv"}, json={"sort_by": ["cost"], "sort_orders": ["desc"]})
+        assert [row["cost"] for row in response.json()] == [3, 2, 1]
+    for _ in range(50):
+        response = await ac.post("/fetch_data", params={"file_name": "sorted.csv", "explain": True}, json={"sort_by": ["cost"]})
+        if response.json()["plan"]["sort_index_used"]:
+            break
+        await asyncio.sleep(0.02)
+    assert response.json()["plan"]["sort_index_used"] is True
+
+    response = await ac.delete("/delete_file", params={"file_name": "sorted.csv"})
+    assert response.status_code == 200
+
+
+async def test_sort_indexes_order_read_schema_columns_like_queries(ac: AsyncClient):
+    rows = [("2023-03-01", "Rome", 1), ("2023-01-15", "Oslo", 2), ("2023-11-02", "Rome", 3),
+            ("2023-01-02", "Oslo", 4), ("2023-02-10", "Lima", 5), ("2023-01-02", "Rome", 6)]
+    sample_csv_content = "day,city,n\n" + "".join(f"{day},{city},{n}\n" for day, city, n in rows)
+    response = await ac.post(
+        "/upload_file", params={"wait": True, "sort_columns": ["day", "city"]},
+        files={"file": ("typed_sorted.csv", BytesIO(sample_csv_content.encode("utf-8")))},
+    )
+    assert response.status_code == 201
+    response = await ac.get("/files", params={"name_prefix": "typed_sorted.csv"})
+    stats = (await ac.get(f"/files/{response.json()['files'][0]['id']}/stats")).json()
+    assert stats["read_schema"]["day"] == "date32[pyarrow]" and stats["read_schema"]["city"] == "category"
+
+    # The order `sort_values` gives the frame read with its read schema, without any index.
+    for sort_by, sort_orders, expected in (
+            (["day"], ["asc"], [4, 6, 2, 5, 1, 3]),
+            (["city", "day"], ["desc", "asc"], [6, 1, 3, 4, 2, 5]),
+    ):
+        body = {"sort_by": sort_by, "sort_orders": sort_orders}
+        response = await ac.post("/fetch_data", params={"file_name": "typed_sorted.csv", "explain": True}, json=body)
+        assert response.json()["plan"]["sort_index_used"] is True
+        response = await ac.post("/fetch_data", params={"file_name": "typed_sorted.csv"}, json=body)
+        assert [row["n"] for row in response.json()] == expected
+
+    response = await ac.delete("/delete_file", params={"file_name": "typed_sorted.csv"})
+    assert response.status_code == 200
+
+
+async def test_fetch_data_serves_repeated_queries_from_result_cache(ac: AsyncClient, monkeypatch):
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": ("cached.csv", BytesIO(b"name,color\npear,green\napple,red\n"))})
+    assert response.status_code == 201
+
+    body = {"filter_by": ["name", "color"], "filter_values": ["p", "ed"]}
+    response = await ac.post("/fetch_data", params={"file_name": "cached.csv"}, json=body)
+    assert response.json() == [{"name": "apple", "color": "red"}]
+
+    hits = result_cache.hits
+    reordered_body = {"filter_by": ["color", "name"], "filter_values": ["ed", "p"]}
+    response = await ac.post("/fetch_data", params={"file_name": "cached.csv"}, json=reordered_body)
+    assert response.json() == [{"name": "apple", "color": "red"}]
+    assert result_cache.hits == hits + 1
+
+    # Cached responses are keyed by the file's version, so they are not served after a change made by another worker.
+    monkeypatch.setattr(result_cache, "invalidate", lambda file_id: None)
+    response = await ac.post(
+        "/append_file", params={"file_name": "cached.csv"},
+        files={"file": ("delta.csv", BytesIO(b"name,color\nplum,red\n"), "text/csv")},
+    )
+    assert response.status_code == 200
+    response = await ac.post("/fetch_data", params={"file_name": "cached.csv"}, json=body)
+    assert response.json() == [{"name": "apple", "color": "red"}, {"name": "plum", "color": "red"}]
+
+    response = await ac.delete("/delete_file", params={"file_name": "cached.csv"})
+    assert response.status_code == 200
+    response = await ac.post("/fetch_data", params={"file_name": "cached.csv"}, json=body)
+    assert response.status_code == 404
+
+
+async def test_fetch_data_output_formats(ac: AsyncClient):
+    sample_csv_content = b"name,cost\npear,3\napple,\n"
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": ("formats.csv", BytesIO(sample_csv_content))})
+    assert response.status_code == 201
+
+    response = await ac.post("/fetch_data", params={"file_name": "formats.csv", "format": "columnar"}, json={})
+    assert response.json() == {"columns": ["name", "cost"], "data": {"name": ["pear", "apple"], "cost": [3.0, None]}}
+
+    response = await ac.post("/fetch_data", params={"file_name": "formats.csv"}, headers={"Accept": "text/csv"}, json={})
+    assert response.headers["content-type"].startswith("text/csv")
+    assert response.content == sample_csv_content
+
+    response = await ac.post(
+        "/fetch_data", params={"file_name": "formats.csv", "format": "arrow"}, json={"sort_by": ["name"]}
+    )
+    assert response.headers["content-type"] == "application/vnd.apache.arrow.stream"
+    table = pa.ipc.open_stream(response.content).read_all()
+    assert table.column("name").to_pylist() == ["apple", "pear"]
+
+    response = await ac.delete("/delete_file", params={"file_name": "formats.csv"})
+    assert response.status_code == 200
+
+
+async def test_column_stats_prune_queries(ac: AsyncClient):
+    content = b"name,cost,note\npear,3,\nfig,1,\nbanana,7,\n"
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": ("stats.csv", BytesIO(content), "text/csv")})
+    assert response.status_code == 201
+
+    response = await ac.get("/files", params={"name_prefix": "stats.csv"})
+    file_id = response.json()["files"][0]["id"]
+    response = await ac.get(f"/files/{file_id}/stats")
+    assert response.status_code == 200
+    stats = response.json()
+    assert stats["row_count"] == 3
+    assert stats["columns"]["name"] == {
+        "dtype": "string", "count": 3, "null_count": 0, "distinct_count": 3,
+        "min": "banana", "max": "pear", "max_length": 6,
+    }
+    assert stats["columns"]["cost"]["min"] == 1 and stats["columns"]["cost"]["max"] == 7
+
+    response = await ac.post("/fetch_data", params={"file_name": "stats.csv"}, json={"filter_by": ["cost"], "filter_values": ["1"]})
+    assert response.status_code == 400
+    assert response.json()["detail"] == "Filter column 'cost' does not contain text values"
+
+    for filter_by, filter_value in (("name", "watermelon"), ("note", "x")):
+        response = await ac.post(
+            "/fetch_data", params={"file_name": "stats.csv", "explain": True},
+            json={"filter_by": [filter_by], "filter_values": [filter_value]},
+        )
+        assert response.json()["plan"]["pruned_by"] is not None
+        assert "load_ms" not in response.json()["stats"]
+        response = await ac.post("/fetch_data", params={"file_name": "stats.csv"}, json={"filter_by": [filter_by], "filter_values": [filter_value]})
+        assert response.status_code == 200
+        assert response.json() == []
+        assert response.headers["X-Total-Count"] == "0"
+
+    response = await ac.get("/files/1000000/stats")
+    assert response.status_code == 404
+
+    response = await ac.delete("/delete_file", params={"file_name": "stats.csv"})
+    assert response.status_code == 200
+
+
+async def test_upload_files_in_bulk(ac: AsyncClient):
+    zip_buffer = BytesIO()
+    with zipfile.ZipFile(zip_buffer, "w") as archive:
+        archive.writestr("nested/bulk_zip_1.csv", "a,b\n1,2\n")
+        archive.writestr("bulk_zip_2.csv", "c\nx\ny\n")
+        archive.writestr("readme.txt", "not a dataset")
+    tar_buffer = BytesIO()
+    with tarfile.open(fileobj=tar_buffer, mode="w:gz") as archive:
+        for name, content in (("bulk_tar_1.csv", b"d\n1\n"), ("bulk_plain.csv", b"e\n2\n")):
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, BytesIO(content))
+
+    response = await ac.post("/upload_files", files=[
+        ("files", ("bulk_plain.csv", BytesIO(b"f\n3\n"), "text/csv")),
+        ("files", ("bulk.zip", BytesIO(zip_buffer.getvalue()), "application/zip")),
+        ("files", ("bulk.tar.gz", BytesIO(tar_buffer.getvalue()), "application/gzip")),
+        ("files", ("bulk.txt", BytesIO(b"text"), "text/plain")),
+        ("files", ("broken.zip", BytesIO(b"not a zip"), "application/zip")),
+    ])
+    assert response.status_code == 200
+    report = {(entry["file_name"], entry["status_code"]) for entry in response.json()["files"]}
+    assert report == {
+        ("bulk_plain.csv", 201),
+        ("bulk_zip_1.csv", 201),
+        ("bulk_zip_2.csv", 201),
+        ("bulk_tar_1.csv", 201),
+        ("bulk_plain.csv", 400),
+        ("bulk.txt", 400),
+        ("broken.zip", 400),
+    }
+    assert response.json()["uploaded"] == 4
+
+    response = await ac.post("/fetch_data", params={"file_name": "bulk_zip_2.csv"})
+    assert response.json() == [{"c": "x"}, {"c": "y"}]
+
+    response = await ac.post("/upload_files", files=[("files", ("bulk_zip_1.csv", BytesIO(b"a\n1\n"), "text/csv"))])
+    assert response.json()["files"] == [
+        {"file_name": "bulk_zip_1.csv", "status_code": 400, "detail": "File 'bulk_zip_1.csv' already exists"}
+    ]
+
+    for file_name in ("bulk_plain.csv", "bulk_zip_1.csv", "bulk_zip_2.csv", "bulk_tar_1.csv"):
+        response = await ac.delete("/delete_file", params={"file_name": file_name})
+        assert response.status_code == 200
+
+
+async def test_resumable_upload(ac: AsyncClient):
+    content = b"name,count\n" + b"".join(b"row%d,%d\n" % (i, i) for i in range(100))
+    response = await ac.post("/uploads", params={"file_name": "resumable.csv", "length": len(content)})
+    assert response.status_code == 201
+    upload_id = response.json()["upload_id"]
+
+    def checksum(chunk: bytes) -> str:
+        return "sha256 " + base64.b64encode(hashlib.sha256(chunk).digest()).decode()
+
+    middle = len(content) // 2
+    response = await ac.patch(
+        f"/uploads/{upload_id}", content=content[middle:],
+        headers={"Upload-Offset": str(middle), "Upload-Checksum": checksum(b"corrupted")},
+    )
+    assert response.status_code == 400
+    responses = await asyncio.gather(*(
+        ac.patch(f"/uploads/{upload_id}", content=chunk, headers={"Upload-Offset": str(offset), "Upload-Checksum": checksum(chunk)})
+        for offset, chunk in ((middle, content[middle:]), (10, content[10:middle]))
+    ))
+    assert [response.status_code for response in responses] == [200, 200]
+
+    response = await ac.get(f"/uploads/{upload_id}")
+    assert response.headers["Upload-Offset"] == "0"
+    assert response.json()["received_ranges"] == [[10, len(content)]]
+    response = await ac.post(f"/uploads/{upload_id}/finalize")
+    assert response.status_code == 400
+
+    response = await ac.patch(f"/uploads/{upload_id}", content=content[:10], headers={"Upload-Offset": "0"})
+    assert response.json()["offset"] == len(content)
+    response = await ac.post(f"/uploads/{upload_id}/finalize", params={"sort_columns": ["missing"]})
+    assert response.status_code == 400
+    response = await ac.post(f"/uploads/{upload_id}/finalize", params={"sort_columns": ["count"]})
+    assert response.status_code == 201
+
+    response = await ac.get(f"/uploads/{upload_id}")
+    assert response.status_code == 404
+    response = await ac.post("/fetch_data", params={"file_name": "resumable.csv", "limit": 2}, json={"sort_by": ["count"], "sort_orders": ["desc"]})
+    assert response.json() == [{"name": "row99", "count": 99}, {"name": "row98", "count": 98}]
+    assert response.headers["X-Total-Count"] == "100"
+
+    response = await ac.post("/uploads", params={"file_name": "resumable.csv", "length": 1})
+    assert response.status_code == 400
+    response = await ac.delete("/delete_file", params={"file_name": "resumable.csv"})
+    assert response.status_code == 200
+
+
+async def test_identical_uploads_share_a_blob(ac: AsyncClient):
+    content = b"name,count\n" + b"".join(b"dedup%d,%d\n" % (i, i) for i in range(50))
+    key = blob_key(hashlib.sha256(content).hexdigest())
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": ("dedup_1.csv", BytesIO(content), "text/csv")})
+    assert response.status_code == 201
+    response = await ac.post(
+        "/upload_file", files={"file": ("dedup_2.csv", BytesIO(content), "text/csv")}, params={"wait": True, "sort_columns": ["count"]}
+    )
+    assert response.status_code == 201
+    assert os.path.samefile(dataset_path("dedup_1.csv"), dataset_path(key))
+    assert os.path.samefile(dataset_path("dedup_2.csv"), dataset_path(key))
+    assert os.path.exists(sidecar_path(key))
+
+    response = await ac.delete("/delete_file", params={"file_name": "dedup_1.csv"})
+    assert response.status_code == 200
+    assert os.path.exists(dataset_path(key))
+    response = await ac.post("/fetch_data", params={"file_name": "dedup_2.csv", "limit": 1}, json={"sort_by": ["count"], "sort_orders": ["desc"]})
+    assert response.json() == [{"name": "dedup49", "count": 49}]
+    response = await ac.get("/files", params={"name_prefix": "dedup_2.csv"})
+    file_id = response.json()["files"][0]["id"]
+    response = await ac.get(f"/files/{file_id}/stats")
+    assert response.json()["columns"]["count"]["max"] == 49
+
+    response = await ac.delete("/delete_file", params={"file_name": "dedup_2.csv"})
+    assert response.status_code == 200
+    assert not os.path.exists(dataset_path(key))
+    assert not os.path.exists(sidecar_path(key))
+
+
+async def test_aggregate_data(ac: AsyncClient):
+    content = b"region,product,amount\neast,apple,10\nwest,apple,4\neast,pear,7\neast,apricot,2\n"
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": ("aggregate.csv", BytesIO(content), "text/csv")})
+    assert response.status_code == 201
+
+    body = {
+        "group_by": ["region"],
+        "aggregations": [{"function": "count"}, {"function": "mean", "column": "amount"}],
+        "filter_by": ["product"],
+        "filter_values": ["ap"],
+    }
+    response = await ac.post("/aggregate_data", params={"file_name": "aggregate.csv"}, json=body)
+    assert response.status_code == 200
+    assert response.json() == [
+        {"region": "east", "count": 2, "mean_amount": 6.0},
+        {"region": "west", "count": 1, "mean_amount": 4.0},
+    ]
+    assert response.headers["X-Total-Count"] == "2"
+
+    response = await ac.post(
+        "/aggregate_data", params={"file_name": "aggregate.csv"},
+        json={"aggregations": [{"function": "sum", "column": "region"}]},
+    )
+    assert response.status_code == 400
+    response = await ac.delete("/delete_file", params={"file_name": "aggregate.csv"})
+    assert response.status_code == 200
+
+
+async def test_upload_file_records_encoding_and_read_schema(ac: AsyncClient):
+    rows = [
+        f"{city},{i % 3},{i / 4},2023-01-{i + 1:02d},2023-01-05 10:00:{i:02d},note {i}"
+        for i, city in enumerate(["Zürich", "Köln", "Zürich", "Köln", ""] * 2)
+    ]
+    content = "\n".join(["city,rank,score,day,seen,note", *rows, ""]).encode("utf-8")
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": ("schema.csv", BytesIO(content), "text/csv")})
+    assert response.status_code == 201
+    response = await ac.get("/files", params={"name_prefix": "schema.csv"})
+    response = await ac.get(f"/files/{response.json()['files'][0]['id']}/stats")
+    assert response.json()["encoding"] == "utf-8"
+    assert response.json()["read_schema"] == {
+        "city": "category", "rank": "int8", "score": "float32", "day": "date32[pyarrow]", "seen": "datetime64[ns]",
+    }
+
+    response = await ac.post("/fetch_data", params={"file_name": "schema.csv", "limit": 2}, json={"sort_by": ["city"]})
+    assert response.json() == [
+        {"city": "Köln", "rank": 1, "score": 0.25, "day": "2023-01-02", "seen": "2023-01-05 10:00:01", "note": "note 1"},
+        {"city": "Köln", "rank": 0, "score": 0.75, "day": "2023-01-04", "seen": "2023-01-05 10:00:03", "note": "note 3"},
+    ]
+    response = await ac.post(
+        "/fetch_data", params={"file_name": "schema.csv", "limit": 1, "format": "csv"},
+        json={"filter_by": ["seen"], "filter_values": ["10:00:09"]},
+    )
+    assert response.text.splitlines() == ["city,rank,score,day,seen,note", ",0,2.25,2023-01-10,2023-01-05 10:00:09,note 9"]
+
+    body = {"group_by": ["city"], "aggregations": [{"function": "count"}, {"function": "max", "column": "day"}]}
+    response = await ac.post("/aggregate_data", params={"file_name": "schema.csv"}, json=body)
+    assert response.json() == [
+        {"city": "Köln", "count": 4, "max_day": "2023-01-09"},
+        {"city": "Zürich", "count": 4, "max_day": "2023-01-08"},
+        {"city": None, "count": 2, "max_day": "2023-01-10"},
+    ]
+    response = await ac.delete("/delete_file", params={"file_name": "schema.csv"})
+    assert response.status_code == 200
+
+
+async def test_fetch_data_where_expression(ac: AsyncClient):
+    content = b"name,price,day\napple,3,2023-01-05\npear,12.5,2023-02-01\nfig,,2023-03-10\nplum,8,\n"
+    response = await ac.post("/upload_file", params={"wait": True}, files={"file": ("where.csv", BytesIO(content), "text/csv")})
+    assert response.status_code == 201
+
+    where = {"or": [
+        {"column": "price", "op": "between", "value": [5, 20]},
+        {"and": [{"column": "price", "op": "is_null"}, {"column": "day", "op": "gte", "value": "2023-03-01"}]},
+    ]}
+    response = await ac.post("/fetch_data", params={"file_name": "where.csv"}, json={"where": where, "sort_by": ["name"]})
+    assert response.status_code == 200
+    assert [row["name"] for row in response.json()] == ["fig", "pear", "plum"]
+
+    response = await ac.post(
+        "/fetch_data", params={"file_name": "where.csv", "explain": True},
+        json={"where": {"column": "price", "op": "gt", "value": 100}},
+    )
+    assert response.json()["plan"]["pruned_by"] == "no value of column 'price' is within the range of filter 'gt'"
+    response = await ac.post(
+        "/fetch_data", params={"file_name": "where.csv"}, json={"where": {"column": "price", "op": "eq", "value": "3"}},
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Filter value \"3\" for column 'price' must be a number"}
+
+    body = {"aggregations": [{"function": "count"}], "where": {"column": "name", "op": "prefix", "value": "p"}}
+    response = await ac.post("/aggregate_data", params={"file_name": "where.csv"}, json=body)
+    assert response.json() == [{"count": 2}]
+    response = await ac.delete("/delete_file", params={"file_name": "where.csv"})
+    assert response.status_code == 200
+
+
+async def test_append_file_extends_dataset_and_bumps_version(ac: AsyncClient):
+    content = "name,cost,day\napple,3,2023-01-05\npear,12,2023-02-01\nbanana,5,2023-01-20\n".encode("utf-8")
+    response = await ac.post(
+        "/upload_file", params={"wait": True, "index_columns": ["name"], "sort_columns": ["cost"]},
+        files={"file": ("append.csv", BytesIO(content), "text/csv")},
+    )
+    assert response.status_code == 201
+    response = await ac.post("/fetch_data", params={"file_name": "append.csv"}, json={})
+    assert len(response.json()) == 3
+    response = await ac.post("/fetch_data", params={"file_name": "append.csv", "limit": 2}, json={})
+    cursor = response.headers["X-Next-Cursor"]
+
+    response = await ac.post(
+        "/append_file", params={"file_name": "append.csv"},
+        files={"file": ("delta.csv", BytesIO(b"name,day,cost\nfig,2023-03-01,1\n"), "text/csv")},
+    )
+    assert response.status_code == 400
+    assert response.json() == {"detail": "Columns of the appended rows must be those of 'append.csv': name, cost, day"}
+
+    # A cp1252 delta without a trailing line break is transcoded to the file's UTF-8.
+    delta = b"name,cost,day\ncr\xe8me,7,2023-03-01\nfig,,2023-04-01"
+    response = await ac.post(
+        "/append_file", params={"file_name": "append.csv"}, files={"file": ("delta.csv", BytesIO(delta), "text/csv")}
+    )
+    assert response.status_code == 200
+    file_id = response.json()["file_id"]
+    assert response.json() == {
+        "message": "Rows appended successfully.", "file_id": file_id, "version": 2, "row_count": 5, "appended_rows": 2
+    }
+    appended_content = content + "crème,7,2023-03-01\nfig,,2023-04-01".encode("utf-8")
+    assert not os.path.exists(dataset_path(blob_key(hashlib.sha256(content).hexdigest())))
+    appended_key = blob_key(hashlib.sha256(appended_content).hexdigest())
+    assert os.path.samefile(dataset_path("append.csv"), dataset_path(appended_key))
+    # Only the appended rows were converted, into a segment following the original sidecar.
+    assert [pq.read_metadata(path).num_rows for path in sidecar_files(appended_key)] == [3, 2]
+
+    response = await ac.post("/fetch_data", params={"file_name": "append.csv", "format": "csv"}, json={})
+    assert response.content == appended_content
+    response = await ac.post("/fetch_data", params={"file_name": "append.csv"}, json={"sort_by": ["cost"]})
+    assert [row["name"] for row in response.json()] == ["apple", "banana", "crème", "pear", "fig"]
+    response = await ac.post(
+        "/fetch_data", params={"file_name": "append.csv"}, json={"filter_by": ["name"], "filter_values": ["rèm"]}
+    )
+    assert response.json() == [{"name": "crème", "cost": 7.0, "day": "2023-03-01"}]
+    response = await ac.post("/fetch_data", params={"file_name": "append.csv", "limit": 2, "cursor": cursor}, json={})
+    assert response.status_code == 400
+
+    # Statistics updated from the appended rows match those of the whole content uploaded at once.
+    response = await ac.post(
+        "/upload_file", params={"wait": True}, files={"file": ("appended.csv", BytesIO(appended_content + b"\n"), "text/csv")}
+    )
+    assert response.status_code == 201
+    stats = (await ac.get(f"/files/{file_id}/stats")).json()
+    response = await ac.get("/files", params={"name_prefix": "appended.csv"})
+    uploaded_stats = (await ac.get(f"/files/{response.json()['files'][0]['id']}/stats")).json()
+    assert stats["version"] == 2 and uploaded_stats["version"] == 1
+    assert stats["row_count"] == uploaded_stats["row_count"] == 5
+    assert stats["columns"] == uploaded_stats["columns"]
+    assert stats["read_schema"] == uploaded_stats["read_schema"]
+    for file_name in ("append.csv", "appended.csv"):
+        response = await ac.delete("/delete_file", params={"file_name": file_name})
+        assert response.status_code == 200
+
+
+async def test_upload_file_runs_an_ingestion_job(ac: AsyncClient, monkeypatch):
+    attempts = []
+
+    def flaky_profile_dataset(file_name: str, content_hash: str, encoding: str):
+        attempts.append(file_name)
+        if len(attempts) == 1:
+            raise OSError("disk hiccup")
+        return profile_dataset(file_name, content_hash, encoding)
+
+    monkeypatch.setattr(jobs, "profile_dataset", flaky_profile_dataset)
+    monkeypatch.setattr(ingest_pipeline, "retry_backoff", 0)
+    response = await ac.post(
+        "/upload_file", params={"index_columns": ["name"]}, files={"file": ("job.csv", BytesIO(b"name,count\na,1\nb,2\n"), "text/csv")}
+    )
+    assert response.status_code == 202
+    job_id = response.json()["job_id"]
+    assert response.json()["status_url"] == f"/jobs/{job_id}"
+
+    await ingest_pipeline.wait(job_id)
+    response = await ac.get(f"/jobs/{job_id}")
+    job = response.json()
+    assert job["status"] == "succeeded"
+    assert job["progress"] == 1
+    assert [(stage["name"], stage["status"], stage["attempts"]) for stage in job["stages"]] == [
+        ("store", "succeeded", 1), ("profile", "succeeded", 2), ("index", "succeeded", 1), ("register", "succeeded", 1),
+    ]
+    response = await ac.get(f"/files/{job['file_id']}/stats")
+    assert response.json()["row_count"] == 2
+
+    response = await ac.get("/jobs/missing")
+    assert response.status_code == 404
+    response = await ac.delete("/delete_file", params={"file_name": "job.csv"})
+    assert response.status_code == 200
+
+
+async def test_recovering_a_job_on_two_workers_runs_it_once(ac: AsyncClient, monkeypatch):
+    stored = []
+
+    def counting_store_dataset(file_name: str, fileobj):
+        stored.append(file_name)
+        return store_dataset(file_name, fileobj)
+
+    monkeypatch.setattr(jobs, "store_dataset", counting_store_dataset)
+    sessions = asynccontextmanager(app.dependency_overrides[get_async_session])
+    job_id = uuid.uuid4().hex
+    jobs.stage_upload(BytesIO(b"name,count\na,1\nb,2\n"), job_id)
+    async with sessions() as session:
+        await jobs.create_job_db(job_id, "recovered.csv", {"index_columns": [], "sort_columns": []}, session)
+
+    workers = [jobs.IngestPipeline(ingest_pipeline.concurrency, 1, 0, 60) for _ in range(2)]
+    claimed = await asyncio.gather(*(worker.recover(sessions) for worker in workers))
+    assert sorted(job_id in job_ids for job_ids in claimed) == [False, True]
+    for worker in workers:
+        await worker.wait(job_id)
+
+    assert stored == ["recovered.csv"]
+    job = (await ac.get(f"/jobs/{job_id}")).json()
+    assert job["status"] == "succeeded"
+    assert os.path.exists(dataset_path("recovered.csv"))
+    response = await ac.get(f"/files/{job['file_id']}/stats")
+    assert response.json()["row_count"] == 2
+    response = await ac.delete("/delete_file", params={"file_name": "recovered.csv"})
+    assert response.status_code == 200
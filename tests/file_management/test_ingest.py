@@ -0,0 +1,106 @@
+import hashlib
+import os
+
+import pandas as pd
+import pyarrow.parquet as pq
+import pytest
+
+from src.file_management.ingest import (
+    CsvIngestor, CsvScanner, DatasetExistsError, UploadTooLargeError, read_csv_header,
+)
+from src.file_management.storage import build_sidecar, detect_compression, open_dataset_file
+
+
+def test_csv_ingestor_counts_rows_across_chunks(tmp_path):
+    content = b'name,comment\n"a","multi\nline"\nb,"quoted ""x"""\nc,plain'
+    destination = os.path.join(tmp_path, "sample.csv")
+    ingestor = CsvIngestor(destination)
+    for i in range(0, len(content), 5):
+        ingestor.write(content[i:i + 5])
+    result = ingestor.commit()
+
+    assert result.column_names == ["name", "comment"]
+    assert result.row_count == 3
+    assert result.file_size == len(content)
+    assert result.content_hash == hashlib.sha256(content).hexdigest()
+    assert os.listdir(tmp_path) == ["sample.csv"]
+
+
+@pytest.mark.parametrize("content, encoding, column_names", [
+    ("städt,n\nZürich,1\n".encode("utf-8"), "utf-8", ["städt", "n"]),
+    ("städt,n\nZürich,1\n".encode("utf-8-sig"), "utf-8-sig", ["städt", "n"]),
+    ("städt,n\n“Zürich”,1\n".encode("cp1252"), "cp1252", ["städt", "n"]),
+    (b"st\xe4dt,n\n\x81,1\n", "latin1", ["städt", "n"]),
+])
+def test_csv_scanner_detects_encoding(content, encoding, column_names):
+    scanner = CsvScanner()
+    # Split inside multi-byte characters as well.
+    for i in range(0, len(content), 3):
+        scanner.update(content[i:i + 3])
+    result = scanner.result()
+
+    assert result.encoding == encoding
+    assert result.column_names == column_names
+    assert result.row_count == 1
+
+
+@pytest.mark.parametrize("content, column_names", [
+    ("Preis €,n\n1,2\n".encode("cp1252"), ["Preis €", "n"]),
+    ("städt,n\n".encode("utf-8") + b"\xe4,1\n", ["stÃ¤dt", "n"]),
+    (b"price,n\n\xe4,1\n", ["price", "n"]),
+])
+def test_read_csv_header_matches_scanner(tmp_path, content, column_names):
+    path = tmp_path / "data.csv"
+    path.write_bytes(content)
+
+    assert read_csv_header(str(path), chunk_size=4) == column_names
+    scanner = CsvScanner()
+    scanner.update(content)
+    assert scanner.result().column_names == column_names
+
+
+def test_csv_ingestor_rejects_oversized_file(tmp_path):
+    destination = os.path.join(tmp_path, "sample.csv")
+    ingestor = CsvIngestor(destination, max_size=10)
+    ingestor.write(b"column1,\n")
+    with pytest.raises(UploadTooLargeError):
+        ingestor.write(b"value1,value2\n")
+    ingestor.abort()
+
+    assert os.listdir(tmp_path) == []
+
+
+def test_csv_ingestor_does_not_overwrite_existing_file(tmp_path):
+    destination = os.path.join(tmp_path, "sample.csv")
+    with open(destination, "wb") as f:
+        f.write(b"original\n")
+    ingestor = CsvIngestor(destination)
+    ingestor.write(b"column1\nvalue1\n")
+    with pytest.raises(DatasetExistsError):
+        ingestor.commit()
+    ingestor.abort()
+
+    with open(destination, "rb") as f:
+        assert f.read() == b"original\n"
+    assert os.listdir(tmp_path) == ["sample.csv"]
+
+
+@pytest.mark.parametrize("compression", ["gzip", "zstd"])
+def test_csv_ingestor_stores_compressed(tmp_path, compression):
+    content = b"name,count\n" + b"".join(b"row%d,%d\n" % (i % 10, i) for i in range(10000))
+    destination = os.path.join(tmp_path, "compressed.csv")
+    ingestor = CsvIngestor(destination, compression=compression)
+    for i in range(0, len(content), 4096):
+        ingestor.write(content[i:i + 4096])
+    result = ingestor.commit()
+
+    assert result.file_size == len(content)
+    assert result.row_count == 10000
+    assert result.stored_size == os.path.getsize(destination) < len(content) / 4
+    assert detect_compression(destination) == compression
+    with open_dataset_file(destination) as f:
+        assert pd.read_csv(f)["count"].sum() == sum(range(10000))
+
+    parquet_path = os.path.join(tmp_path, "compressed.parquet")
+    build_sidecar(destination, parquet_path)
+    assert pq.read_table(parquet_path).num_rows == 10000
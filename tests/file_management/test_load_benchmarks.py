@@ -0,0 +1,50 @@
+import hashlib
+
+import pandas as pd
+from httpx import AsyncClient
+
+from benchmarks.data import DatasetSpec, generate_csv
+from benchmarks.load import run_load
+from benchmarks.report import compare
+
+
+def test_generate_csv_is_deterministic(tmp_path):
+    spec = DatasetSpec(rows=1000, numeric_columns=2, string_columns=1, cardinality=10, seed=3)
+    sizes = [generate_csv(str(tmp_path / f"{i}.csv"), spec, chunk_rows=300) for i in range(2)]
+    digests = [hashlib.sha256((tmp_path / f"{i}.csv").read_bytes()).hexdigest() for i in range(2)]
+    assert sizes[0] == sizes[1] and digests[0] == digests[1]
+
+    df = pd.read_csv(tmp_path / "0.csv")
+    assert list(df.columns) == ["num_0", "num_1", "str_0"]
+    assert len(df) == 1000
+    assert df["str_0"].nunique() <= 10
+    assert df["num_0"].between(0, 9).all()
+
+
+def test_compare_flags_regressions_beyond_thresholds():
+    baseline = {"stages": {"sort": {"p50_ms": 100.0, "max_ms": 100.0, "rows_per_second": 1000.0}, "tiny": {"p50_ms": 0.1}}}
+    results = {"stages": {"sort": {"p50_ms": 130.0, "max_ms": 500.0, "rows_per_second": 700.0}, "tiny": {"p50_ms": 0.5}}}
+
+    regressions = compare(results, baseline, threshold=0.2)
+    assert [regression["metric"] for regression in regressions] == ["stages.sort.p50_ms", "stages.sort.rows_per_second"]
+    assert compare(results, baseline, threshold=0.2, thresholds={"stages.sort": 0.5}) == []
+    assert compare(baseline, baseline) == []
+
+
+async def test_load_harness_runs_against_the_app(ac: AsyncClient, tmp_path):
+    spec = DatasetSpec(rows=500, cardinality=20)
+    path = tmp_path / "load.csv"
+    generate_csv(str(path), spec)
+    response = await ac.post(
+        "/upload_file", params={"wait": True}, files={"file": ("benchmark-load.csv", path.read_bytes(), "text/csv")}
+    )
+    assert response.status_code == 201
+
+    result = await run_load(ac, "benchmark-load.csv", spec, concurrency=4, request_count=40)
+    assert result["requests"] == 40
+    assert result["errors"] == 0
+    assert set(result["operations"]) == {"page", "sort", "filter", "aggregate"}
+    assert result["latency"]["p50_ms"] <= result["latency"]["p99_ms"]
+
+    response = await ac.delete("/delete_file", params={"file_name": "benchmark-load.csv"})
+    assert response.status_code == 200
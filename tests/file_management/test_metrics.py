@@ -0,0 +1,27 @@
+from httpx import AsyncClient
+
+
+async def test_metrics_endpoint(ac: AsyncClient):
+    csv_content = b"region,amount\neast,1\nwest,2\neast,3\n"
+    response = await ac.post(
+        "/upload_file", params={"wait": True}, files={"file": ("metrics.csv", csv_content, "text/csv")}
+    )
+    assert response.status_code == 201
+    for _ in range(2):
+        response = await ac.post("/fetch_data", params={"file_name": "metrics.csv"}, json={"columns": ["amount"]})
+        assert response.status_code == 200
+
+    response = await ac.get("/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain")
+    text = response.text
+    assert 'http_request_duration_seconds_count{method="POST",route="/fetch_data",status="200"}' in text
+    assert 'stage_duration_seconds_count{operation="fetch_data",stage="db_lookup"}' in text
+    assert 'stage_duration_seconds_count{operation="ingest",stage="register"}' in text
+    assert 'rows_returned_total{operation="fetch_data"}' in text
+    assert "dataset_bytes_written_total" in text
+    assert 'cache_hit_ratio{cache="result"}' in text
+    assert "db_pool_checked_out" in text
+
+    response = await ac.delete("/delete_file", params={"file_name": "metrics.csv"})
+    assert response.status_code == 200
@@ -0,0 +1,49 @@
+import json
+import os
+
+from httpx import AsyncClient
+
+from src.main import app
+from src.profiling import ProfilingMiddleware
+
+
+async def test_profiled_requests_are_saved_with_retention(ac: AsyncClient, tmp_path):
+    csv_content = b"region,amount\neast,1\nwest,2\neast,3\n"
+    response = await ac.post(
+        "/upload_file", params={"wait": True}, files={"file": ("profiled.csv", csv_content, "text/csv")}
+    )
+    assert response.status_code == 201
+
+    profiled_app = ProfilingMiddleware(app, paths=["/aggregate_data"], token=None, directory=str(tmp_path), retention=2)
+    async with AsyncClient(app=profiled_app, base_url="http://test") as client:
+        aggregations = [{"function": "sum", "column": "amount"}]
+        response = await client.post("/aggregate_data", params={"file_name": "profiled.csv"}, json={"aggregations": aggregations})
+        assert response.status_code == 200
+        assert "x-profile-id" not in response.headers
+
+        profile_ids = []
+        for region in ("north", "east", "west"):
+            response = await client.post(
+                "/aggregate_data",
+                params={"file_name": "profiled.csv", "profile": "true"},
+                json={"aggregations": aggregations, "filter_by": ["region"], "filter_values": [region]},
+            )
+            assert response.status_code == 200
+            profile_ids.append(response.headers["x-profile-id"])
+
+    assert sorted(name for name in os.listdir(tmp_path) if name.endswith(".json")) == [
+        f"{profile_id}.json" for profile_id in sorted(profile_ids)[1:]
+    ]
+    with open(tmp_path / f"{profile_ids[-1]}.json") as f:
+        report = json.load(f)
+    assert report["status_code"] == 200
+    assert report["peak_memory_bytes"] >= 0
+    assert report["breakdown_ms"]["pandas"] > 0
+    # Database calls run on the event loop, which is shared with other requests and not profiled.
+    assert report["breakdown_ms"]["asyncpg"] == 0
+    assert set(report["breakdown_ms"]) == {"pandas", "starlette_json", "asyncpg", "application", "other"}
+    assert report["top_functions"]
+    assert os.path.exists(tmp_path / f"{profile_ids[-1]}.prof")
+
+    response = await ac.delete("/delete_file", params={"file_name": "profiled.csv"})
+    assert response.status_code == 200
@@ -0,0 +1,131 @@
+import pandas as pd
+import pytest
+
+from src.file_management.indexes import SortIndex, TrigramIndex
+from src.file_management.query import InvalidQueryError, execute_plan, plan_query
+
+
+def test_plan_query_projects_only_needed_columns():
+    plan = plan_query(["a", "b", "c", "d"], columns=["a"], sort_by=["b"], sort_orders=["desc"], filter_by=["c"], filter_values=["x"])
+    assert plan.read_columns == ["a", "b", "c"]
+    assert plan.output_columns == ["a"]
+    assert plan.ascending == [False]
+
+    with pytest.raises(InvalidQueryError, match="Invalid filter column name: e"):
+        plan_query(["a"], filter_by=["e"], filter_values=["x"])
+
+
+def test_execute_plan_filters_most_selective_first_then_sorts():
+    df = pd.DataFrame({
+        "kind": ["fruit", "fruit", "veg", "fruit", "veg"],
+        "name": ["apple", "pear", "cabbage", "avocado", "leek"],
+        "cost": [3, 1, 2, 5, 4],
+    })
+    plan = plan_query(list(df.columns), columns=["name"], sort_by=["cost"], sort_orders=["desc"],
+                      filter_by=["kind", "name"], filter_values=["fruit", "^a"], filter_regex=True)
+    result, stats = execute_plan(df, plan)
+
+    assert [predicate.column for predicate in plan.filters] == ["name", "kind"]
+    assert result.to_dict(orient="records") == [{"name": "avocado"}, {"name": "apple"}]
+    assert stats["rows_scanned"] == 5
+    assert stats["rows_matched"] == 2
+
+
+def test_trigram_index_candidates_are_a_superset_of_matches():
+    values = pd.Series(["apple pie", "banana", None, "pineapple", "grape"])
+    index = TrigramIndex.build(values)
+
+    assert index.candidates("apple").tolist() == [0, 3]
+    assert index.candidates("xyz").tolist() == []
+    assert index.candidates("ap") is None
+
+
+def test_trigram_index_extends_like_a_rebuild():
+    values = pd.Series(["apple pie", "banana", None, "pineapple", "grape", "nana", "apricot", None, "bandana"])
+    index = TrigramIndex.build(values[:5]).extend(values[5:])
+    rebuilt = TrigramIndex.build(values)
+
+    assert index.row_count == rebuilt.row_count == 9
+    assert index.keys.tolist() == rebuilt.keys.tolist()
+    assert index.offsets.tolist() == rebuilt.offsets.tolist()
+    assert index.postings.tolist() == rebuilt.postings.tolist()
+    assert index.candidates("nana").tolist() == [1, 5]
+
+
+@pytest.mark.parametrize("sort_by, sort_orders", [
+    (["name"], ["asc"]),
+    (["name"], ["desc"]),
+    (["name", "cost"], ["desc", "asc"]),
+    (["cost", "name"], ["asc", "desc"]),
+])
+def test_execute_plan_with_sort_index_matches_sort_values(tmp_path, sort_by, sort_orders):
+    df = pd.DataFrame({
+        "name": ["pear", None, "apple", "pear", "fig", "apple", None],
+        "cost": [3, 1, 2, 5, 4, 2, 7],
+    })
+    path = str(tmp_path / "sort.name")
+    SortIndex.build(df["name"]).save(path)
+
+    def run(sort_index_paths):
+        plan = plan_query(list(df.columns), sort_by=sort_by, sort_orders=sort_orders, filter_by=["name"],
+                          filter_values=["p"], sort_index_paths=sort_index_paths)
+        result, _ = execute_plan(df, plan)
+        return result, plan
+
+    expected, _ = run({})
+    result, plan = run({"name": path})
+    assert plan.sort_index_used
+    assert result.to_dict(orient="records") == expected.to_dict(orient="records")
+
+
+def test_where_expressions_over_typed_columns():
+    df = pd.DataFrame({
+        "city": pd.Categorical(["Oslo", "Rome", None, "Oslo", "Lima"], categories=["Lima", "Oslo", "Rome"], ordered=True),
+        "name": ["ant", "bee", "cat", None, "antelope"],
+        "price": [1.5, None, 3.0, 10.0, 7.25],
+        "day": pd.array(pd.to_datetime(["2023-01-01", "2023-02-01", None, "2023-03-01", "2023-01-15"]).date, dtype="date32[pyarrow]"),
+    })
+
+    def matches(where):
+        result, _ = execute_plan(df, plan_query(list(df.columns), where=where))
+        return result.index.tolist()
+
+    assert matches({"column": "price", "op": "between", "value": [2, 8]}) == [2, 4]
+    assert matches({"column": "price", "op": "ne", "value": 3}) == [0, 3, 4]
+    assert matches({"column": "city", "op": "in", "value": ["Oslo", "Paris"]}) == [0, 3]
+    assert matches({"column": "city", "op": "gte", "value": "Oslo"}) == [0, 1, 3]
+    assert matches({"column": "name", "op": "prefix", "value": "ant"}) == [0, 4]
+    assert matches({"column": "name", "op": "lt", "value": "bee"}) == [0, 4]
+    assert matches({"column": "day", "op": "gte", "value": "2023-01-15"}) == [1, 3, 4]
+    assert matches({"or": [
+        {"column": "city", "op": "is_null"},
+        {"and": [{"column": "price", "op": "gt", "value": 5}, {"column": "name", "op": "not_null"}]},
+    ]}) == [2, 4]
+
+    with pytest.raises(InvalidQueryError, match="must be a number"):
+        matches({"column": "price", "op": "eq", "value": "10"})
+    with pytest.raises(InvalidQueryError, match="must be a date"):
+        matches({"column": "day", "op": "lt", "value": "soon"})
+    with pytest.raises(InvalidQueryError, match="Invalid filter column name: size"):
+        matches({"and": [{"column": "size", "op": "eq", "value": 1}]})
+    with pytest.raises(InvalidQueryError, match="requires a \\[low, high\\] pair"):
+        matches({"column": "price", "op": "between", "value": [1]})
+
+
+def test_where_expressions_are_validated_and_pruned_with_column_stats():
+    column_stats = {
+        "cost": {"dtype": "int64", "count": 5, "null_count": 0, "min": 1, "max": 7},
+        "name": {"dtype": "string", "count": 4, "null_count": 1, "min": "apple", "max": "pear"},
+    }
+
+    plan = plan_query(["cost", "name"], column_stats=column_stats, where={"or": [
+        {"column": "cost", "op": "gt", "value": 7}, {"column": "name", "op": "eq", "value": "zucchini"},
+    ]})
+    assert plan.pruned_by is not None
+    plan = plan_query(["cost", "name"], column_stats=column_stats, where={"column": "cost", "op": "is_null"})
+    assert plan.pruned_by == "column 'cost' has no nulls"
+    plan = plan_query(["cost", "name"], column_stats=column_stats, where={"column": "cost", "op": "lte", "value": 1})
+    assert plan.pruned_by is None
+
+    with pytest.raises(InvalidQueryError, match="'prefix' requires a text column"):
+        plan_query(["cost", "name"], column_stats=column_stats, where={"column": "cost", "op": "prefix", "value": "1"})
@@ -0,0 +1,49 @@
+import numpy as np
+import pyarrow as pa
+
+from src.file_management.stats import ColumnProfiler, HyperLogLog
+
+
+def test_hyperloglog_estimates_and_merges():
+    first, second = HyperLogLog(), HyperLogLog()
+    first.add(np.arange(0, 60_000))
+    second.add(np.arange(40_000, 100_000))
+    assert abs(first.estimate() - 60_000) / 60_000 < 0.05
+
+    first.merge(second)
+    assert abs(first.estimate() - 100_000) / 100_000 < 0.05
+
+    small = HyperLogLog()
+    small.add(np.array(["a", "b", "c", "a"], dtype=object))
+    assert small.estimate() == 3
+
+
+def test_column_profiler_combines_batches():
+    profiler = ColumnProfiler()
+    profiler.update(pa.RecordBatch.from_pydict({"name": ["pear", None, "fig"], "cost": [3, 1, None]}))
+    profiler.update(pa.RecordBatch.from_pydict({"name": ["banana", "fig", None], "cost": [7, None, 2]}))
+
+    assert profiler.finish() == {
+        "name": {
+            "dtype": "string", "count": 4, "null_count": 2, "distinct_count": 3,
+            "min": "banana", "max": "pear", "max_length": 6,
+        },
+        "cost": {"dtype": "int64", "count": 4, "null_count": 2, "distinct_count": 4, "min": 1, "max": 7},
+    }
+
+
+def test_column_profiler_resumes_from_statistics_and_sketches():
+    first = pa.RecordBatch.from_pydict({"name": ["pear", None, "fig"], "cost": [3, 1, 4], "score": [0.5, 1.5, None]})
+    second = pa.RecordBatch.from_pydict({"name": ["banana", "fig", "kiwi"], "cost": [700, 2, 9], "score": [2.25, 0.1, 3.0]})
+    profiler = ColumnProfiler()
+    profiler.update(first)
+    sketches = {name: profile.sketch.registers for name, profile in profiler._profiles.items()}
+    assert profiler.read_schema() == {"cost": "int8", "score": "float32"}
+
+    resumed = ColumnProfiler.resume(first.schema, profiler.finish(), sketches, profiler.read_schema())
+    resumed.update(second)
+    full = ColumnProfiler()
+    full.update(first)
+    full.update(second)
+    assert resumed.finish() == full.finish()
+    assert resumed.read_schema() == full.read_schema() == {"cost": "int16"}
@@ -0,0 +1,27 @@
+import os
+
+from src.file_management.uploads import (
+    ChunkWriter, create_upload_session, remove_expired_upload_sessions, remove_upload_session
+)
+
+
+def test_upload_session_tracks_out_of_order_chunks():
+    upload = create_upload_session("ranges.csv", 10)
+    for offset, chunk in ((6, b"ghij"), (0, b"abc")):
+        writer = ChunkWriter(upload, offset)
+        writer.write(chunk)
+        writer.commit()
+        writer.close()
+
+    assert upload.received_ranges() == [(0, 3), (6, 10)]
+    assert upload.offset() == 3
+    remove_upload_session(upload)
+
+
+def test_expired_upload_sessions_are_removed():
+    expired = create_upload_session("expired.csv", 4, ttl=-1)
+    active = create_upload_session("active.csv", 4)
+
+    assert remove_expired_upload_sessions() == [expired.upload_id]
+    assert not os.path.exists(expired.directory)
+    assert os.path.exists(active.directory)